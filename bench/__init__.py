@@ -0,0 +1 @@
+"""Benchmarks for the Wybe Voice NO pipeline. Run each module with python -m bench.<name>."""
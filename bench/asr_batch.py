@@ -0,0 +1,99 @@
+"""Benchmark: batched Whisper across sessions that finish speaking together.
+
+Utterances of 1.5-4 s end at random (Poisson) times across many sessions and
+are transcribed with ASR.atranscribe on a stub Whisper. Without batching they
+queue for the model one by one. With batching, those ending within the batch
+window share one call to the batched pipeline. Reports utterances/s and the
+latency each utterance pays beyond its own decode time, per window size.
+
+Usage: python -m bench.asr_batch [--rate 12] [--seconds 10] [--windows 0 25 50 100] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from bench.stubs import StubBatchedWhisper, StubWhisper
+from server.models.asr import ASR
+from server.models.scheduler import ModelBusyError
+
+
+async def run(rate: float, seconds: float, window_ms: int | None, max_batch: int, seed: int) -> dict:
+    whisper = StubWhisper()
+    batched = StubBatchedWhisper(whisper)
+    unbatched = window_ms is None
+    asr = ASR(
+        model=whisper,
+        batched=batched,
+        batch_window_ms=window_ms or 0,
+        max_batch=1 if unbatched else max_batch,
+    )
+
+    rng = np.random.default_rng(seed)
+    added: list[float] = []
+    rejected = 0
+
+    async def utterance(duration: float):
+        nonlocal rejected
+        audio = np.zeros(int(duration * 16000), dtype=np.float32)
+        t0 = time.perf_counter()
+        try:
+            await asr.atranscribe(audio)
+        except ModelBusyError:
+            rejected += 1
+            return
+        own = whisper.base_s + duration * whisper.rtf
+        added.append(time.perf_counter() - t0 - own)
+
+    tasks = []
+    start = time.perf_counter()
+    t = 0.0
+    while (t := t + rng.exponential(1 / rate)) < seconds:
+        await asyncio.sleep(max(0.0, start + t - time.perf_counter()))
+        tasks.append(asyncio.create_task(utterance(rng.uniform(1.5, 4.0))))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+
+    added_ms = np.array(added) * 1000 if added else np.zeros(1)
+    return {
+        "mode": "unbatched" if unbatched else f"window {window_ms} ms",
+        "utterances_per_s": len(added) / wall,
+        "added_p50_ms": float(np.percentile(added_ms, 50)),
+        "added_p95_ms": float(np.percentile(added_ms, 95)),
+        "rejected": rejected,
+        "model_busy_s": whisper.busy_s + batched.busy_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=12.0, help="utterances ending per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 25, 50, 100, 200])
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(run(args.rate, args.seconds, window, args.max_batch, args.seed))
+        for window in [None, *args.windows]
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<14} {r['utterances_per_s']:5.1f} utt/s  "
+            f"added latency p50 {r['added_p50_ms']:7.1f} ms  p95 {r['added_p95_ms']:7.1f} ms  "
+            f"rejected {r['rejected']}  model busy {r['model_busy_s']:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: transcript latency after end of speech, batch vs streaming ASR.
+
+A simulated user speaks for --seconds, followed by the VAD's end-of-speech
+silence, arriving in real time in 32 ms chunks. Batch mode transcribes the
+whole utterance once speech ends. Streaming mode re-decodes the growing
+utterance every --interval-ms with IncrementalTranscript, and at the end
+only the uncommitted tail, if any. Reports the latency from endpoint to final
+text, and the model time spent.
+
+Usage: python -m bench.asr_streaming [--seconds 6] [--interval-ms 500] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from bench.stubs import StubWhisper
+from server.config import settings
+from server.models.asr import ASR
+
+CHUNK_S = 0.032
+TEXT = (
+    "Hei Wybe, jeg lurer på om du kan hjelpe meg med å finne et godt sted å gå tur "
+    "i nærheten av Bergen til helgen, helst med utsikt over fjorden"
+)
+
+
+async def speak(seconds: float, on_chunk) -> np.ndarray:
+    """Feed audio in real time; returns the complete utterance."""
+    chunks = []
+    n = int(seconds / CHUNK_S)
+    t0 = time.perf_counter()
+    for i in range(n):
+        chunks.append(np.zeros(int(CHUNK_S * 16000), dtype=np.float32))
+        on_chunk(chunks)
+        await asyncio.sleep(max(0.0, t0 + (i + 1) * CHUNK_S - time.perf_counter()))
+    return np.concatenate(chunks)
+
+
+async def run(mode: str, seconds: float, interval_s: float) -> dict:
+    whisper = StubWhisper(TEXT, word_s=seconds / len(TEXT.split()))
+    asr = ASR(model=whisper)
+    silence_s = settings.vad_min_silence_ms / 1000
+    audio_s = seconds + silence_s
+
+    transcript = asr.incremental()
+    partial: asyncio.Task | None = None
+    last = time.perf_counter()
+    partials = 0
+
+    def on_chunk(chunks):
+        nonlocal partial, last, partials
+        if mode != "streaming" or (partial is not None and not partial.done()):
+            return
+        if time.perf_counter() - last >= interval_s:
+            last = time.perf_counter()
+            partials += 1
+            partial = asyncio.create_task(transcript.update(np.concatenate(chunks)))
+
+    audio = await speak(audio_s, on_chunk)
+
+    t0 = time.perf_counter()
+    if mode == "streaming":
+        if partial is not None and not transcript.covers(audio, silence_s):
+            await asyncio.wait([partial])
+        text = await transcript.finish(audio, silence_s)
+    else:
+        text = await asr.atranscribe(audio)
+    latency = time.perf_counter() - t0
+
+    return {
+        "mode": mode,
+        "final_latency_ms": latency * 1000,
+        "partials": partials,
+        "model_busy_s": whisper.busy_s,
+        "words": len(text.split()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=6.0, help="speech duration")
+    parser.add_argument("--interval-ms", type=float, default=settings.asr_partial_interval_ms)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(mode, args.seconds, args.interval_ms / 1000)) for mode in ("batch", "streaming")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<10} final text {r['final_latency_ms']:6.1f} ms after endpoint  "
+            f"{r['words']} words  {r['partials']} partials  model busy {r['model_busy_s']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
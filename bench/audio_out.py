@@ -0,0 +1,86 @@
+"""Benchmark: bytes on the wire and encode CPU for AUDIO_OUT vs AUDIO_OUT_OPUS.
+
+Encodes --seconds of speech-like audio (a voiced harmonic series with a
+syllable-rate envelope and breath noise) the way ConversationSession sends
+a reply: TTS chunks of --chunk-ms, each turned into one message. Reports
+bytes per second of speech, messages sent, and encode CPU time per second
+of speech.
+
+Usage: python -m bench.audio_out [--seconds 30] [--chunk-ms 500] [--json]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from server.audio import OpusFrameEncoder, pcm_f32_to_s16le
+from server.config import settings
+from server.protocol import audio_out_msg, audio_out_opus_msg
+
+
+def speech_like(seconds: float, sr: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    pitch = 120 + 20 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 20))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    audio = 0.15 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def run(fmt: str, audio: np.ndarray, sr: int, chunk: int) -> dict:
+    encoder = OpusFrameEncoder(sr, settings.opus_out_bitrate) if fmt == "opus" else None
+    sent = messages = 0
+    t0 = time.process_time()
+    for start in range(0, len(audio), chunk):
+        samples = audio[start : start + chunk]
+        if encoder is None:
+            msg = audio_out_msg(pcm_f32_to_s16le(samples))
+        elif packets := encoder.encode(samples):
+            msg = audio_out_opus_msg(packets)
+        else:
+            continue
+        sent += len(msg)
+        messages += 1
+    if encoder is not None and (packets := encoder.flush()):
+        sent += len(audio_out_opus_msg(packets))
+        messages += 1
+    cpu = time.process_time() - t0
+
+    seconds = len(audio) / sr
+    return {
+        "format": fmt,
+        "kbytes_per_s": sent / seconds / 1000,
+        "messages": messages,
+        "encode_cpu_ms_per_s": cpu / seconds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--chunk-ms", type=float, default=500.0, help="TTS chunk length")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    sr = settings.tts_sample_rate
+    audio = speech_like(args.seconds, sr)
+    chunk = int(args.chunk_ms * sr / 1000)
+    results = [run(fmt, audio, sr, chunk) for fmt in ("pcm_s16le", "opus")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['format']:<10} {r['kbytes_per_s']:6.1f} KB/s  {r['messages']} messages  "
+            f"encode {r['encode_cpu_ms_per_s']:5.2f} ms CPU per second of speech"
+        )
+
+
+if __name__ == "__main__":
+    main()
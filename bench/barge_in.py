@@ -0,0 +1,98 @@
+"""Benchmark: model time saved when the user barges in on a reply.
+
+Runs the same long reply twice against the stub models: once to completion,
+once interrupted a fixed time after the first audio frame, the way a
+speech_start from VAD would. The stubs' busy_s counters give the LLM and TTS
+compute each run consumed; the difference is what barge-in saved.
+
+Usage: python -m bench.barge_in [--interrupt-after-ms 1000] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from bench.stubs import StubChatterbox, StubLlama, install_stub_models
+from server.metrics import TurnTrace
+from server.pipeline import ConversationSession
+from server.protocol import MsgType
+
+LONG_REPLY = (
+    "Oslo er hovedstaden i Norge. Byen ligger innerst i Oslofjorden. "
+    "Det bor omtrent syv hundred tusen mennesker der. "
+    "Om sommeren er det populært å bade ved Sørenga og Huk. "
+    "Om vinteren kan du gå på ski i Nordmarka. "
+    "Vil du vite mer om noe spesielt?"
+)
+UTTERANCE = np.zeros(16000 * 2, dtype=np.float32)
+
+
+async def run(interrupt_after: float | None, llm: StubLlama, tts: StubChatterbox) -> dict:
+    first_audio = asyncio.Event()
+
+    async def send(data: bytes):
+        if data[0] == MsgType.AUDIO_OUT:
+            first_audio.set()
+
+    session = ConversationSession(send_fn=send)
+    busy0 = llm.busy_s + tts.busy_s
+    t0 = time.perf_counter()
+
+    session._trace = TurnTrace()
+    session._turn = asyncio.create_task(session._run_turn(UTTERANCE))
+    if interrupt_after is None:
+        await session._turn
+        spoken = session.history.messages[-1]["content"]
+    else:
+        await first_audio.wait()
+        await asyncio.sleep(interrupt_after)
+        await session._interrupt()
+        spoken = session.history.messages[-1]["content"] if session.history.messages[-1]["role"] == "assistant" else ""
+    await session.close()
+
+    return {
+        "interrupted": interrupt_after is not None,
+        "wall_s": time.perf_counter() - t0,
+        "model_busy_s": llm.busy_s + tts.busy_s - busy0,
+        "spoken_chars": len(spoken),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interrupt-after-ms", type=float, default=1000.0)
+    parser.add_argument("--token-ms", type=float, default=25.0)
+    parser.add_argument("--tts-rtf", type=float, default=0.3)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    llm = StubLlama(reply=LONG_REPLY, token_s=args.token_ms / 1000)
+    tts = StubChatterbox(rtf=args.tts_rtf)
+    install_stub_models(llm=llm, tts=tts)
+
+    full = asyncio.run(run(None, llm, tts))
+    cut = asyncio.run(run(args.interrupt_after_ms / 1000, llm, tts))
+    result = {
+        "full": full,
+        "interrupted": cut,
+        "model_seconds_saved": full["model_busy_s"] - cut["model_busy_s"],
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    for r in (full, cut):
+        label = "interrupted" if r["interrupted"] else "full"
+        print(
+            f"{label:<12} model busy {r['model_busy_s']:5.2f}s  "
+            f"wall {r['wall_s']:5.2f}s  reply kept {r['spoken_chars']} chars"
+        )
+    print(f"model seconds saved per interrupted turn: {result['model_seconds_saved']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
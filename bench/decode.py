@@ -0,0 +1,131 @@
+"""Benchmark: per-chunk ffmpeg spawn vs. persistent streaming Opus decoder.
+
+Synthesizes a WebM/Opus recording with ffmpeg, then replays it the way
+MediaRecorder.start(200) delivers it:
+
+  baseline   one standalone WebM file per 200 ms, decoded with decode_webm_opus
+  stream     one continuous WebM sliced into 200 ms byte chunks, fed to
+             StreamingOpusDecoder (one per simulated session)
+
+Usage: python -m bench.decode [--seconds 10] [--sessions 8] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from server.audio import StreamingOpusDecoder, decode_webm_opus
+
+CHUNK_S = 0.2
+
+
+def make_fixture(workdir: Path, seconds: float) -> tuple[bytes, list[bytes]]:
+    """Return (continuous WebM bytes, list of standalone 200 ms WebM files)."""
+    src = ["-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}"]
+    enc = ["-ac", "1", "-ar", "48000", "-c:a", "libopus", "-b:a", "32k"]
+
+    stream_path = workdir / "stream.webm"
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-y", *src, *enc, "-f", "webm", str(stream_path)],
+        check=True,
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error", "-y", *src, *enc,
+            "-f", "segment", "-segment_time", str(CHUNK_S), "-segment_format", "webm",
+            str(workdir / "seg%04d.webm"),
+        ],
+        check=True,
+    )
+    segments = [p.read_bytes() for p in sorted(workdir.glob("seg*.webm"))]
+    return stream_path.read_bytes(), segments
+
+
+def slice_stream(data: bytes, n_chunks: int) -> list[bytes]:
+    step = -(-len(data) // n_chunks)
+    return [data[i : i + step] for i in range(0, len(data), step)]
+
+
+def summarize(name: str, latencies: list[float], wall: float, samples: int) -> dict:
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "path": name,
+        "chunks": len(latencies),
+        "chunks_per_s": len(latencies) / wall,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+        "decoded_s": samples / 16000,
+    }
+
+
+def bench_baseline(segments: list[bytes], sessions: int) -> dict:
+    # The current path is synchronous on the event loop, so sessions serialize.
+    latencies, samples = [], 0
+    t0 = time.perf_counter()
+    for _ in range(sessions):
+        for seg in segments:
+            t = time.perf_counter()
+            samples += len(decode_webm_opus(seg))
+            latencies.append(time.perf_counter() - t)
+    return summarize("baseline", latencies, time.perf_counter() - t0, samples)
+
+
+async def bench_stream(chunks: list[bytes], sessions: int) -> dict:
+    latencies: list[float] = []
+    samples = 0
+
+    async def run_session():
+        nonlocal samples
+        decoder = StreamingOpusDecoder()
+        try:
+            for chunk in chunks:
+                t = time.perf_counter()
+                pcm = await decoder.decode(chunk)
+                latencies.append(time.perf_counter() - t)
+                samples += len(pcm)
+            pcm = await decoder.flush()
+            samples += len(pcm)
+        finally:
+            await decoder.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(run_session() for _ in range(sessions)))
+    return summarize("stream", latencies, time.perf_counter() - t0, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="audio length per session")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream, segments = make_fixture(Path(tmp), args.seconds)
+
+    results = [
+        bench_baseline(segments, args.sessions),
+        asyncio.run(bench_stream(slice_stream(stream, len(segments)), args.sessions)),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.sessions} sessions x {args.seconds:.0f}s audio, {CHUNK_S * 1000:.0f} ms chunks")
+    for r in results:
+        print(
+            f"  {r['path']:<9} {r['chunks_per_s']:8.1f} chunks/s  "
+            f"p50 {r['p50_ms']:6.1f} ms  p99 {r['p99_ms']:6.1f} ms  "
+            f"({r['decoded_s']:.1f}s decoded)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark: aggregate LLM throughput with concurrent conversations.
+
+N sessions each request a reply at the same time, either taking turns on the
+model (llm_parallel_sequences=1) or decoded together by continuous batching
+(llm_parallel_sequences=N). Reports aggregate tokens/s and the mean time to
+first token across sessions.
+
+Needs a real GGUF. For CPU runs, a tiny random-weight model works:
+    python -m bench.tiny_gguf vendor/llama.cpp/models/ggml-vocab-llama-spm.gguf /tmp/tiny.gguf
+
+Usage: python -m bench.llm_batch --gguf /tmp/tiny.gguf [--sessions 1 2 4 8] [--tokens 64] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from llama_cpp import Llama
+
+from server.config import settings
+from server.models.llm import LLM
+
+
+def history(i: int) -> list[dict[str, str]]:
+    return [
+        {"role": "system", "content": settings.system_prompt},
+        {"role": "user", "content": f"Hei! Kan du fortelle meg noe om fjord nummer {i}?"},
+    ]
+
+
+async def session(llm: LLM, i: int, t0: float) -> tuple[int, float]:
+    n = 0
+    first = 0.0
+    async for _ in llm.agenerate_stream(history(i), session=i):
+        if n == 0:
+            first = time.perf_counter() - t0
+        n += 1
+    return n, first
+
+
+async def run(llm: LLM, sessions: int) -> tuple[int, float, float]:
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(session(llm, i, t0) for i in range(sessions)))
+    wall = time.perf_counter() - t0
+    tokens = sum(n for n, _ in results)
+    return tokens, wall, sum(f for _, f in results) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gguf", required=True, help="path to a GGUF model")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tokens", type=int, default=64, help="max tokens per reply")
+    parser.add_argument("--ctx", type=int, default=1024, help="context tokens per session")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings.llm_max_tokens = args.tokens
+    settings.llm_context_length = args.ctx
+    model = Llama(
+        model_path=args.gguf,
+        n_ctx=settings.llm_context_length,
+        n_threads=args.threads,
+        verbose=False,
+    )
+    sequential = LLM(model=model, parallel_sequences=1)
+
+    results = []
+    for n in args.sessions:
+        batched = LLM(model=model, parallel_sequences=n) if n > 1 else sequential
+        for mode, llm in (("sequential", sequential), ("batched", batched)):
+            tokens, wall, ttft = asyncio.run(run(llm, n))
+            results.append(
+                {
+                    "mode": mode,
+                    "sessions": n,
+                    "tokens": tokens,
+                    "tokens_per_s": tokens / wall,
+                    "ttft_mean_ms": ttft * 1000,
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<10} {r['sessions']} sessions  {r['tokens']:>4} tokens  "
+            f"{r['tokens_per_s']:7.1f} tok/s  mean first token {r['ttft_mean_ms']:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark: time to first token as a conversation's history grows.
+
+One conversation runs for several turns through the batched LLM, either with a
+session key (KV state reused across turns, only the new turn is prefilled) or
+without one (the whole history is prefilled every turn, as before). Reports
+first-token latency and reused prompt tokens per turn.
+
+Usage: python -m bench.llm_kv_reuse --gguf /tmp/tiny.gguf [--turns 8] [--json]
+(see bench.llm_batch for building a tiny CPU model)
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from llama_cpp import Llama
+
+from server.config import settings
+from server.models.llm import LLM
+
+USER_TURN = "Det var interessant. Kan du fortelle litt mer om det, og gjerne gi et eksempel fra Norge?"
+
+
+async def conversation(llm: LLM, turns: int, session) -> list[dict]:
+    history = [{"role": "system", "content": settings.system_prompt}]
+    results = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": USER_TURN})
+        before = llm.scheduler.stats()
+        t0 = time.perf_counter()
+        ttft = 0.0
+        reply = []
+        async for token in llm.agenerate_stream(history, session=session):
+            if not reply:
+                ttft = time.perf_counter() - t0
+            reply.append(token)
+        after = llm.scheduler.stats()
+        history.append({"role": "assistant", "content": "".join(reply)})
+        results.append(
+            {
+                "turn": turn,
+                "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+                "reused_tokens": after["prompt_tokens_reused"] - before["prompt_tokens_reused"],
+                "ttft_ms": ttft * 1000,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gguf", required=True, help="path to a GGUF model")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=96, help="max tokens per reply")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings.llm_max_tokens = args.tokens
+    model = Llama(
+        model_path=args.gguf,
+        n_ctx=settings.llm_context_length,
+        n_threads=args.threads,
+        verbose=False,
+    )
+    llm = LLM(model=model, parallel_sequences=2)
+    results = {
+        "full_prefill": asyncio.run(conversation(llm, args.turns, None)),
+        "kv_reuse": asyncio.run(conversation(llm, args.turns, "bench")),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for mode, turns in results.items():
+        print(mode)
+        for r in turns:
+            print(
+                f"  turn {r['turn']}  prompt {r['prompt_tokens']:>5}  reused {r['reused_tokens']:>5}  "
+                f"first token {r['ttft_ms']:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
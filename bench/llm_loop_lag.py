@@ -0,0 +1,87 @@
+"""Benchmark: event-loop lag while an LLM reply is being generated.
+
+A probe coroutine sleeps 10 ms in a loop and records how late it wakes up,
+standing in for every other WebSocket on the worker. Meanwhile one session
+streams a long reply from a stub llama.cpp model, either by iterating
+LLM.generate_stream on the event loop (the old path) or through
+LLM.agenerate_stream.
+
+Usage: python -m bench.llm_loop_lag [--tokens 200] [--token-ms 20] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from bench.stubs import StubLlama
+from server.models.llm import LLM
+
+PROBE_INTERVAL_S = 0.01
+HISTORY = [{"role": "user", "content": "Fortell en lang historie."}]
+
+
+async def probe(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL_S)
+        lags.append(time.perf_counter() - t - PROBE_INTERVAL_S)
+
+
+async def run(llm: LLM, mode: str) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0)
+
+    t0 = time.perf_counter()
+    n = 0
+    if mode == "sync":
+        for _ in llm.generate_stream(HISTORY):
+            n += 1
+            await asyncio.sleep(0)  # the old loop awaited send() per token
+    else:
+        async for _ in llm.agenerate_stream(HISTORY):
+            n += 1
+    wall = time.perf_counter() - t0
+
+    stop.set()
+    await prober
+    lag_ms = np.array(lags) * 1000
+    return {
+        "mode": mode,
+        "tokens": n,
+        "tokens_per_s": n / wall,
+        "lag_p50_ms": float(np.percentile(lag_ms, 50)),
+        "lag_p99_ms": float(np.percentile(lag_ms, 99)),
+        "lag_max_ms": float(lag_ms.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=20.0, help="stub decode time per token")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    reply = " ".join(f"ord{i}" for i in range(args.tokens))
+    llm = LLM(model=StubLlama(reply, prefill_s=0.2, token_s=args.token_ms / 1000), parallel_sequences=1)
+    results = [asyncio.run(run(llm, mode)) for mode in ("sync", "async")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<6} {r['tokens']} tokens at {r['tokens_per_s']:.0f}/s  "
+            f"loop lag p50 {r['lag_p50_ms']:.1f} ms  p99 {r['lag_p99_ms']:.1f} ms  "
+            f"max {r['lag_max_ms']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""Load test: concurrent clients over /ws/conversation, end to end.
+
+Starts the server in a child process with the stub models of bench/stubs.py
+(--backend stub, runs on any Linux box; latencies from the --*-ms flags) or
+the real models (--backend real, needs the GPU stack). For each --sessions
+level, that many clients connect at staggered times. Each streams one
+continuous WebM/Opus recording at real-time pace in 200 ms chunks, as
+MediaRecorder.start(200) does: --turns utterances, each followed by --gap-s
+of silence while the reply plays. Utterances come from the 16 kHz mono WAV
+recordings in --corpus (needed with real models, whose VAD wants real
+speech) or the built-in synthetic corpus, dealt to clients in a seeded
+order, so runs with the same flags replay the same audio.
+
+Per level it reports:
+- time-to-first-audio percentiles: the chunk that ends the speech is sent,
+  then the first reply audio arrives
+- turns answered, and busy/error messages
+- the server's event-loop lag (the worst worker's, with --workers)
+- CPU and RSS per session of the server processes and their ffmpeg decoders
+
+A level is sustained when every turn was answered and p95 time-to-first-audio
+is within --slo-ms; sessions_sustained is the largest such level. --json
+prints the results with the flags and commit, for comparing runs over time.
+Clients run in this process; the server gets its own. With --workers N > 1,
+the models run in a model server process and N WebSocket workers share the
+port (SO_REUSEPORT), as `python -m server` deploys them with WORKERS=N.
+
+Usage: python -m bench.load [--backend stub|real] [--sessions 1 8 32] [--workers N]
+       [--corpus DIR] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+from bench.speculative import CORPUS, load_corpus, synthesize
+from server.protocol import MsgType
+
+SR = 16000
+CHUNK_S = 0.2
+LAG_INTERVAL_S = 0.05
+PAGE_BYTES = os.sysconf("SC_PAGE_SIZE")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def install_stubs(args: argparse.Namespace):
+    from bench.stubs import StubChatterbox, StubLlama, StubWhisper, install_stub_models
+    from server.config import settings
+
+    settings.tts_cache_mb = 0  # the stub LLM gives every turn the same reply
+    install_stub_models(
+        asr=StubWhisper(base_s=args.asr_ms / 1000),
+        llm=StubLlama(prefill_s=args.prefill_ms / 1000, token_s=args.token_ms / 1000),
+        tts=StubChatterbox(first_chunk_s=args.tts_first_chunk_ms / 1000, rtf=args.tts_rtf),
+    )
+
+
+def serve_models(path: str, args: argparse.Namespace):
+    """Model server process, for --workers > 1."""
+    from server import model_server
+
+    if args.backend == "stub":
+        install_stubs(args)
+    asyncio.run(model_server.serve(path))
+
+
+def bind(port: int, shared: bool = False) -> socket.socket:
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if shared:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("127.0.0.1", port))
+    return sock
+
+
+def serve(
+    port: int, probe_port: int, args: argparse.Namespace, model_socket: str | None = None
+):
+    """Server or worker process: the app on loopback, plus an event-loop lag probe.
+
+    The app listens on port, shared by all workers, and on probe_port, this
+    process's own. Models are in-process, or behind model_socket.
+    """
+    import uvicorn
+
+    from server.app import app
+    from server.config import settings
+    from server.models.manager import models
+
+    tokenizer = None
+    if model_socket is None:
+        if args.backend == "stub":
+            install_stubs(args)
+    else:
+        settings.model_server_socket = model_socket
+        if args.backend == "stub":
+            from bench.stubs import StubLlama, stub_vad
+
+            models.vad = stub_vad()
+            tokenizer = StubLlama()
+
+    lags: list[float] = []
+    probe: list[asyncio.Task] = []
+
+    async def sample_lag():
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL_S)
+            lags.append(time.perf_counter() - t - LAG_INTERVAL_S)
+
+    @app.on_event("startup")
+    async def start_probe():
+        probe.append(asyncio.create_task(sample_lag()))
+
+    @app.get("/bench/loop_lag")
+    async def loop_lag():
+        """Event-loop lag since the last call."""
+        ms = np.array(lags) * 1000 if lags else np.zeros(1)
+        lags.clear()
+        return {
+            "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1),
+            "max_ms": round(float(ms.max()), 1),
+        }
+
+    async def run():
+        if tokenizer is not None:
+            await models.connect(model_socket, tokenizer=tokenizer)
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        await server.serve(sockets=[bind(port, shared=True), bind(probe_port)])
+
+    asyncio.run(run())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url: str) -> tuple[int, dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def wait_ready(probes: list[str], processes: list[multiprocessing.Process], timeout_s: float):
+    """Wait until every worker reports healthy."""
+    deadline = time.monotonic() + timeout_s
+    pending = list(probes)
+    while time.monotonic() < deadline:
+        if not all(p.is_alive() for p in processes):
+            raise SystemExit("server exited during startup")
+        try:
+            status, health = get_json(f"{pending[0]}/health")
+        except OSError:
+            status, health = None, {}
+        if status == 200:
+            pending.pop(0)
+            if not pending:
+                return
+            continue
+        if health.get("status") == "error":
+            raise SystemExit(f"server failed to start: {health.get('models')}")
+        time.sleep(0.5)
+    raise SystemExit(f"server not ready after {timeout_s:.0f}s")
+
+
+def process_usage(pids: set[int]) -> tuple[float, int]:
+    """CPU seconds and RSS bytes of processes and their children (the ffmpeg decoders)."""
+    cpu_s, rss = 0.0, 0
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # exited meanwhile
+        if int(stat.parent.name) not in pids and int(fields[1]) not in pids:
+            continue
+        # utime, stime, cutime, cstime: reaped children's time moves to the parent.
+        cpu_s += sum(int(f) for f in fields[11:15]) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_BYTES
+    return cpu_s, rss
+
+
+def encode_webm(audio: np.ndarray) -> bytes:
+    # Constant bitrate, so equal byte slices carry equal stretches of audio.
+    result = subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(SR), "-ac", "1", "-i", "pipe:0",
+            "-ar", "48000", "-c:a", "libopus", "-b:a", "32k", "-vbr", "off",
+            "-f", "webm", "pipe:1",
+        ],
+        input=audio.tobytes(),
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def recording(
+    corpus, turns: int, gap_s: float, rng: random.Random
+) -> tuple[list[bytes], list[float]]:
+    """One client's WebM chunks, and the offsets (s) at which each utterance's speech ends."""
+    lead = np.zeros(int(2 * CHUNK_S * SR), dtype=np.float32)
+    parts, ends = [lead], []
+    t = len(lead) / SR
+    for _ in range(turns):
+        audio, speech_end = corpus[rng.randrange(len(corpus))]
+        ends.append(t + speech_end)
+        parts += [audio, np.zeros(int(gap_s * SR), dtype=np.float32)]
+        t += len(audio) / SR + gap_s
+    data = encode_webm(np.concatenate(parts))
+    n = math.ceil(t / CHUNK_S)
+    step = -(-len(data) // n)
+    return [data[i : i + step] for i in range(0, len(data), step)], ends
+
+
+async def client(url: str, chunks: list[bytes], ends: list[float], delay: float) -> dict:
+    """Stream one recording; time-to-first-audio of each utterance, None if unanswered."""
+    await asyncio.sleep(delay)
+    audio_at: list[float] = []
+    statuses: list[str] = []
+    errors = 0
+
+    async with websockets.connect(url, max_size=None) as ws:
+
+        async def receive():
+            nonlocal errors
+            async for msg in ws:
+                if msg[0] in (MsgType.AUDIO_OUT, MsgType.AUDIO_OUT_OPUS):
+                    audio_at.append(time.perf_counter())
+                elif msg[0] == MsgType.STATUS:
+                    statuses.append(json.loads(msg[1:])["status"])
+                elif msg[0] == MsgType.ERROR:
+                    errors += 1
+
+        receiver = asyncio.create_task(receive())
+        handshake = json.dumps({"input_format": "webm", "output_format": "pcm_s16le"})
+        await ws.send(bytes((MsgType.HANDSHAKE,)) + handshake.encode())
+        t0 = time.perf_counter()
+        sent_at = []
+        for i, chunk in enumerate(chunks):
+            # A chunk goes out once its 200 ms have been recorded.
+            await asyncio.sleep(max(0.0, t0 + (i + 1) * CHUNK_S - time.perf_counter()))
+            await ws.send(bytes((MsgType.AUDIO_IN,)) + chunk)
+            sent_at.append(time.perf_counter())
+        receiver.cancel()
+
+    # Each utterance is answered by the first audio after the chunk ending its speech.
+    speech_done = [sent_at[min(int(e / CHUNK_S), len(sent_at) - 1)] for e in ends]
+    ttfa = []
+    for k, start in enumerate(speech_done):
+        stop = speech_done[k + 1] if k + 1 < len(speech_done) else math.inf
+        first = next((t for t in audio_at if start < t < stop), None)
+        ttfa.append(None if first is None else first - start)
+    return {"ttfa": ttfa, "busy": statuses.count("busy"), "errors": errors}
+
+
+def loop_lag(probes: list[str]) -> dict:
+    """Event-loop lag of the worst worker since the last call."""
+    lags = [get_json(f"{probe}/bench/loop_lag")[1] for probe in probes]
+    return {key: max(lag[key] for lag in lags) for key in lags[0]}
+
+
+async def run_level(
+    base: str, probes: list[str], pids: set[int], recordings, sessions: int, args
+) -> dict:
+    url = base.replace("http", "ws", 1) + "/ws/conversation"
+    await asyncio.to_thread(loop_lag, probes)  # reset
+    cpu0, rss0 = process_usage(pids)
+    peak = rss0
+
+    async def sample_rss():
+        nonlocal peak
+        while True:
+            await asyncio.sleep(0.5)
+            peak = max(peak, process_usage(pids)[1])
+
+    sampler = asyncio.create_task(sample_rss())
+    rng = random.Random(args.seed)
+    delays = [rng.uniform(0, args.ramp_s) for _ in range(sessions)]
+    t0 = time.perf_counter()
+    results = await asyncio.gather(
+        *(client(url, *recordings[i], delays[i]) for i in range(sessions)),
+        return_exceptions=True,
+    )
+    wall = time.perf_counter() - t0
+    sampler.cancel()
+    cpu1, _ = process_usage(pids)
+    lag = await asyncio.to_thread(loop_lag, probes)
+
+    done = [r for r in results if isinstance(r, dict)]
+    ttfa = [t for r in done for t in r["ttfa"]]
+    answered = [t for t in ttfa if t is not None]
+    ms = np.array(answered) * 1000 if answered else np.full(1, np.nan)
+    level = {
+        "sessions": sessions,
+        "connect_failures": len(results) - len(done),
+        "turns": sessions * args.turns,
+        "answered": len(answered),
+        "busy": sum(r["busy"] for r in done),
+        "errors": sum(r["errors"] for r in done),
+        "ttfa_p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "ttfa_p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "ttfa_p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "loop_lag_p50_ms": lag["p50_ms"],
+        "loop_lag_p99_ms": lag["p99_ms"],
+        "loop_lag_max_ms": lag["max_ms"],
+        "cpu_pct_per_session": round((cpu1 - cpu0) / wall / sessions * 100, 2),
+        "rss_mb_per_session": round((peak - rss0) / sessions / 2**20, 2),
+    }
+    level["sustained"] = bool(
+        level["answered"] == level["turns"] and level["ttfa_p95_ms"] <= args.slo_ms
+    )
+    return level
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("stub", "real"), default="stub")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--workers", type=int, default=1, help="WebSocket workers around a model server"
+    )
+    parser.add_argument("--turns", type=int, default=3, help="utterances per client")
+    parser.add_argument("--gap-s", type=float, default=10.0, help="silence after each utterance")
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="clients connect over this long")
+    parser.add_argument("--corpus", help="directory of 16 kHz mono WAV recordings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slo-ms", type=float, default=1500.0, help="p95 time-to-first-audio goal")
+    parser.add_argument("--startup-timeout-s", type=float, default=900.0)
+    parser.add_argument("--asr-ms", type=float, default=100.0, help="stub ASR base latency")
+    parser.add_argument("--prefill-ms", type=float, default=50.0, help="stub LLM prefill")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="stub LLM time per token")
+    parser.add_argument("--tts-first-chunk-ms", type=float, default=150.0)
+    parser.add_argument(
+        "--tts-rtf", type=float, default=0.3, help="stub synthesis time per second of audio"
+    )
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else [synthesize(u) for u in CORPUS]
+    rng = random.Random(args.seed)
+    recordings = [
+        recording(corpus, args.turns, args.gap_s, rng) for _ in range(max(args.sessions))
+    ]
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    processes, probes = [], []
+    model_socket = None
+    if args.workers > 1:
+        model_socket = os.path.join(tempfile.gettempdir(), f"bench-models-{os.getpid()}.sock")
+        processes.append(
+            multiprocessing.Process(target=serve_models, args=(model_socket, args), daemon=True)
+        )
+    for _ in range(args.workers):
+        probe_port = free_port()
+        probes.append(f"http://127.0.0.1:{probe_port}")
+        processes.append(
+            multiprocessing.Process(
+                target=serve, args=(port, probe_port, args, model_socket), daemon=True
+            )
+        )
+    for process in processes:
+        process.start()
+    pids = {process.pid for process in processes}
+    try:
+        wait_ready(probes, processes, args.startup_timeout_s)
+        levels = [
+            asyncio.run(run_level(base, probes, pids, recordings, n, args))
+            for n in args.sessions
+        ]
+    finally:
+        # Workers first, so they disconnect from a model server still running.
+        for process in reversed(processes):
+            process.terminate()
+            process.join()
+
+    sustained = [lv["sessions"] for lv in levels if lv["sustained"]]
+    summary = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "config": vars(args),
+        "levels": levels,
+        "sessions_sustained": max(sustained, default=0),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(
+        "sessions  answered  busy  ttfa p50/p95/p99 ms      loop lag p99  "
+        "CPU/session  RSS/session"
+    )
+    for lv in levels:
+        print(
+            f"{lv['sessions']:>8}  {lv['answered']:>4}/{lv['turns']:<4} {lv['busy']:>4}  "
+            f"{lv['ttfa_p50_ms']:6.0f} {lv['ttfa_p95_ms']:6.0f} {lv['ttfa_p99_ms']:6.0f}   "
+            f"{lv['loop_lag_p99_ms']:9.1f} ms  {lv['cpu_pct_per_session']:9.2f} %  "
+            f"{lv['rss_mb_per_session']:8.2f} MB{'' if lv['sustained'] else '  (not sustained)'}"
+        )
+    print(f"sessions sustained (p95 ≤ {args.slo_ms:.0f} ms): {summary['sessions_sustained']}")
+
+
+if __name__ == "__main__":
+    main()
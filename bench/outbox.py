@@ -0,0 +1,194 @@
+"""Benchmark: server memory and dropped clients on slow and dead links.
+
+--sessions clients, in a separate process, each receive --turns replies of
+--reply-s seconds of 24 kHz PCM, produced --speedup times faster than real
+time as a fast TTS does. A --slow share of the clients read at --slow-kbps,
+below the audio bitrate, and a --dead share stop reading once connected;
+socket buffers are kept small so a stalled link shows within seconds.
+Compares the outbox without pacing, byte budget or send timeout (how audio
+was sent before) with the settings' audio_lead_ms, outbox_max_kb and
+send_timeout_ms. Reports the output queued in the server at its peak (in
+total and for the worst session), server RSS growth, clients dropped, and
+for the healthy clients the audio buffered ahead of playback (what a
+barge-in throws away) and reply time.
+
+Usage: python -m bench.outbox [--sessions 200] [--slow 0.1] [--dead 0.05] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+
+import numpy as np
+import websockets
+
+from bench.stubs import StubChatterbox
+from server.audio import pcm_f32_to_s16le
+from server.config import settings
+from server.outbox import Outbox, outbox_stats
+from server.protocol import audio_out_msg
+
+SR = StubChatterbox.sr
+CHUNK_S = 0.2
+SENTENCE_S = 2.0
+SOCKET_BUFFER = 64 * 1024
+PAGE_BYTES = os.sysconf("SC_PAGE_SIZE")
+MODES = {
+    "unpaced": {},
+    "paced": {
+        "audio_lead_ms": settings.audio_lead_ms,
+        "max_bytes": settings.outbox_max_kb * 1024,
+        "send_timeout_ms": settings.send_timeout_ms,
+    },
+}
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_BYTES
+
+
+def clients(port: int, kinds: list[str], slow_kbps: float):
+    async def client(kind: str):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+        sock.connect(("127.0.0.1", port))
+        async with websockets.connect(
+            f"ws://127.0.0.1:{port}", sock=sock, compression=None, max_size=None, max_queue=1
+        ) as ws:
+            await ws.send(kind)
+            if kind == "dead":
+                await asyncio.Future()
+            async for msg in ws:
+                if kind == "slow":
+                    await asyncio.sleep(len(msg) * 8 / (slow_kbps * 1000))
+
+    async def main():
+        await asyncio.gather(*(client(kind) for kind in kinds), return_exceptions=True)
+
+    asyncio.run(main())
+
+
+async def run(mode: str, args) -> dict:
+    rng = random.Random(args.seed)
+    kinds = [
+        "dead" if r < args.dead else "slow" if r < args.dead + args.slow else "ok"
+        for r in (rng.random() for _ in range(args.sessions))
+    ]
+    noise = np.random.default_rng(0).uniform(-0.1, 0.1, int(CHUNK_S * SR)).astype(np.float32)
+    frame = audio_out_msg(pcm_f32_to_s16le(noise))
+    chunks = round(SENTENCE_S / CHUNK_S)
+    sentences = max(1, round(args.reply_s / SENTENCE_S))
+    reply_s: list[float] = []
+    healthy_outboxes: list[Outbox] = []
+    finished = asyncio.Event()
+    healthy = kinds.count("ok")
+    done = 0
+
+    async def handler(ws):
+        nonlocal done
+        kind = await ws.recv()
+        out = Outbox(ws.send, on_stall=ws.close, **MODES[mode])
+        if kind == "ok":
+            healthy_outboxes.append(out)
+        try:
+            for _ in range(args.turns):
+                t0 = time.perf_counter()
+                for _ in range(sentences):
+                    await out.room()
+                    for _ in range(chunks):
+                        await asyncio.sleep(CHUNK_S / args.speedup)
+                        out.audio(frame, CHUNK_S)
+                await out.drain()
+                if out.closed:
+                    return
+                if kind == "ok":
+                    reply_s.append(time.perf_counter() - t0)
+                await asyncio.sleep(args.gap_s)
+        finally:
+            out.close()
+            if kind == "ok":
+                done += 1
+                if done == healthy:
+                    finished.set()
+
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    peak_total = peak_session = peak_lead = 0
+    rss0 = peak_rss = rss()
+
+    async def sample():
+        nonlocal peak_total, peak_session, peak_lead, peak_rss
+        while True:
+            stats = outbox_stats()
+            peak_total = max(peak_total, stats["queued_bytes"])
+            peak_session = max(peak_session, stats["max_queued_bytes"])
+            peak_lead = max([peak_lead, *(out.client_lead_s for out in healthy_outboxes)])
+            peak_rss = max(peak_rss, rss())
+            await asyncio.sleep(0.1)
+
+    dropped0 = outbox_stats()["dropped_clients"]
+    async with websockets.serve(
+        handler, sock=listener, compression=None, write_limit=SOCKET_BUFFER
+    ):
+        proc = multiprocessing.Process(target=clients, args=(port, kinds, args.slow_kbps))
+        sampler = asyncio.create_task(sample())
+        proc.start()
+        await finished.wait()
+        sampler.cancel()
+        dropped = outbox_stats()["dropped_clients"] - dropped0
+        proc.terminate()
+    proc.join()
+
+    return {
+        "mode": mode,
+        "sessions": {kind: kinds.count(kind) for kind in ("ok", "slow", "dead")},
+        "peak_queued_mb": peak_total / 2**20,
+        "peak_session_queued_kb": peak_session / 1024,
+        "rss_growth_mb": (peak_rss - rss0) / 2**20,
+        "dropped_clients": dropped,
+        "client_lead_s_max": peak_lead,
+        "reply_s_p50": float(np.percentile(reply_s, 50)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--slow", type=float, default=0.1, help="share of slow clients")
+    parser.add_argument("--dead", type=float, default=0.05, help="share of clients that stop")
+    parser.add_argument("--slow-kbps", type=float, default=200.0)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--reply-s", type=float, default=12.0, help="audio per reply")
+    parser.add_argument("--gap-s", type=float, default=2.0, help="pause between replies")
+    parser.add_argument("--speedup", type=float, default=4.0, help="synthesis speed vs. real time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(mode, args)) for mode in MODES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    sessions = results[0]["sessions"]
+    print(f"{sessions['ok']} healthy, {sessions['slow']} slow, {sessions['dead']} dead clients")
+    for r in results:
+        print(
+            f"{r['mode']:<8} queued peak {r['peak_queued_mb']:6.1f} MB "
+            f"(worst session {r['peak_session_queued_kb']:6.0f} KB)  "
+            f"RSS +{r['rss_growth_mb']:5.1f} MB  dropped {r['dropped_clients']:3d}  "
+            f"client lead {r['client_lead_s_max']:4.1f} s  reply {r['reply_s_p50']:5.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark: time-to-first-audio and turn time, sequential vs. overlapped TTS.
+
+Runs ConversationSession turns against the stub models in bench/stubs.py so
+it needs no GPU. The "sequential" path reproduces the old _process_utterance,
+which paused the LLM while each sentence was synthesized and only sent audio
+once a whole sentence was done; "overlapped" is the current pipeline.
+Audio is not paced to playback here, so turn time is compute time.
+
+Usage: python -m bench.pipeline [--token-ms 25] [--tts-rtf 0.3] [--turns 5] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+
+import numpy as np
+
+from bench.stubs import StubChatterbox, StubLlama, StubWhisper, install_stub_models
+from server.audio import pcm_f32_to_s16le
+from server.config import settings
+from server.metrics import TurnTrace
+from server.models.manager import models
+from server.pipeline import ConversationSession
+from server.protocol import MsgType, asr_msg, audio_out_msg, llm_msg, status_msg
+
+UTTERANCE = np.zeros(16000 * 2, dtype=np.float32)
+# How the old pipeline found sentence ends.
+SENTENCE_END = re.compile(r"[.!?;:]\s*$")
+
+
+async def sequential_turn(session: ConversationSession, audio: np.ndarray):
+    """The pre-pipeline turn: synthesis blocks decoding, audio sent per sentence."""
+    loop = asyncio.get_running_loop()
+    await session.send(status_msg("thinking"))
+    text = await loop.run_in_executor(None, models.asr.transcribe, audio)
+    await session.send(asr_msg(text))
+    session.history.messages.append({"role": "user", "content": text})
+    await session.send(status_msg("speaking"))
+
+    async def synthesize_and_send(sentence: str):
+        chunks = await loop.run_in_executor(None, lambda: list(models.tts.synthesize_stream(sentence)))
+        for chunk in chunks:
+            await session.send(audio_out_msg(pcm_f32_to_s16le(chunk)))
+
+    full_response = sentence_buffer = ""
+    for token in models.llm.generate_stream(session.history.prompt()):
+        full_response += token
+        sentence_buffer += token
+        await session.send(llm_msg(token))
+        if SENTENCE_END.search(sentence_buffer):
+            await synthesize_and_send(sentence_buffer.strip())
+            sentence_buffer = ""
+    if sentence_buffer.strip():
+        await synthesize_and_send(sentence_buffer.strip())
+    await session.send(llm_msg("", done=True))
+    session.history.messages.append({"role": "assistant", "content": full_response})
+    await session.send(status_msg("ready"))
+
+
+async def run_turn(mode: str) -> dict:
+    sent: list[tuple[float, int]] = []
+
+    async def send(data: bytes):
+        sent.append((time.perf_counter(), data[0]))
+
+    session = ConversationSession(send_fn=send)
+    t0 = time.perf_counter()
+    if mode == "sequential":
+        await sequential_turn(session, UTTERANCE)
+    else:
+        session._trace = TurnTrace()
+        await session._process_utterance(UTTERANCE)
+    await session.out.drain()
+    await session.close()
+
+    audio_times = [t for t, kind in sent if kind == MsgType.AUDIO_OUT]
+    return {"ttfa_s": audio_times[0] - t0, "turn_s": sent[-1][0] - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--asr-ms", type=float, default=100.0)
+    parser.add_argument("--prefill-ms", type=float, default=80.0)
+    parser.add_argument("--token-ms", type=float, default=25.0)
+    parser.add_argument("--tts-first-chunk-ms", type=float, default=150.0)
+    parser.add_argument("--tts-rtf", type=float, default=0.3, help="synthesis time per second of audio")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings.audio_lead_ms = 0
+
+    install_stub_models(
+        asr=StubWhisper(base_s=args.asr_ms / 1000),
+        llm=StubLlama(prefill_s=args.prefill_ms / 1000, token_s=args.token_ms / 1000),
+        tts=StubChatterbox(first_chunk_s=args.tts_first_chunk_ms / 1000, rtf=args.tts_rtf),
+    )
+
+    results = []
+    for mode in ("sequential", "overlapped"):
+        turns = [asyncio.run(run_turn(mode)) for _ in range(args.turns)]
+        results.append({
+            "mode": mode,
+            "ttfa_ms": 1000 * float(np.mean([t["ttfa_s"] for t in turns])),
+            "turn_ms": 1000 * float(np.mean([t["turn_s"] for t in turns])),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(f"{r['mode']:<11} first audio {r['ttfa_ms']:7.0f} ms   turn {r['turn_ms']:7.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
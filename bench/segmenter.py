@@ -0,0 +1,209 @@
+"""Benchmark: TTS chunking of streamed replies, old regex vs. SentenceSegmenter.
+
+Streams a corpus of NorMistral-style replies (times, dates, prices,
+abbreviations, long comma-joined sentences) token by token at --token-ms,
+after --prefill-ms, and synthesizes each chunk as it completes, one at a
+time, as the session pipeline does. Splitters:
+- "regex": the old SENTENCE_END check on the growing buffer
+- "sentences": SentenceSegmenter without a short first chunk or a length cap
+- "segmenter": SentenceSegmenter with tts_first_chunk_min_chars and
+  tts_max_chunk_chars, as the server runs it
+
+Reports time-to-first-audio from the request, TTS real-time factor (model
+time per second of audio), chunks per reply, the longest chunk, and false
+splits: chunks after a full stop that start with a lowercase letter or a
+digit, i.e. a sentence cut after an abbreviation or a number.
+
+--backend stub (default) uses the StubChatterbox of bench/stubs.py, whose
+cost is a fixed first-chunk latency plus --tts-rtf per second of audio, so
+its RTF only shows the per-call overhead of shorter chunks. --backend real
+loads Chatterbox (needs the GPU stack) and measures the model itself,
+including how it copes with long inputs.
+
+Usage: python -m bench.segmenter [--backend stub|real] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+
+import numpy as np
+
+from bench.stubs import StubChatterbox
+from server.config import settings
+from server.models.tts import TTS
+from server.segmenter import SentenceSegmenter
+
+REPLIES = [
+    "Møtet starter kl. 14.30 i morgen, i andre etasje. Ta gjerne med f.eks. en notatbok.",
+    (
+        "Den 17. mai feirer vi grunnloven fra 1814. Det er barnetog, is og korps i nesten "
+        "alle byer og bygder. Skal du feire i Oslo i år?"
+    ),
+    "Det koster ca. 450 kr. per måned, inkl. mva. Vil du at jeg skal sende deg et tilbud?",
+    (
+        "Ja, det kan jeg hjelpe deg med. Dr. Hansen har kontortid fra kl. 9 til 15, men du må "
+        "ringe først, og det kan ta litt tid før noen svarer, særlig på mandager når det er mye "
+        "å gjøre, så vær tålmodig og prøv igjen senere hvis ingen tar telefonen."
+    ),
+    (
+        "Hmm... la meg tenke. Jeg tror, uten å være helt sikker, at toget går hver 20. minutt "
+        "fram til midnatt."
+    ),
+    (
+        "Du trenger tre ting: mel, egg og melk. Bland alt godt sammen, la røren hvile i en "
+        "halvtime, og stek tynne pannekaker i en varm panne med litt smør."
+    ),
+    (
+        "Det er fint vær i Oslo i dag, med sol og rundt 18 grader. I morgen blir det skyet, "
+        "og det kan komme noen byger utover ettermiddagen, så ta med paraply."
+    ),
+    "Nei, dessverre. Butikken er stengt på søndager, men den åpner igjen mandag kl. 10.",
+    (
+        "Bergen er kjent for regn, fjell og fisketorget. Byen har ca. 290 000 innbyggere, og "
+        "den ble grunnlagt rundt år 1070 av kong Olav Kyrre."
+    ),
+    "Takk for at du spør! Jeg har det bra. Hva kan jeg hjelpe deg med i dag?",
+    (
+        "For å bytte passord går du til innstillinger, velger konto og trykker på endre passord, "
+        "deretter skriver du inn det gamle passordet, det nye passordet to ganger, og til slutt "
+        "trykker du på lagre."
+    ),
+    (
+        "Boken kom ut i 2019 og ble oversatt til bl.a. engelsk, tysk og fransk. Forfatteren "
+        "fikk flere priser for den, bl.a. Brageprisen."
+    ),
+    (
+        "Renten er nå 4,5 prosent. Det betyr at et lån på 3 mill. kr. koster ca. 11 250 kr. "
+        "i måneden i renter alene."
+    ),
+    "Absolutt. Jeg kan minne deg på det den 3. juni kl. 08.00, dvs. en time før avreise.",
+    (
+        "Det finnes mange gode turer i Nordmarka, f.eks. rundt Sognsvann, opp til Ullevålseter "
+        "eller videre til Kikut. De fleste er merket, og det er kafeer underveis."
+    ),
+    (
+        "Greit! Da har jeg notert bestillingen: to pizzaer, en stor salat og en flaske brus, "
+        "levert til Storgata 12 om ca. 40 min."
+    ),
+]
+
+# Roughly how NorMistral's tokenizer splits text: words with their leading
+# space, and punctuation on its own.
+TOKEN = re.compile(r"\s?\w+|\s?[^\w\s]|\s+")
+# The pipeline's boundary check before SentenceSegmenter.
+SENTENCE_END = re.compile(r"[.!?;:]\s*$")
+
+
+class RegexSplitter:
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, token: str) -> list[str]:
+        self._buf += token
+        if SENTENCE_END.search(self._buf):
+            chunk, self._buf = self._buf.strip(), ""
+            return [chunk]
+        return []
+
+    def flush(self) -> str:
+        chunk, self._buf = self._buf.strip(), ""
+        return chunk
+
+
+SPLITTERS = {
+    "regex": RegexSplitter,
+    "sentences": SentenceSegmenter,
+    "segmenter": lambda: SentenceSegmenter(
+        settings.tts_first_chunk_min_chars, settings.tts_max_chunk_chars
+    ),
+}
+
+
+async def reply(tts: TTS, text: str, splitter, args) -> dict:
+    """Stream one reply through the splitter into TTS; timings and chunks."""
+    chunks: asyncio.Queue[str | None] = asyncio.Queue()
+    t0 = time.perf_counter()
+
+    async def generate():
+        await asyncio.sleep(args.prefill_ms / 1000)
+        for token in TOKEN.findall(text):
+            await asyncio.sleep(args.token_ms / 1000)
+            for chunk in splitter.feed(token):
+                await chunks.put(chunk)
+        if rest := splitter.flush():
+            await chunks.put(rest)
+        await chunks.put(None)
+
+    producer = asyncio.create_task(generate())
+    first_audio = None
+    model_s = audio_s = 0.0
+    emitted = []
+    while (chunk := await chunks.get()) is not None:
+        emitted.append(chunk)
+        t = time.perf_counter()
+        async for audio in tts.asynthesize_stream(chunk):
+            if first_audio is None:
+                first_audio = time.perf_counter() - t0
+            audio_s += len(audio) / tts.sr
+        model_s += time.perf_counter() - t
+    await producer
+    return {"ttfa_s": first_audio, "model_s": model_s, "audio_s": audio_s, "chunks": emitted}
+
+
+async def run(mode: str, tts: TTS, args) -> dict:
+    results = [await reply(tts, text, SPLITTERS[mode](), args) for text in REPLIES]
+    chunks = [c for r in results for c in r["chunks"]]
+    ttfa = np.array([r["ttfa_s"] for r in results]) * 1000
+    return {
+        "mode": mode,
+        "ttfa_p50_ms": float(np.percentile(ttfa, 50)),
+        "ttfa_p95_ms": float(np.percentile(ttfa, 95)),
+        "rtf": sum(r["model_s"] for r in results) / sum(r["audio_s"] for r in results),
+        "chunks_per_reply": len(chunks) / len(results),
+        "max_chunk_chars": max(len(c) for c in chunks),
+        "false_splits": sum(
+            prev.endswith(".") and (c[0].islower() or c[0].isdigit())
+            for r in results
+            for prev, c in zip(r["chunks"], r["chunks"][1:])
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("stub", "real"), default="stub")
+    parser.add_argument("--prefill-ms", type=float, default=80.0)
+    parser.add_argument("--token-ms", type=float, default=25.0)
+    parser.add_argument("--tts-first-chunk-ms", type=float, default=150.0, help="stub TTS")
+    parser.add_argument("--tts-rtf", type=float, default=0.3, help="stub TTS")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings.tts_cache_mb = 0
+    if args.backend == "stub":
+        model = StubChatterbox(first_chunk_s=args.tts_first_chunk_ms / 1000, rtf=args.tts_rtf)
+        tts = TTS(model=model)
+    else:
+        tts = TTS()
+        asyncio.run(reply(tts, REPLIES[0], RegexSplitter(), args))  # warm-up
+
+    results = [asyncio.run(run(mode, tts, args)) for mode in SPLITTERS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<10} first audio p50 {r['ttfa_p50_ms']:5.0f} ms  "
+            f"p95 {r['ttfa_p95_ms']:5.0f} ms  RTF {r['rtf']:.2f}  "
+            f"{r['chunks_per_reply']:4.1f} chunks/reply  longest {r['max_chunk_chars']:3d} chars  "
+            f"false splits {r['false_splits']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
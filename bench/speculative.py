@@ -0,0 +1,193 @@
+"""Benchmark: speculative turns started at a pause in speech.
+
+Plays a corpus of utterances into a ConversationSession in real time, in
+32 ms chunks, against the stub models, with speculative turns off and on.
+Perceived latency is the time from the last chunk of speech to the first
+audio frame of the reply; wasted compute is the extra model time the
+speculative run spent on turns it had to abandon.
+
+The built-in corpus has utterances with and without hesitations longer than
+vad_pause_ms. --corpus takes a directory of 16 kHz mono WAV recordings
+instead (the stub VAD gates on energy).
+
+A last case plays one utterance in 500 ms chunks, one of which holds both
+the resume after a pause and the next pause, and reports how much of the
+utterance the turn that answered it heard.
+
+Usage: python -m bench.speculative [--corpus DIR] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench.stubs import StubChatterbox, StubLlama, StubWhisper, install_stub_models
+from server.config import settings
+from server.pipeline import ConversationSession
+from server.protocol import MsgType
+
+REPLY = (
+    "Det er et godt spørsmål, og jeg skal gjerne hjelpe deg med det med en gang. "
+    "Vil du at jeg skal se nærmere på det?"
+)
+SR = 16000
+CHUNK = 512
+# Alternating speech and silence durations (s) of each built-in utterance.
+CORPUS = [
+    [1.8],
+    [1.2, 0.4, 1.0],
+    [2.5],
+    [0.9, 0.3, 0.6, 0.5, 1.1],
+    [1.5, 0.2, 1.4],
+    [2.0],
+    [1.0, 0.45, 1.6],
+    [3.0],
+]
+# Speech resumes at 1.5 s and pauses again within the chunk [1.5 s, 2.0 s).
+ONE_CHUNK_RESUME = [1.0, 0.5, 0.2]
+COARSE_CHUNK = SR // 2
+
+
+def synthesize(segments: list[float]) -> tuple[np.ndarray, float]:
+    """Utterance audio and the time its speech ends."""
+    parts = []
+    for i, seconds in enumerate(segments):
+        n = int(seconds * SR)
+        if i % 2:
+            parts.append(np.zeros(n, dtype=np.float32))
+        else:
+            t = np.arange(n) / SR
+            parts.append((0.1 * np.sin(2 * np.pi * 180 * t)).astype(np.float32))
+    audio = np.concatenate(parts)
+    return audio, len(audio) / SR
+
+
+def load_corpus(directory: str) -> list[tuple[np.ndarray, float]]:
+    import soundfile as sf
+
+    corpus = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        audio, sr = sf.read(path, dtype="float32")
+        if sr != SR or audio.ndim != 1:
+            raise SystemExit(f"{path}: need 16 kHz mono")
+        voiced = np.flatnonzero(np.abs(audio) > 0.02)
+        corpus.append((audio, (voiced[-1] + 1) / SR if len(voiced) else len(audio) / SR))
+    return corpus
+
+
+async def run(speculative: bool, corpus, stubs) -> dict:
+    models = install_stub_models(*stubs)
+    models.vad.pause_ms = settings.vad_pause_ms if speculative else 0
+    first_audio: list[float] = []
+
+    async def send(data: bytes):
+        if data[0] in (MsgType.AUDIO_OUT, MsgType.AUDIO_OUT_OPUS) and not first_audio:
+            first_audio.append(time.perf_counter())
+
+    session = ConversationSession(send_fn=send)
+    session.configure({"input_format": "pcm_f32le"})
+    busy0 = sum(s.busy_s for s in stubs)
+    latencies = []
+    for audio, speech_end in corpus:
+        audio = np.concatenate([audio, np.zeros(SR, dtype=np.float32)])
+        first_audio.clear()
+        t0 = time.perf_counter()
+        end_time = None
+        for i in range(0, len(audio), CHUNK):
+            await session.handle_raw_audio(audio[i : i + CHUNK].tobytes())
+            if end_time is None and (i + CHUNK) / SR >= speech_end:
+                end_time = time.perf_counter()
+            await asyncio.sleep(max(0.0, t0 + (i + CHUNK) / SR - time.perf_counter()))
+        if session._turn is not None:
+            await session._turn
+        if first_audio:
+            latencies.append(first_audio[0] - end_time)
+    await session.close()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "mode": "speculative" if speculative else "baseline",
+        "replies": len(latencies),
+        "latency_p50_ms": float(np.percentile(ms, 50)),
+        "latency_mean_ms": float(ms.mean()),
+        "model_busy_s": sum(s.busy_s for s in stubs) - busy0,
+    }
+
+
+async def one_chunk_resume(stubs) -> dict:
+    """The audio of the turn answering an utterance whose speech resumes and
+    pauses again within one chunk; a turn kept from the first pause misses the
+    rest of the speech."""
+    models = install_stub_models(*stubs)
+    models.vad.pause_ms = settings.vad_pause_ms
+    audio, speech_end = synthesize(ONE_CHUNK_RESUME)
+    audio = np.concatenate([audio, np.zeros(SR, dtype=np.float32)])
+
+    async def send(data: bytes):
+        pass
+
+    session = ConversationSession(send_fn=send)
+    session.configure({"input_format": "pcm_f32le"})
+    run_turn = session._run_turn
+    answered: list[float] = []
+
+    async def record(turn_audio, *args):
+        await run_turn(turn_audio, *args)
+        answered.append(len(turn_audio) / SR)
+
+    session._run_turn = record
+    for i in range(0, len(audio), COARSE_CHUNK):
+        await session.handle_raw_audio(audio[i : i + COARSE_CHUNK].tobytes())
+    if session._turn is not None:
+        await session._turn
+    await session.close()
+    return {"speech_s": speech_end, "heard_s": answered[-1] if answered else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of 16 kHz mono WAV files")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else [synthesize(u) for u in CORPUS]
+    settings.barge_in = False  # replies overlap the next utterance's start otherwise
+    settings.tts_cache_mb = 0  # every turn gets the same canned reply
+    stubs = (StubWhisper(), StubLlama(reply=REPLY), StubChatterbox())
+
+    results = [asyncio.run(run(speculative, corpus, stubs)) for speculative in (False, True)]
+    base, spec = results
+    summary = {
+        "results": results,
+        "latency_saved_ms": base["latency_mean_ms"] - spec["latency_mean_ms"],
+        "wasted_model_s": spec["model_busy_s"] - base["model_busy_s"],
+        "one_chunk_resume": asyncio.run(one_chunk_resume(stubs)),
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<12} {r['replies']} replies  first audio after speech "
+            f"p50 {r['latency_p50_ms']:6.1f} ms  mean {r['latency_mean_ms']:6.1f} ms  "
+            f"model busy {r['model_busy_s']:5.2f}s"
+        )
+    print(
+        f"latency saved {summary['latency_saved_ms']:.0f} ms per turn, "
+        f"wasted model time {summary['wasted_model_s']:.2f}s over {len(corpus)} utterances"
+    )
+    resume = summary["one_chunk_resume"]
+    print(
+        f"resume and pause in one chunk: the answering turn heard {resume['heard_s']:.2f}s "
+        f"of an utterance whose speech ends at {resume['speech_s']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
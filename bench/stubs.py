@@ -0,0 +1,207 @@
+"""Deterministic CPU stand-ins for the GPU models, with configurable latency.
+
+They mimic just enough of the third-party model APIs (Silero, faster-whisper,
+llama.cpp, Chatterbox) for the server's wrappers to run unchanged. Latencies
+use time.sleep, which, like the native kernels they replace, releases the GIL,
+and every stub adds its simulated compute time to busy_s.
+"""
+
+import re
+import time
+from types import SimpleNamespace
+
+import torch
+
+DEFAULT_TRANSCRIPT = "Hvordan blir været i Oslo i dag?"
+DEFAULT_REPLY = (
+    "Hei! Det er fint vær i Oslo i dag, med sol og rundt femten grader. "
+    "Vil du at jeg skal sjekke værmeldingen for i morgen også?"
+)
+
+
+class _Timed:
+    busy_s = 0.0
+
+    def _work(self, seconds: float):
+        time.sleep(seconds)
+        self.busy_s += seconds
+
+
+class StubSileroVAD:
+    """Mimics the Silero JIT module: speech probability from window energy."""
+
+    def __init__(self, gain: float = 20.0):
+        self.gain = gain
+        self._model = self._forward
+
+    def eval(self):
+        return self
+
+    def _forward(self, x: torch.Tensor, state: torch.Tensor):
+        rms = x[:, 64:].pow(2).mean(dim=1, keepdim=True).sqrt()
+        return (rms * self.gain).clamp(0.0, 1.0), state
+
+
+class StubWhisper(_Timed):
+    """Mimics WhisperModel.transcribe with a fixed transcript.
+
+    With word_timestamps, the transcript is spoken at word_s seconds per word:
+    a clip yields the words that fit in it, continuing after the words already
+    given as initial_prompt.
+    """
+
+    def __init__(
+        self,
+        text: str = DEFAULT_TRANSCRIPT,
+        base_s: float = 0.1,
+        rtf: float = 0.05,
+        word_s: float = 0.35,
+    ):
+        self.text = text
+        self.base_s = base_s
+        self.rtf = rtf
+        self.word_s = word_s
+
+    def transcribe(self, audio, word_timestamps=False, initial_prompt=None, **kwargs):
+        self._work(self.base_s + len(audio) / 16000 * self.rtf)
+        info = SimpleNamespace(language="no", language_probability=1.0)
+        if not word_timestamps:
+            return iter([SimpleNamespace(text=self.text)]), info
+
+        done = len(initial_prompt.split()) if initial_prompt else 0
+        count = int(len(audio) / 16000 / self.word_s)
+        words = [
+            SimpleNamespace(start=i * self.word_s, end=(i + 1) * self.word_s, word=f" {w}")
+            for i, w in enumerate(self.text.split()[done : done + count])
+        ]
+        return iter([SimpleNamespace(text="".join(w.word for w in words), words=words)]), info
+
+
+class StubBatchedWhisper(_Timed):
+    """Mimics BatchedInferencePipeline.transcribe over clip_timestamps.
+
+    A batch costs one fixed overhead, the real-time factor of its longest clip,
+    and item_s for every further clip.
+    """
+
+    def __init__(self, whisper: StubWhisper, item_s: float = 0.02):
+        self.whisper = whisper
+        self.item_s = item_s
+
+    def transcribe(self, audio, clip_timestamps, **kwargs):
+        longest = max(c["end"] - c["start"] for c in clip_timestamps)
+        w = self.whisper
+        self._work(w.base_s + longest * w.rtf + self.item_s * (len(clip_timestamps) - 1))
+        info = SimpleNamespace(language="no", language_probability=1.0)
+        segments = [
+            SimpleNamespace(start=c["start"], end=c["end"], text=f" {w.text}") for c in clip_timestamps
+        ]
+        return iter(segments), info
+
+
+class StubLlama(_Timed):
+    """Mimics Llama.create_chat_completion(stream=True) with a canned reply.
+
+    tokenize counts whitespace-separated words, close enough for prompt budgets.
+    """
+
+    def __init__(self, reply: str = DEFAULT_REPLY, prefill_s: float = 0.05, token_s: float = 0.02):
+        self.tokens = re.findall(r"\S+\s*", reply)
+        self.prefill_s = prefill_s
+        self.token_s = token_s
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> list[int]:
+        return list(range(len(re.findall(rb"\S+\s*", text)) + add_bos))
+
+    def create_chat_completion(self, messages, stream=True, max_tokens=256, **kwargs):
+        self._work(self.prefill_s)
+        for token in self.tokens[:max_tokens]:
+            self._work(self.token_s)
+            yield {"choices": [{"delta": {"content": token}}]}
+
+
+class StubChatterbox(_Timed):
+    """Mimics ChatterboxTTS generate/generate_stream at a fixed real-time factor.
+
+    Passing audio_prompt_path recomputes the voice conditioning (cond_s), as
+    the real model does; prepare_conditionals alone computes it ahead of time.
+    """
+
+    sr = 24000
+
+    def __init__(
+        self,
+        first_chunk_s: float = 0.15,
+        rtf: float = 0.3,
+        chunk_s: float = 0.5,
+        chars_per_s: float = 14.0,
+        cond_s: float = 0.2,
+    ):
+        self.first_chunk_s = first_chunk_s
+        self.rtf = rtf
+        self.chunk_s = chunk_s
+        self.chars_per_s = chars_per_s
+        self.cond_s = cond_s
+        self.conds = SimpleNamespace(voice=None)
+
+    def prepare_conditionals(self, wav_fpath: str, exaggeration: float = 0.5):
+        self._work(self.cond_s)
+        self.conds = SimpleNamespace(voice=wav_fpath)
+
+    def _audio(self, seconds: float) -> torch.Tensor:
+        t = torch.arange(int(seconds * self.sr)) / self.sr
+        return (0.1 * torch.sin(2 * torch.pi * 220 * t)).unsqueeze(0)
+
+    def generate_stream(self, text: str, audio_prompt_path: str | None = None, **kwargs):
+        if audio_prompt_path:
+            self.prepare_conditionals(audio_prompt_path)
+        remaining = len(text) / self.chars_per_s
+        latency = self.first_chunk_s
+        while remaining > 0:
+            seconds = min(self.chunk_s, remaining)
+            self._work(latency + seconds * self.rtf)
+            latency = 0.0
+            remaining -= seconds
+            yield self._audio(seconds), {}
+
+    def generate(self, text: str, audio_prompt_path: str | None = None, **kwargs) -> torch.Tensor:
+        if audio_prompt_path:
+            self.prepare_conditionals(audio_prompt_path)
+        seconds = len(text) / self.chars_per_s
+        self._work(self.first_chunk_s + seconds * self.rtf)
+        return self._audio(seconds)
+
+
+def stub_vad(model: StubSileroVAD | None = None):
+    """The server's VAD engine, configured from settings, on the stub Silero model."""
+    from server.config import settings
+    from server.models.vad import VAD
+
+    return VAD(
+        threshold=settings.vad_threshold,
+        min_speech_ms=settings.vad_min_speech_ms,
+        min_silence_ms=settings.vad_min_silence_ms,
+        batch_tick_ms=settings.vad_batch_tick_ms,
+        pause_ms=settings.vad_pause_ms if settings.speculative_turns else 0,
+        model=model or StubSileroVAD(),
+    )
+
+
+def install_stub_models(
+    asr: StubWhisper | None = None,
+    llm: StubLlama | None = None,
+    tts: StubChatterbox | None = None,
+    vad: StubSileroVAD | None = None,
+):
+    """Populate the server's ModelManager singleton with stub-backed wrappers."""
+    from server.models.asr import ASR
+    from server.models.llm import LLM
+    from server.models.manager import models
+    from server.models.tts import TTS
+
+    models.vad = stub_vad(vad)
+    models.asr = ASR(model=asr or StubWhisper())
+    models.llm = LLM(model=llm or StubLlama(), parallel_sequences=1)
+    models.tts = TTS(model=tts or StubChatterbox())
+    models.warmed = True
+    return models
@@ -0,0 +1,81 @@
+"""Build a tiny random-weight llama GGUF for CPU throughput benchmarks.
+
+The tokenizer is copied from a vocab-only GGUF; llama.cpp ships several in
+vendor/llama.cpp/models/ (e.g. ggml-vocab-llama-spm.gguf). The weights are
+random, so the text is gibberish, but the compute per token has the shape of a
+real (if very small) llama, which is what batching benchmarks need.
+
+Requires the gguf package: pip install gguf
+
+Usage: python -m bench.tiny_gguf VOCAB.gguf OUT.gguf [--layers 4] [--dim 256]
+"""
+
+import argparse
+
+import numpy as np
+
+
+def build(vocab_path: str, out_path: str, layers: int = 4, dim: int = 256, heads: int = 8):
+    import gguf
+
+    reader = gguf.GGUFReader(vocab_path)
+    tokens = reader.fields["tokenizer.ggml.tokens"].contents()
+    n_vocab = len(tokens)
+    ff = dim * 4
+
+    writer = gguf.GGUFWriter(out_path, "llama")
+    writer.add_name("wybe-bench-tiny")
+    writer.add_context_length(4096)
+    writer.add_embedding_length(dim)
+    writer.add_block_count(layers)
+    writer.add_feed_forward_length(ff)
+    writer.add_head_count(heads)
+    writer.add_head_count_kv(heads)
+    writer.add_layer_norm_rms_eps(1e-5)
+    writer.add_rope_dimension_count(dim // heads)
+    writer.add_file_type(gguf.LlamaFileType.ALL_F32)
+
+    writer.add_tokenizer_model(reader.fields["tokenizer.ggml.model"].contents())
+    writer.add_token_list(tokens)
+    writer.add_token_scores(reader.fields["tokenizer.ggml.scores"].contents())
+    writer.add_token_types(reader.fields["tokenizer.ggml.token_type"].contents())
+    writer.add_bos_token_id(reader.fields["tokenizer.ggml.bos_token_id"].contents())
+    writer.add_eos_token_id(reader.fields["tokenizer.ggml.eos_token_id"].contents())
+
+    rng = np.random.default_rng(0)
+
+    def weight(*shape):
+        return (rng.standard_normal(shape) / np.sqrt(shape[-1])).astype(np.float32)
+
+    writer.add_tensor("token_embd.weight", weight(n_vocab, dim))
+    writer.add_tensor("output_norm.weight", np.ones(dim, dtype=np.float32))
+    writer.add_tensor("output.weight", weight(n_vocab, dim))
+    for i in range(layers):
+        writer.add_tensor(f"blk.{i}.attn_norm.weight", np.ones(dim, dtype=np.float32))
+        writer.add_tensor(f"blk.{i}.attn_q.weight", weight(dim, dim))
+        writer.add_tensor(f"blk.{i}.attn_k.weight", weight(dim, dim))
+        writer.add_tensor(f"blk.{i}.attn_v.weight", weight(dim, dim))
+        writer.add_tensor(f"blk.{i}.attn_output.weight", weight(dim, dim))
+        writer.add_tensor(f"blk.{i}.ffn_norm.weight", np.ones(dim, dtype=np.float32))
+        writer.add_tensor(f"blk.{i}.ffn_gate.weight", weight(ff, dim))
+        writer.add_tensor(f"blk.{i}.ffn_up.weight", weight(ff, dim))
+        writer.add_tensor(f"blk.{i}.ffn_down.weight", weight(dim, ff))
+
+    writer.write_header_to_file()
+    writer.write_kv_data_to_file()
+    writer.write_tensors_to_file()
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("vocab", help="vocab-only GGUF to take the tokenizer from")
+    parser.add_argument("out", help="output GGUF path")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+    build(args.vocab, args.out, layers=args.layers, dim=args.dim)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark: synthesized-audio cache on a repetitive reply mix.
+
+Sentences are drawn so that a share of them (--repeat) are common phrases
+and the rest unique, then synthesized through TTS.asynthesize_stream on a
+stub Chatterbox with the cache disabled, enabled, and enabled after a
+"restart" that keeps only the on-disk tier. Reports time to first chunk,
+model time and the cache's hit rate.
+
+Usage: python -m bench.tts_cache [--sentences 200] [--repeat 0.4] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench.stubs import StubChatterbox
+from server.config import settings
+from server.models.tts import TTS
+
+PHRASES = [
+    "Hei!",
+    "Det vet jeg ikke.",
+    "Så hyggelig å høre!",
+    "Kan du gjenta det?",
+    "Selvfølgelig.",
+    "Ha en fin dag!",
+    "Et øyeblikk.",
+    "Det forstår jeg godt.",
+]
+
+
+def workload(n: int, repeat: float, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(len(PHRASES))]
+    return [
+        rng.choices(PHRASES, weights)[0] if rng.random() < repeat else f"Setning nummer {i} er ny."
+        for i in range(n)
+    ]
+
+
+async def run(mode: str, sentences: list[str], cache_dir: str) -> dict:
+    settings.tts_cache_mb = 0 if mode == "no cache" else 64
+    settings.tts_cache_dir = "" if mode == "no cache" else cache_dir
+    model = StubChatterbox(first_chunk_s=0.05, rtf=0.02)
+    tts = TTS(model=model)
+
+    first_chunk = []
+    for text in sentences:
+        t0 = time.perf_counter()
+        first = None
+        async for _ in tts.asynthesize_stream(text):
+            if first is None:
+                first = time.perf_counter() - t0
+        first_chunk.append(first)
+    await tts.cache.drain()
+
+    ms = np.array(first_chunk) * 1000
+    stats = tts.cache.stats()
+    return {
+        "mode": mode,
+        "first_chunk_p50_ms": float(np.percentile(ms, 50)),
+        "first_chunk_mean_ms": float(ms.mean()),
+        "model_busy_s": model.busy_s,
+        "hit_rate": stats["hit_rate"],
+        "bytes_served": stats["bytes_served"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=200)
+    parser.add_argument("--repeat", type=float, default=0.4, help="share of common phrases")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    sentences = workload(args.sentences, args.repeat, args.seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results = [
+            asyncio.run(run(mode, sentences, cache_dir))
+            for mode in ("no cache", "cache", "after restart")
+        ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<14} first chunk p50 {r['first_chunk_p50_ms']:6.1f} ms  "
+            f"mean {r['first_chunk_mean_ms']:6.1f} ms  model busy {r['model_busy_s']:5.2f}s  "
+            f"hit rate {r['hit_rate']:.0%}  served {r['bytes_served'] / 2**20:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
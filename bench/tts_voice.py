@@ -0,0 +1,82 @@
+"""Benchmark: per-sentence TTS time with cached vs per-call voice conditioning.
+
+Synthesizes a reply sentence by sentence on a stub Chatterbox in a cloned
+voice. "uncached" passes the reference WAV with every call, so conditioning
+is recomputed per sentence (the old behaviour). "cached" goes through
+TTS.synthesize_stream with a voice id, so conditioning is computed on the
+first sentence and reused after that.
+
+Usage: python -m bench.tts_voice [--sentences 20] [--cond-ms 200] [--json]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench.stubs import StubChatterbox
+from server.config import settings
+from server.models.tts import TTS
+
+SENTENCE = "Det blir sol og rundt femten grader i Oslo i dag."
+
+
+def run(mode: str, sentences: int, cond_s: float, voices_dir: Path) -> dict:
+    model = StubChatterbox(cond_s=cond_s)
+    tts = TTS(model=model)
+    tts.voices_dir = voices_dir
+    wav = str(voices_dir / "bench.wav")
+
+    times = []
+    for _ in range(sentences):
+        t0 = time.perf_counter()
+        if mode == "uncached":
+            for _ in model.generate_stream(SENTENCE, audio_prompt_path=wav):
+                pass
+        else:
+            for _ in tts.synthesize_stream(SENTENCE, voice="bench"):
+                pass
+        times.append(time.perf_counter() - t0)
+
+    ms = np.array(times) * 1000
+    return {
+        "mode": mode,
+        "first_ms": float(ms[0]),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "mean_ms": float(ms.mean()),
+        "model_busy_s": model.busy_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=20)
+    parser.add_argument("--cond-ms", type=float, default=200.0, help="stub conditioning cost")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    settings.tts_speaker_wav = ""
+    with tempfile.TemporaryDirectory() as tmp:
+        voices_dir = Path(tmp)
+        (voices_dir / "bench.wav").touch()
+        results = [
+            run(mode, args.sentences, args.cond_ms / 1000, voices_dir)
+            for mode in ("uncached", "cached")
+        ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<9} first sentence {r['first_ms']:6.1f} ms  p50 {r['p50_ms']:6.1f} ms  "
+            f"mean {r['mean_ms']:6.1f} ms  model busy {r['model_busy_s']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Load test: N concurrent VAD streams on the shared batched Silero engine.
+
+Each simulated session pushes 200 ms chunks into its own VADStream, either
+as fast as possible or paced at real time (--realtime). For comparison the
+baseline scores the same windows one model call at a time, as the
+pre-batching VAD did.
+
+Usage: python -m bench.vad [--streams 1 8 32 128] [--seconds 5] [--realtime] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import torch
+
+from server.models.vad import CONTEXT_SAMPLES, STATE_SHAPE, VAD, WINDOW_SAMPLES
+
+CHUNK_SAMPLES = 3200  # 200 ms at 16 kHz
+
+
+def make_audio(seconds: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * 16000)) / 16000
+    tone = 0.3 * np.sin(2 * np.pi * 180 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    return (tone + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def bench_baseline(vad: VAD, streams: int, audio: np.ndarray) -> dict:
+    n_windows = -(-len(audio) // WINDOW_SAMPLES)
+    padded = np.zeros(n_windows * WINDOW_SAMPLES, dtype=np.float32)
+    padded[: len(audio)] = audio
+    windows = torch.from_numpy(padded).view(n_windows, WINDOW_SAMPLES)
+
+    t0 = time.perf_counter()
+    with torch.inference_mode():
+        for _ in range(streams):
+            state = torch.zeros(STATE_SHAPE)
+            context = torch.zeros(1, CONTEXT_SAMPLES)
+            for w in windows:
+                x = torch.cat([context, w.unsqueeze(0)], dim=1)
+                prob, state = vad._net(x, state)
+                prob.item()
+                context = x[:, -CONTEXT_SAMPLES:]
+    wall = time.perf_counter() - t0
+    return {"engine": "per-window", "streams": streams, "windows_per_s": streams * n_windows / wall}
+
+
+async def bench_batched(vad: VAD, streams: int, audio: np.ndarray, realtime: bool) -> dict:
+    latencies: list[float] = []
+
+    async def run_stream(offset: float):
+        stream = vad.create_stream()
+        if realtime:
+            await asyncio.sleep(offset)
+        start = time.perf_counter()
+        for n, i in enumerate(range(0, len(audio), CHUNK_SAMPLES)):
+            if realtime:
+                await asyncio.sleep(max(0.0, start + n * 0.2 - time.perf_counter()))
+            t = time.perf_counter()
+            await stream.process_chunk(audio[i : i + CHUNK_SAMPLES])
+            latencies.append(time.perf_counter() - t)
+        stream.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(run_stream(0.2 * k / streams) for k in range(streams)))
+    wall = time.perf_counter() - t0
+
+    n_windows = sum(-(-min(CHUNK_SAMPLES, len(audio) - i) // WINDOW_SAMPLES)
+                    for i in range(0, len(audio), CHUNK_SAMPLES))
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "engine": "batched",
+        "streams": streams,
+        "windows_per_s": streams * n_windows / wall,
+        "chunk_p50_ms": float(np.percentile(lat_ms, 50)),
+        "chunk_p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--seconds", type=float, default=5.0, help="audio per stream")
+    parser.add_argument("--realtime", action="store_true", help="pace chunks at 200 ms")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    vad = VAD()
+    audio = make_audio(args.seconds, seed=0)
+
+    results = []
+    for n in args.streams:
+        if not args.realtime:
+            results.append(bench_baseline(vad, n, audio))
+        results.append(asyncio.run(bench_batched(vad, n, audio, args.realtime)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        line = f"{r['engine']:<10} {r['streams']:4d} streams  {r['windows_per_s']:10.0f} windows/s"
+        if "chunk_p99_ms" in r:
+            line += f"  chunk p50 {r['chunk_p50_ms']:6.1f} ms  p99 {r['chunk_p99_ms']:6.1f} ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Microbenchmark: VAD cost per audio chunk.
+
+Feeds --sessions streams 200 ms chunks of alternating speech and silence
+(so utterances start and end), in lockstep like concurrent clients, through
+the batched VAD engine with the stub Silero model. Chunk sizes are not a
+multiple of the 512-sample window. Reports microseconds per chunk per
+session and Python-visible memory allocated per chunk (tracemalloc peak
+over the chunk).
+
+Usage: python -m bench.vad_frames [--sessions 1 8] [--chunks 500] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from bench.stubs import StubSileroVAD
+from server.models.vad import VAD
+
+SR = 16000
+
+
+def chunks(n: int, chunk_ms: float) -> list[np.ndarray]:
+    size = int(SR * chunk_ms / 1000)
+    t = np.arange(size) / SR
+    speech = (0.1 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+    silence = np.zeros(size, dtype=np.float32)
+    # 2 s of speech, then 1 s of silence, repeated; as read-only bytes views like the socket gives.
+    pattern = [speech] * 10 + [silence] * 5
+    return [np.frombuffer(pattern[i % len(pattern)].tobytes(), dtype=np.float32) for i in range(n)]
+
+
+async def run(sessions: int, n: int, chunk_ms: float, trace: bool) -> dict:
+    vad = VAD(batch_tick_ms=0, pause_ms=250, model=StubSileroVAD())
+    streams = [vad.create_stream() for _ in range(sessions)]
+    audio = chunks(n, chunk_ms)
+    events = 0
+    peaks = []
+
+    t0 = time.perf_counter()
+    for chunk in audio:
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        results = await asyncio.gather(*(s.process_chunk(chunk) for s in streams))
+        if trace:
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        events += sum(r is not None for r in results)
+    elapsed = time.perf_counter() - t0
+    for s in streams:
+        s.close()
+
+    result = {"sessions": sessions, "events": events}
+    if trace:
+        result["alloc_peak_kb_per_chunk"] = float(np.mean(peaks)) / sessions / 1024
+    else:
+        result["us_per_chunk"] = elapsed / n / sessions * 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--chunk-ms", type=float, default=200.0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for sessions in args.sessions:
+        timed = asyncio.run(run(sessions, args.chunks, args.chunk_ms, trace=False))
+        tracemalloc.start()
+        traced = asyncio.run(run(sessions, args.chunks // 5, args.chunk_ms, trace=True))
+        tracemalloc.stop()
+        results.append({**timed, **traced})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['sessions']:>3} sessions  {r['us_per_chunk']:8.1f} µs per chunk per session  "
+            f"{r['alloc_peak_kb_per_chunk']:6.1f} KB peak allocation per chunk  "
+            f"({r['events']} events)"
+        )
+
+
+if __name__ == "__main__":
+    main()
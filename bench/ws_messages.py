@@ -0,0 +1,130 @@
+"""Benchmark: WebSocket frames and server CPU for the text side of a turn.
+
+--sessions clients, in a separate process, each receive the non-audio
+messages of --turns replies over real loopback WebSocket connections: the
+statuses and events of a turn, the ASR result, then the LLM reply one token
+every 1/--tokens-per-s seconds. Compares one JSON frame per token with
+coalesced deltas, in JSON and in the binary encoding. Reports frames/s,
+frames and bytes per turn, and server CPU time per turn.
+
+Usage: python -m bench.ws_messages [--sessions 100] [--turns 3] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import re
+import time
+
+import websockets
+
+from bench.stubs import DEFAULT_REPLY, DEFAULT_TRANSCRIPT
+from server.config import settings
+from server.outbox import Outbox
+
+MODES = {
+    "per-token json": (0, False),
+    "coalesced json": (settings.text_coalesce_ms, False),
+    "coalesced binary": (settings.text_coalesce_ms, True),
+}
+
+
+async def turn(out: Outbox, tokens: list[str], token_s: float):
+    await out.vad("speech_start")
+    await out.status("listening")
+    await out.vad("speech_end")
+    await out.status("thinking")
+    await out.asr(DEFAULT_TRANSCRIPT)
+    await out.status("speaking")
+    for token in tokens:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * token_s)
+        await out.text(token)
+    await out.text("", done=True)
+    await out.status("ready")
+
+
+def clients(port: int, sessions: int):
+    async def client():
+        async with websockets.connect(f"ws://127.0.0.1:{port}") as ws:
+            async for _ in ws:
+                pass
+
+    async def main():
+        await asyncio.gather(*(client() for _ in range(sessions)))
+
+    asyncio.run(main())
+
+
+async def run(mode: str, args) -> dict:
+    coalesce_ms, binary = MODES[mode]
+    tokens = re.findall(r"\S+\s*", DEFAULT_REPLY)
+    tokens = (tokens * (args.tokens // len(tokens) + 1))[: args.tokens]
+    frames = sent = 0
+    done = asyncio.Event()
+    finished = 0
+
+    async def handler(ws):
+        nonlocal frames, sent, finished
+
+        async def send(data: bytes):
+            nonlocal sent
+            sent += len(data)
+            await ws.send(data)
+
+        out = Outbox(send, coalesce_ms, settings.text_coalesce_bytes)
+        out.binary = binary
+        for _ in range(args.turns):
+            await turn(out, tokens, 1 / args.tokens_per_s)
+        await out.drain()
+        frames += out.frames
+        out.close()
+        finished += 1
+        if finished == args.sessions:
+            done.set()
+
+    async with websockets.serve(handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        proc = multiprocessing.Process(target=clients, args=(port, args.sessions))
+        cpu, t0 = time.process_time(), time.perf_counter()
+        proc.start()
+        await done.wait()
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - t0
+    proc.join()
+
+    turns = args.sessions * args.turns
+    return {
+        "mode": mode,
+        "frames_per_s": frames / wall,
+        "frames_per_turn": frames / turns,
+        "bytes_per_turn": sent / turns,
+        "cpu_ms_per_turn": cpu / turns * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=60, help="LLM tokens per reply")
+    parser.add_argument("--tokens-per-s", type=float, default=45.0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(mode, args)) for mode in MODES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for r in results:
+        print(
+            f"{r['mode']:<17} {r['frames_per_s']:6.0f} frames/s  "
+            f"{r['frames_per_turn']:5.1f} frames/turn  "
+            f"{r['bytes_per_turn']:6.0f} bytes/turn  CPU {r['cpu_ms_per_turn']:5.2f} ms/turn"
+        )
+
+
+if __name__ == "__main__":
+    main()
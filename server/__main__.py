@@ -1,6 +1,15 @@
-"""Entry point: python -m server"""
+"""Entry point: python -m server
+
+With workers > 1, the models are loaded once by a model server process
+(server.model_server) and uvicorn runs that many WebSocket workers, which
+reach the models over a Unix socket.
+"""
 
 import logging
+import os
+import subprocess
+import sys
+import tempfile
 
 import uvicorn
 
@@ -13,12 +22,32 @@ logging.basicConfig(
 
 
 def main():
-    uvicorn.run(
-        "server.app:app",
-        host=settings.host,
-        port=settings.port,
-        log_level="info",
+    if settings.workers <= 1:
+        uvicorn.run(
+            "server.app:app",
+            host=settings.host,
+            port=settings.port,
+            log_level="info",
+        )
+        return
+
+    path = settings.model_server_socket or os.path.join(
+        tempfile.gettempdir(), f"wybe-models-{os.getpid()}.sock"
     )
+    # Workers and the model server read the socket path from the environment.
+    os.environ["MODEL_SERVER_SOCKET"] = path
+    model_server = subprocess.Popen([sys.executable, "-m", "server.model_server"])
+    try:
+        uvicorn.run(
+            "server.app:app",
+            host=settings.host,
+            port=settings.port,
+            workers=settings.workers,
+            log_level="info",
+        )
+    finally:
+        model_server.terminate()
+        model_server.wait()
 
 
 if __name__ == "__main__":
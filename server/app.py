@@ -1,13 +1,18 @@
 """FastAPI application with WebSocket voice conversation endpoint."""
 
+import asyncio
+import json
 import logging
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
+from server import metrics
 from server.config import settings
+from server.history import prompt_token_stats
 from server.models.manager import models
+from server.outbox import outbox_stats
 from server.pipeline import ConversationSession
 from server.protocol import MsgType, error_msg, status_msg, unpack
 
@@ -16,14 +21,69 @@ log = logging.getLogger(__name__)
 app = FastAPI(title="Wybe Voice NO", version="0.1.0")
 
 
+# Models load and warm up in the background so /health can report progress meanwhile.
+_loading: asyncio.Task | None = None
+
+
 @app.on_event("startup")
 async def startup():
-    models.load_all()
+    global _loading
+    _loading = asyncio.create_task(_start())
+    _loading.add_done_callback(_loaded)
+
+
+async def _start():
+    # Models installed before startup (bench stubs) are used as they are.
+    if not models.ready:
+        if settings.model_server_socket:
+            await models.connect(settings.model_server_socket)
+        else:
+            await asyncio.to_thread(models.load_all)
+    if not models.warmed:
+        await models.warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Sessions are closed by now: leave the model server before it goes away.
+    await models.close()
+
+
+def _loaded(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Startup failed: %s", task.exception())
 
 
 @app.get("/health")
 async def health():
-    return JSONResponse({"status": "ok", "models_loaded": models.tts is not None})
+    """Readiness per model; 503 until every model is loaded and warmed up."""
+    if models.ready and models.warmed:
+        status = "ok"
+    elif _loading is not None and _loading.done():
+        status = "error"
+    else:
+        status = "warming" if models.ready else "loading"
+    return JSONResponse(status_code=200 if status == "ok" else 503, content={
+        "status": status,
+        "models_loaded": models.ready,
+        "models": models.model_status(),
+        "startup": {
+            name: [round(start, 2), end if end is None else round(end, 2)]
+            for name, (start, end) in models.timeline.items()
+        },
+        "warmup": models.warmup,
+        "schedulers": models.scheduler_stats(),
+        "prompt_tokens": prompt_token_stats(),
+        "outbox": outbox_stats(),
+        "tts_cache": models.tts.cache.stats() if models.tts is not None else None,
+    })
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Stage latency histograms in the Prometheus text format."""
+    text = metrics.render() + models.remote_metrics()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
@@ -39,11 +99,18 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def ws_conversation(ws: WebSocket):
     await ws.accept()
     log.info("WebSocket connected: %s", ws.client)
+    if not (models.ready and models.warmed):
+        await ws.send_bytes(error_msg("Models are still loading, try again shortly"))
+        await ws.close(code=1013)  # Try Again Later
+        return
 
     async def send_bytes(data: bytes):
         await ws.send_bytes(data)
 
-    session = ConversationSession(send_fn=send_bytes)
+    async def drop():
+        await ws.close(code=1008, reason="Client is not receiving")
+
+    session = ConversationSession(send_fn=send_bytes, close_fn=drop)
     await ws.send_bytes(status_msg("ready"))
 
     try:
@@ -53,9 +120,16 @@ async def ws_conversation(ws: WebSocket):
 
             if msg_type == MsgType.AUDIO_IN:
                 await session.handle_audio(payload)
+            elif msg_type == MsgType.AUDIO_IN_RAW:
+                await session.handle_raw_audio(payload)
             elif msg_type == MsgType.HANDSHAKE:
                 log.info("Handshake received")
-                await ws.send_bytes(status_msg("ready"))
+                try:
+                    session.configure(json.loads(payload) if payload else {})
+                except ValueError as e:
+                    await session.out.error(str(e))
+                    continue
+                await session.out.status("ready")
             else:
                 log.warning("Unknown message type: %s", msg_type)
 
@@ -67,3 +141,5 @@ async def ws_conversation(ws: WebSocket):
             await ws.send_bytes(error_msg(str(e)))
         except Exception:
             pass
+    finally:
+        await session.close()
@@ -1,11 +1,25 @@
-"""Audio decoding utilities — WebM/Opus from browser to PCM numpy arrays."""
+"""Audio codec utilities — WebM/Opus from browser to PCM numpy arrays, and Opus back."""
 
+import asyncio
 import io
 import subprocess
 import tempfile
 
+import av
 import numpy as np
 
+# EBML magic that starts every WebM container. MediaRecorder sends it once,
+# at the beginning of a recording; later chunks are bare cluster fragments.
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+# Upper bound on how long decode() waits for ffmpeg's first PCM after the
+# bytes just written; it returns as soon as any arrives. Anything later is
+# returned by the next call.
+_DECODE_WAIT_S = 0.05
+
+# How much of a streaming ffmpeg's stderr is kept for the error message.
+_STDERR_TAIL_BYTES = 4096
+
 
 def decode_webm_opus(data: bytes, target_sr: int = 16000) -> np.ndarray:
     """Decode WebM/Opus audio bytes to mono float32 numpy array at target sample rate.
@@ -37,10 +51,249 @@ def decode_webm_opus(data: bytes, target_sr: int = 16000) -> np.ndarray:
         return pcm
 
 
+class StreamingOpusDecoder:
+    """Long-lived ffmpeg process that decodes one continuous WebM/Opus stream.
+
+    The browser's MediaRecorder emits the container header once and then
+    cluster fragments every timeslice. Piping them all into the same ffmpeg
+    stdin keeps the demuxer state from the first chunk, so each chunk costs a
+    pipe write rather than a temp file and a process spawn.
+    """
+
+    def __init__(self, target_sr: int = 16000):
+        self.target_sr = target_sr
+        self._proc: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+        self._stderr_reader: asyncio.Task | None = None
+        self._pcm = bytearray()
+        self._stderr = bytearray()
+        self._ready = asyncio.Event()
+
+    async def _start(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-loglevel", "error",
+            "-fflags", "+nobuffer",
+            "-probesize", "32",
+            "-analyzeduration", "0",
+            "-f", "webm",
+            "-i", "pipe:0",
+            "-f", "f32le",
+            "-acodec", "pcm_f32le",
+            "-ac", "1",
+            "-ar", str(self.target_sr),
+            "-flush_packets", "1",
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._pcm.clear()
+        self._stderr.clear()
+        self._reader = asyncio.create_task(self._read_loop(self._proc))
+        # ffmpeg logs a line per corrupt packet; unread, a full pipe would
+        # block it and, with it, the stdin writes of this session.
+        self._stderr_reader = asyncio.create_task(self._read_stderr(self._proc))
+
+    async def _read_loop(self, proc: asyncio.subprocess.Process):
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            self._pcm += chunk
+            self._ready.set()
+        self._ready.set()
+
+    async def _read_stderr(self, proc: asyncio.subprocess.Process):
+        """Drain ffmpeg's stderr, keeping only its tail."""
+        while chunk := await proc.stderr.read(4096):
+            self._stderr += chunk
+            del self._stderr[:-_STDERR_TAIL_BYTES]
+
+    def _take(self) -> np.ndarray:
+        """Pop all complete float32 samples decoded so far."""
+        n = len(self._pcm) - len(self._pcm) % 4
+        if n == 0:
+            return np.zeros(0, dtype=np.float32)
+        pcm = np.frombuffer(self._pcm, dtype=np.float32, count=n // 4).copy()
+        del self._pcm[:n]
+        return pcm
+
+    async def decode(self, data: bytes) -> np.ndarray:
+        """Feed the next WebM chunk and return the PCM decoded so far.
+
+        Returns:
+            float32 numpy array, mono, at target_sr. May be empty while
+            ffmpeg is still buffering the container header.
+        """
+        tail = None
+        if data[:4] == EBML_MAGIC and self._proc is not None:
+            # Client restarted its recorder — a new container begins. The old
+            # stream's last PCM still belongs to the conversation.
+            tail = await self.flush()
+
+        started = self._proc is None or self._proc.returncode is not None
+        if started:
+            await self._start()
+
+        self._ready.clear()
+        try:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            try:
+                await asyncio.wait_for(self._stderr_reader, 1.0)
+            except asyncio.TimeoutError:
+                pass
+            stderr = self._stderr.decode(errors="replace")
+            await self.close()
+            raise RuntimeError(f"ffmpeg decode failed: {stderr}")
+
+        # PCM already waiting goes out at once; otherwise wait for ffmpeg's
+        # first output for these bytes, not for all of it. A process just
+        # spawned is still starting up: its first PCM comes with the next call.
+        if len(self._pcm) < 4 and not started:
+            try:
+                await asyncio.wait_for(self._ready.wait(), _DECODE_WAIT_S)
+            except asyncio.TimeoutError:
+                pass
+
+        pcm = self._take()
+        return pcm if tail is None else np.concatenate([tail, pcm])
+
+    async def flush(self) -> np.ndarray:
+        """End the current stream and return the PCM ffmpeg was still holding."""
+        if self._proc is None:
+            return np.zeros(0, dtype=np.float32)
+        self._proc.stdin.close()
+        await self._reader
+        pcm = self._take()
+        await self.close()
+        return pcm
+
+    async def close(self):
+        """Terminate the ffmpeg process and drop any undelivered PCM."""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.stdin and not proc.stdin.is_closing():
+            proc.stdin.close()
+        try:
+            await asyncio.wait_for(proc.wait(), 1.0)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+        for task in (self._reader, self._stderr_reader):
+            if task is not None:
+                task.cancel()
+        self._reader = self._stderr_reader = None
+        self._pcm.clear()
+
+
+class OpusFrameDecoder:
+    """Decodes bare Opus packets (no container) straight to PCM with PyAV.
+
+    The decoder always outputs 48 kHz; a resampler that lives as long as the
+    session takes it to target_sr without gaps between packets.
+    """
+
+    def __init__(self, target_sr: int = 16000):
+        self.target_sr = target_sr
+        self._codec = av.CodecContext.create("opus", "r")
+        self._codec.layout = "mono"  # bare packets carry no header saying so
+        self._resampler = av.AudioResampler(format="flt", layout="mono", rate=target_sr)
+
+    def decode(self, packet: bytes) -> np.ndarray:
+        """Decode one Opus packet to a mono float32 numpy array at target_sr."""
+        try:
+            frames = [
+                out.to_ndarray().reshape(-1)
+                for frame in self._codec.decode(av.Packet(packet))
+                for out in self._resampler.resample(frame)
+            ]
+        except av.error.FFmpegError as e:
+            raise RuntimeError(f"opus decode failed: {e}") from e
+        if not frames:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(frames)
+
+
+class OpusFrameEncoder:
+    """Encodes a session's TTS output into bare 20 ms Opus packets.
+
+    One encoder lives as long as the session, so the codec state carries
+    across chunks and sentences. Samples that do not fill a whole frame wait
+    for the next chunk; flush() pads them out at the end of a reply. Uses the
+    libopus build that ships with PyAV.
+    """
+
+    FRAME_MS = 20
+
+    def __init__(self, sample_rate: int = 24000, bitrate: int = 24000):
+        if sample_rate not in (8000, 12000, 16000, 24000, 48000):
+            raise ValueError(f"Opus cannot encode {sample_rate} Hz audio")
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * self.FRAME_MS // 1000
+        self._codec = av.CodecContext.create("libopus", "w")
+        self._codec.sample_rate = sample_rate
+        self._codec.layout = "mono"
+        self._codec.format = "s16"
+        self._codec.bit_rate = bitrate
+        self._codec.options = {"frame_duration": str(self.FRAME_MS), "application": "voip"}
+        self._codec.open()
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._pts = 0
+
+    def encode(self, audio: np.ndarray) -> list[bytes]:
+        """Encode float32 [-1, 1] samples; returns the packets completed so far."""
+        pcm = np.concatenate([self._pending, _to_s16(audio)])
+        whole = len(pcm) - len(pcm) % self.frame_samples
+        self._pending = pcm[whole:]
+        packets = []
+        for start in range(0, whole, self.frame_samples):
+            frame = av.AudioFrame.from_ndarray(
+                pcm[None, start : start + self.frame_samples], format="s16", layout="mono"
+            )
+            frame.sample_rate = self.sample_rate
+            frame.pts = self._pts
+            self._pts += self.frame_samples
+            packets += [bytes(p) for p in self._codec.encode(frame)]
+        return packets
+
+    def flush(self) -> list[bytes]:
+        """Pad the leftover samples with silence to a last whole frame."""
+        if not len(self._pending):
+            return []
+        pad = np.zeros(self.frame_samples - len(self._pending), dtype=np.float32)
+        return self.encode(pad)
+
+    def reset(self):
+        """Drop leftover samples of an interrupted reply."""
+        self._pending = np.zeros(0, dtype=np.int16)
+
+
+def decode_raw_pcm(data: bytes, fmt: str) -> np.ndarray:
+    """View raw little-endian PCM bytes as a float32 numpy array.
+
+    pcm_f32le is returned as a zero-copy view of data; pcm_s16le is scaled
+    to [-1, 1].
+    """
+    dtype = np.dtype("<f4") if fmt == "pcm_f32le" else np.dtype("<i2")
+    if len(data) % dtype.itemsize:
+        raise RuntimeError(f"{fmt} payload of {len(data)} bytes is not whole samples")
+    samples = np.frombuffer(data, dtype=dtype)
+    if fmt == "pcm_f32le":
+        return samples
+    return samples.astype(np.float32) / 32768.0
+
+
+def _to_s16(audio: np.ndarray) -> np.ndarray:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
 def pcm_f32_to_s16le(audio: np.ndarray) -> bytes:
     """Convert float32 [-1, 1] numpy array to s16le bytes for browser playback."""
-    clipped = np.clip(audio, -1.0, 1.0)
-    return (clipped * 32767).astype(np.int16).tobytes()
+    return _to_s16(audio).tobytes()
 
 
 def concat_audio_chunks(chunks: list[np.ndarray]) -> np.ndarray:
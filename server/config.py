@@ -10,14 +10,29 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8080
 
+    # Workers — more than 1 runs that many WebSocket processes around one model server
+    workers: int = 1
+    model_server_socket: str = ""  # Unix socket of the model server; "" = models in this process
+
     # HuggingFace
     hf_token: str = ""
 
+    # Startup
+    model_cache_dir: str = ""  # Download cache for all models; "" = the default HuggingFace cache
+    offline: bool = False  # Resolve every model from the cache without network access
+    artifact_cache_dir: str = ""  # Converted models (CT2 Whisper) reused on later boots; "" = off
+    parallel_model_loading: bool = True  # Load independent models concurrently
+    warmup: bool = True  # Run dummy inputs through every model before reporting ready
+
     # ASR — Whisper large-v3-turbo (great Norwegian support, pre-built CT2)
     asr_model: str = "large-v3-turbo"
     asr_compute_type: str = "float16"
     asr_beam_size: int = 1
     asr_language: str = "no"
+    asr_streaming: bool = True  # Transcribe while the user speaks; only the tail is left at speech end
+    asr_partial_interval_ms: int = 500  # How often the growing utterance is re-decoded for partials
+    asr_batch_window_ms: int = 50  # Utterances ending this close together share one Whisper call
+    asr_max_batch: int = 8  # Utterances per batched Whisper call; 1 disables batching
 
     # LLM — NorMistral
     llm_model: str = "norallm/normistral-7b-warm-instruct"
@@ -28,10 +43,24 @@ class Settings(BaseSettings):
     llm_temperature: float = 0.3
     llm_repeat_penalty: float = 1.0  # Disabled — NorMistral is sensitive to repeat penalty
     llm_top_p: float = 0.9
+    llm_top_k: int = 40  # Candidates top_p and min_p choose from; 0 = the whole vocabulary
+    llm_min_p: float = 0.05  # Drop tokens less likely than this share of the most likely one
+    llm_token_queue_size: int = 32  # Tokens buffered between the decode thread and the session
+    llm_parallel_sequences: int = 4  # Conversations decoded together (continuous batching); 1 = one at a time
+    llm_batch_tokens: int = 512  # Max tokens per batched decode step (prompt prefill is chunked to this)
+    llm_kv_host_cache_mb: int = 2048  # Host RAM for KV state of idle sessions, reused on their next turn
 
     # TTS — Chatterbox Norwegian
     tts_model: str = "akhbar/chatterbox-tts-norwegian"
     tts_speaker_wav: str = ""  # Path to reference speaker wav for voice cloning
+    tts_voices_dir: str = "voices"  # <voice id>.wav files sessions can pick in the handshake
+    tts_voice_cache_size: int = 8  # Voice conditionings kept in memory
+    tts_cache_mb: int = 64  # Synthesized sentences kept in memory (LRU)
+    tts_cache_dir: str = ""  # Directory for cached sentences that survive restarts; "" = memory only
+    tts_cache_disk_mb: int = 1024
+    tts_cache_prewarm: str = ""  # Text file of phrases (one per line) synthesized into the cache at startup
+    tts_first_chunk_min_chars: int = 20  # A reply's first TTS chunk ends at a comma past this; 0 = off
+    tts_max_chunk_chars: int = 150  # Longer sentences are split at clause boundaries; 0 = no limit
     tts_exaggeration: float = 1.0  # Norwegian model works best at 1.0
     tts_cfg_weight: float = 0.5
 
@@ -39,10 +68,32 @@ class Settings(BaseSettings):
     vad_threshold: float = 0.5
     vad_min_speech_ms: int = 250
     vad_min_silence_ms: int = 700
+    vad_pause_ms: int = 250  # Silence that starts a speculative turn, released at vad_min_silence_ms
+    vad_batch_tick_ms: int = 5  # Wait this long to gather windows from other sessions per batch
 
     # Pipeline
     sample_rate: int = 16000
     tts_sample_rate: int = 24000
+    text_coalesce_ms: int = 40  # LLM text deltas are gathered this long into one message
+    text_coalesce_bytes: int = 256  # ...or until this much text is waiting
+    audio_lead_ms: int = 1000  # Audio sent ahead of the client's playback; the rest waits in the outbox
+    outbox_max_kb: int = 128  # Output queued per session before TTS waits to start the next sentence
+    send_timeout_ms: int = 5000  # A send stalled this long, or playback starved as long, drops the client
+    opus_out_bitrate: int = 24000  # bits/s of AUDIO_OUT_OPUS for clients that ask for "opus" output
+    scheduler_max_queue: int = 16  # Jobs waiting per model before new work is refused as busy
+    speculative_turns: bool = True  # Run ASR and the LLM during the end-of-speech silence
+    barge_in: bool = True  # User speech while Wybe is answering interrupts the reply
+    metrics: bool = True  # Record stage latency histograms, served at /metrics
+
+    # History — prompt kept within llm_context_length minus room for the reply
+    history_compact_ratio: float = 0.75  # Summarize older turns once the prompt passes this share of the budget
+    history_keep_recent: int = 4  # Newest messages always sent verbatim
+    history_summary_prefix: str = "Sammendrag av samtalen så langt: "
+    history_summary_prompt: str = (
+        "Du oppsummerer samtaler mellom en bruker og assistenten Wybe. "
+        "Skriv et kort sammendrag på norsk bokmål av det som er sagt, med navn, "
+        "fakta, ønsker og avtaler som er viktige for resten av samtalen."
+    )
 
     # System prompt
     system_prompt: str = (
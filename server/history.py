@@ -0,0 +1,136 @@
+"""Conversation history kept within the LLM's context window.
+
+ConversationHistory holds every message of a conversation but builds the LLM
+prompt under a token budget (llm_context_length minus room for the reply).
+Token counts come from the model's tokenizer and are cached per message.
+When the prompt grows past a fraction of the budget, older turns are folded
+into a running summary. The summary is generated between turns, off the
+critical path. Until it is ready, and whenever a prompt still does not fit,
+the oldest turns are left out of the prompt.
+"""
+
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Prompt sizes of recent turns across all sessions, for monitoring.
+_prompt_tokens: deque[int] = deque(maxlen=1000)
+
+
+def prompt_token_stats() -> dict:
+    """Distribution of recent per-turn prompt sizes, in tokens."""
+    counts = np.array(_prompt_tokens) if _prompt_tokens else np.zeros(1)
+    return {
+        "turns": len(_prompt_tokens),
+        "p50": int(np.percentile(counts, 50)),
+        "p95": int(np.percentile(counts, 95)),
+        "max": int(counts.max()),
+    }
+
+
+class ConversationHistory:
+    """Messages of one conversation and the token-budgeted prompt built from them.
+
+    Args:
+        system_prompt: content of the leading system message, always sent.
+        count_tokens: returns the prompt tokens of one message, template included.
+        budget: maximum prompt tokens.
+        compact_ratio: summarize older turns once the prompt exceeds this
+            fraction of the budget.
+        keep_recent: messages at the end that are never summarized.
+        summary_prefix: text introducing the summary to the model.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        count_tokens: Callable[[dict[str, str]], int],
+        budget: int,
+        compact_ratio: float = 0.75,
+        keep_recent: int = 4,
+        summary_prefix: str = "",
+    ):
+        # Messages are only appended, or edited/removed at the end (barge-in),
+        # so indices into this list stay valid across compactions.
+        self.messages: list[dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        self.budget = budget
+        self.compact_ratio = compact_ratio
+        self.keep_recent = max(keep_recent, 1)
+        self.summary_prefix = summary_prefix
+        self.summary = ""
+        self.last_prompt_tokens = 0
+
+        self._count_tokens = count_tokens
+        self._counts: dict[tuple[str, str], int] = {}
+        self._summarized = 1  # messages[1:_summarized] are covered by the summary
+
+    def _tokens(self, message: dict[str, str]) -> int:
+        key = (message["role"], message["content"])
+        n = self._counts.get(key)
+        if n is None:
+            n = self._counts[key] = self._count_tokens(message)
+        return n
+
+    def _summary_message(self) -> dict[str, str]:
+        return {"role": "system", "content": f"{self.summary_prefix}{self.summary}"}
+
+    def prompt(self) -> list[dict[str, str]]:
+        """Messages to send to the LLM, within the token budget.
+
+        The system prompt, the summary and the newest message are always
+        included; older unsummarized turns are dropped oldest first if needed.
+        """
+        head = [self.messages[0]]
+        if self.summary:
+            head.append(self._summary_message())
+        tail = self.messages[self._summarized :]
+
+        used = sum(self._tokens(m) for m in head)
+        sizes = [self._tokens(m) for m in tail]
+        start = 0
+        total = used + sum(sizes)
+        while total > self.budget and start < len(tail) - 1:
+            total -= sizes[start]
+            start += 1
+        if start:
+            log.info("History over budget: %d oldest messages left out of the prompt", start)
+
+        self.last_prompt_tokens = total
+        _prompt_tokens.append(total)
+        return head + tail[start:]
+
+    def needs_compaction(self) -> bool:
+        """True if older turns should be summarized before the prompt fills up."""
+        if len(self.messages) - self.keep_recent <= self._summarized:
+            return False
+        head = self._tokens(self.messages[0])
+        if self.summary:
+            head += self._tokens(self._summary_message())
+        tail = sum(self._tokens(m) for m in self.messages[self._summarized :])
+        return head + tail > self.budget * self.compact_ratio
+
+    async def compact(self, summarize: Callable[[str, list[dict[str, str]]], Awaitable[str]]):
+        """Fold all but the most recent messages into the summary.
+
+        Args:
+            summarize: coroutine function taking the current summary and the
+                messages to add to it, returning the new summary.
+        """
+        end = len(self.messages) - self.keep_recent
+        if end <= self._summarized:
+            return
+        summary = await summarize(self.summary, self.messages[self._summarized : end])
+        if not summary.strip():
+            return
+
+        self.summary = summary.strip()
+        self._summarized = end
+        # Forget counts of messages that can no longer appear in a prompt.
+        live = {(m["role"], m["content"]) for m in self.messages[end:]}
+        live.add((self.messages[0]["role"], self.messages[0]["content"]))
+        self._counts = {k: v for k, v in self._counts.items() if k in live}
+        log.info("History compacted: %d messages summarized", end - 1)
@@ -0,0 +1,140 @@
+"""Latency histograms in the Prometheus text format, and per-turn traces.
+
+Stages record into module-level histograms that /metrics renders. With
+settings.metrics off, observe() returns at once, so instrumented code paths
+cost one attribute check.
+
+A TurnTrace follows one turn from the end of the user's speech to the last
+audio frame sent. Finished traces feed the turn histograms and can be sent
+to clients that ask for them in the handshake ("debug": true).
+"""
+
+import bisect
+import threading
+import time
+
+from server.config import settings
+
+# Upper bounds in seconds: 1 ms to 30 s.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+BYTES_BUCKETS = tuple(2**k for k in range(12, 24, 2))  # 4 KiB to 8 MiB
+
+_registry: list["Histogram"] = []
+
+
+class Histogram:
+    """Cumulative histogram with an optional label; safe to observe from model threads."""
+
+    def __init__(
+        self, name: str, description: str, buckets=LATENCY_BUCKETS, label: str | None = None
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series: dict[str | None, list] = {}  # label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, label: str | None = None):
+        if not settings.metrics:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for label, counts, total, count in series:
+            prefix = f'{self.label}="{label}",' if self.label else ""
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            labels = f"{{{prefix[:-1]}}}" if prefix else ""
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """Every histogram in the Prometheus text exposition format."""
+    return "\n".join(line for h in _registry for line in h.render()) + "\n"
+
+
+DECODE = Histogram("voice_decode_seconds", "Input audio decode time per message.", label="format")
+VAD = Histogram("voice_vad_seconds", "VAD time per audio chunk, batching wait included.")
+QUEUE_WAIT = Histogram(
+    "voice_queue_wait_seconds", "Wait for a model's executor or batch slot.", label="model"
+)
+ASR = Histogram("voice_asr_seconds", "Whisper decode time per call.", label="call")
+LLM_FIRST_TOKEN = Histogram(
+    "voice_llm_first_token_seconds", "LLM request to first token, queueing and prefill included."
+)
+LLM_RATE = Histogram(
+    "voice_llm_tokens_per_second", "LLM decode rate after the first token.", RATE_BUCKETS
+)
+TTS_FIRST_CHUNK = Histogram("voice_tts_first_chunk_seconds", "TTS model time to first audio chunk.")
+TTS_RTF = Histogram(
+    "voice_tts_real_time_factor", "TTS model time per second of audio synthesized.", RATIO_BUCKETS
+)
+SEND = Histogram("voice_send_seconds", "WebSocket send time per message.", label="kind")
+OUTBOX_PEAK = Histogram(
+    "voice_outbox_peak_bytes", "Most output queued at once in a session.", BYTES_BUCKETS
+)
+TURN = Histogram(
+    "voice_turn_seconds", "Time from the end of speech to a turn milestone.", label="mark"
+)
+
+
+class TurnTrace:
+    """Milestones of one turn, timed from the end of the user's speech.
+
+    A speculative turn starts before speech has ended; its milestones are
+    counted from restart(), which the session calls once speech_end
+    confirms it, and those reached before are reported as 0.
+    """
+
+    MARKS = ("asr_done", "first_token", "first_audio", "last_audio")
+
+    def __init__(self, speculative: bool = False):
+        self.start = time.monotonic()
+        self.speculative = speculative
+        self.marks: dict[str, float] = {}
+        self.tokens = 0
+        self.audio_s = 0.0
+
+    def restart(self):
+        self.start = time.monotonic()
+
+    def mark(self, name: str):
+        """Record a milestone the first time it is reached."""
+        if name not in self.marks:
+            self.marks[name] = time.monotonic()
+
+    def finish(self) -> dict:
+        """Observe the turn histograms; returns the trace in milliseconds."""
+        trace = {"speculative": self.speculative}
+        for name in self.MARKS:
+            if name in self.marks:
+                elapsed = max(0.0, self.marks[name] - self.start)
+                TURN.observe(elapsed, name)
+                trace[f"{name}_ms"] = round(elapsed * 1000, 1)
+        trace["tokens"] = self.tokens
+        if "first_token" in self.marks and "llm_done" in self.marks and self.tokens > 1:
+            decode_s = self.marks["llm_done"] - self.marks["first_token"]
+            if decode_s > 0:
+                trace["tokens_per_s"] = round((self.tokens - 1) / decode_s, 1)
+        trace["audio_s"] = round(self.audio_s, 2)
+        return trace
@@ -0,0 +1,163 @@
+"""Model server: the GPU models in one process, shared by the WebSocket workers.
+
+Started by `python -m server` when settings.workers > 1, or on its own with
+`python -m server.model_server`. Loads and warms up the models, then serves
+the server.models.remote proxies on settings.model_server_socket. Workers
+connect once it is listening, so they never see a cold model.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import aclosing
+
+import numpy as np
+
+from server import metrics
+from server.config import settings
+from server.models.manager import models
+from server.models.remote import error_header, pcm_bytes, read_frame, write_frame
+
+log = logging.getLogger(__name__)
+
+STATS_INTERVAL_S = 1.0
+# Each worker runs its own VAD (see ModelManager.connect).
+SERVED_MODELS = ("asr", "llm", "tts")
+
+
+def _audio(payload: bytes) -> np.ndarray:
+    return np.frombuffer(payload, dtype=np.float32)
+
+
+async def _transcribe(payload: bytes, session: str | None):
+    return await models.asr.atranscribe(_audio(payload), session=session), b""
+
+
+async def _words(payload: bytes, prompt: str, session: str | None, priority: bool):
+    words = await models.asr.atranscribe_words(_audio(payload), prompt, session, priority)
+    return words, b""
+
+
+async def _prepare_voice(payload: bytes, voice: str, session: str | None):
+    await models.tts.aprepare_voice(voice, session=session)
+    return None, b""
+
+
+async def _generate(payload: bytes, messages: list[dict[str, str]], session: str | None):
+    async with aclosing(models.llm.agenerate_stream(messages, session=session)) as tokens:
+        async for token in tokens:
+            yield {"token": token}, b""
+
+
+async def _synthesize(
+    payload: bytes, text: str, session: str | None, priority: bool, voice: str | None
+):
+    stream = models.tts.asynthesize_stream(text, session=session, priority=priority, voice=voice)
+    async with aclosing(stream) as chunks:
+        async for chunk in chunks:
+            yield {}, pcm_bytes(chunk)
+
+
+CALLS = {"asr.transcribe": _transcribe, "asr.words": _words, "tts.prepare_voice": _prepare_voice}
+STREAMS = {"llm.generate": _generate, "tts.synthesize": _synthesize}
+
+
+def _stats() -> dict:
+    return {
+        "schedulers": models.scheduler_stats(),
+        "tts_cache": models.tts.cache.stats(),
+        "metrics": metrics.render(),
+    }
+
+
+async def _answer(writer: asyncio.StreamWriter, header: dict, payload: bytes):
+    rid, op, args = header["id"], header["op"], header["args"]
+    try:
+        if op in STREAMS:
+            async with aclosing(STREAMS[op](payload, **args)) as items:
+                async for item, data in items:
+                    write_frame(writer, {"id": rid, **item}, data)
+                    await writer.drain()
+            write_frame(writer, {"id": rid, "end": True})
+        else:
+            result, data = await CALLS[op](payload, **args)
+            write_frame(writer, {"id": rid, "end": True, "result": result}, data)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if not isinstance(e, (ValueError, RuntimeError)):
+            log.exception("%s failed", op)
+        write_frame(writer, {"id": rid, **error_header(e)})
+    await writer.drain()
+
+
+async def _push_stats(writer: asyncio.StreamWriter):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL_S)
+        write_frame(writer, {"op": "stats", "stats": _stats()})
+        await writer.drain()
+
+
+async def _serve_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Answer one worker's requests, each in its own task, until it disconnects."""
+    write_frame(
+        writer,
+        {"op": "hello", "tts_sr": models.tts.sr, "warmup": models.warmup, "stats": _stats()},
+    )
+    tasks: dict[int, asyncio.Task] = {}
+    sessions: set[str] = set()
+    pusher = asyncio.create_task(_push_stats(writer))
+    try:
+        while True:
+            header, payload = await read_frame(reader)
+            op, args = header["op"], header["args"]
+            if op == "cancel":
+                if (task := tasks.get(args["id"])) is not None:
+                    task.cancel()
+            elif op == "llm.forget":
+                sessions.discard(args["session"])
+                models.llm.forget(args["session"])
+            else:
+                if op == "llm.generate" and args["session"] is not None:
+                    sessions.add(args["session"])
+                rid = header["id"]
+                tasks[rid] = asyncio.create_task(_answer(writer, header, payload))
+                tasks[rid].add_done_callback(lambda _, rid=rid: tasks.pop(rid, None))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        log.info("Worker disconnected")
+    finally:
+        pusher.cancel()
+        for task in list(tasks.values()):
+            task.cancel()
+        # The worker's sessions are gone with it.
+        for session in sessions:
+            models.llm.forget(session)
+        writer.close()
+
+
+async def serve(path: str):
+    """Load and warm up the models (unless already installed), then serve workers on path."""
+    if not models.ready:
+        await asyncio.to_thread(models.load_all, SERVED_MODELS)
+    if not models.warmed:
+        await models.warm_up()
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a previous run
+    server = await asyncio.start_unix_server(_serve_worker, path)
+    log.info("Model server listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    if not settings.model_server_socket:
+        raise SystemExit("Set MODEL_SERVER_SOCKET to the Unix socket path to serve on")
+    asyncio.run(serve(settings.model_server_socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,316 @@
 """NB-Whisper ASR wrapper using faster-whisper.
 
-Loads NbAiLab/nb-whisper-large-distil-turbo-beta with CTranslate2 backend.
-faster-whisper auto-converts HuggingFace models on first load.
+Loads the Whisper model named by settings.asr_model with the CTranslate2
+backend. Checkpoints in Transformers format (e.g. NbAiLab/nb-whisper-*) are
+converted once into artifact_cache_dir; see server.models.hub.
+
+IncrementalTranscript transcribes an utterance while it is still being spoken,
+committing words with LocalAgreement: a word becomes final once two
+consecutive decodes of the growing audio agree on it. Committed audio is
+dropped from later decodes, so at the end of speech only the unstable tail
+is left to transcribe, and nothing at all if the last partial decode already
+reached past the end of speech into the VAD's trailing silence.
+
+Whole-utterance transcriptions from different sessions that arrive within
+asr_batch_window_ms of each other are decoded together in one call to
+faster-whisper's batched pipeline.
 """
 
+import asyncio
+import bisect
 import logging
+import re
+import time
+from collections.abc import Hashable
 
 import numpy as np
-from faster_whisper import WhisperModel
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 
+from server import metrics
 from server.config import settings
+from server.models.hub import whisper_model_path
+from server.models.scheduler import InferenceScheduler
 
 log = logging.getLogger(__name__)
 
 
-class ASR:
-    def __init__(self):
-        log.info("Loading ASR model: %s (compute_type=%s)", settings.asr_model, settings.asr_compute_type)
-        self.model = WhisperModel(
-            settings.asr_model,
-            device="cuda",
-            compute_type=settings.asr_compute_type,
+# Committed text passed to Whisper as context when decoding the tail.
+_PROMPT_CHARS = 200
+
+# Whisper decodes at most 30 s per batch element.
+_MAX_CLIP_S = 30
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+class IncrementalTranscript:
+    """Streaming transcription state for one utterance.
+
+    Feed the whole utterance so far to update() as it grows, then call
+    finish() with the complete audio at the end of speech.
+    """
+
+    def __init__(self, asr: "ASR", session: Hashable = None):
+        self._asr = asr
+        self._session = session
+        self.committed: list[str] = []
+        self._committed_end = 0.0  # seconds into the utterance covered by committed words
+        self._decoded_end = 0.0  # seconds of audio the latest decode saw
+        self._hypothesis: list[tuple[float, float, str]] = []
+
+    @property
+    def text(self) -> str:
+        """Committed words followed by the current tentative ones."""
+        return " ".join(self.committed + [w for _, _, w in self._hypothesis])
+
+    async def _decode_tail(self, audio: np.ndarray, priority: bool) -> list[tuple[float, float, str]]:
+        # An update() may commit more words while this decode runs: stick to
+        # the offset the audio was cut at.
+        committed_end = self._committed_end
+        offset = int(committed_end * self._asr.sample_rate)
+        prompt = " ".join(self.committed)[-_PROMPT_CHARS:]
+        words = await self._asr.atranscribe_words(
+            audio[offset:], prompt, session=self._session, priority=priority
         )
-        log.info("ASR model loaded.")
+        return [(committed_end + start, committed_end + end, w) for start, end, w in words]
+
+    async def update(self, audio: np.ndarray) -> str:
+        """Re-decode the uncommitted part of audio and commit words two decodes agree on.
+
+        Returns:
+            The partial transcript (committed and tentative words).
+        """
+        words = await self._decode_tail(audio, priority=False)
+        self._decoded_end = len(audio) / self._asr.sample_rate
+        agreed = 0
+        for (_, _, prev), (_, _, new) in zip(self._hypothesis, words):
+            if _normalize(prev) != _normalize(new):
+                break
+            agreed += 1
+        if agreed:
+            self.committed += [w for _, _, w in words[:agreed]]
+            self._committed_end = words[agreed - 1][1]
+        self._hypothesis = words[agreed:]
+        return self.text
+
+    def covers(self, audio: np.ndarray, trailing_silence_s: float = 0.0) -> bool:
+        """True if the latest decode already heard all the speech in audio."""
+        return self._decoded_end >= len(audio) / self._asr.sample_rate - trailing_silence_s
+
+    async def finish(self, audio: np.ndarray, trailing_silence_s: float = 0.0) -> str:
+        """Complete the transcript of the whole utterance.
+
+        Args:
+            audio: the complete utterance.
+            trailing_silence_s: silence at the end of audio (the VAD's
+                endpointing delay). If the latest partial decode reached past
+                the speech into it, its tentative words are final as they are.
+                Otherwise the uncommitted tail is decoded as a priority job.
+        """
+        committed = self.committed
+        words = await self._final_tail(audio, trailing_silence_s)
+        self.committed = committed + words
+        self._hypothesis = []
+        return " ".join(self.committed)
+
+    async def peek(self, audio: np.ndarray, trailing_silence_s: float = 0.0) -> str:
+        """Transcript of audio as finish() would give it, without ending the utterance.
+
+        For a tentative end of speech: if the speaker goes on, update() and
+        finish() continue as if peek() had never been called.
+        """
+        committed = self.committed
+        return " ".join(committed + await self._final_tail(audio, trailing_silence_s))
+
+    async def _final_tail(self, audio: np.ndarray, trailing_silence_s: float) -> list[str]:
+        if self.covers(audio, trailing_silence_s):
+            words = self._hypothesis
+        else:
+            words = await self._decode_tail(audio, priority=True)
+        return [w for _, _, w in words]
+
+
+class ASR:
+    def __init__(
+        self,
+        model: WhisperModel | None = None,
+        batched: BatchedInferencePipeline | None = None,
+        batch_window_ms: int | None = None,
+        max_batch: int | None = None,
+    ):
+        """
+        Args:
+            model: an already-constructed WhisperModel (or compatible
+                stand-in); loaded from settings when omitted.
+            batched: batched pipeline over model (or compatible stand-in);
+                built from model when it is a WhisperModel.
+            batch_window_ms: how long the first utterance of a batch waits
+                for others; defaults to settings.asr_batch_window_ms.
+            max_batch: utterances per batch, 1 to disable batching; defaults
+                to settings.asr_max_batch.
+        """
+        if model is None:
+            log.info("Loading ASR model: %s (compute_type=%s)", settings.asr_model, settings.asr_compute_type)
+            model = WhisperModel(
+                whisper_model_path(settings.asr_model, settings.asr_compute_type),
+                device="cuda",
+                compute_type=settings.asr_compute_type,
+            )
+            log.info("ASR model loaded.")
+        self.model = model
+        self.sample_rate = settings.sample_rate
+        self.scheduler = InferenceScheduler("asr", max_queue=settings.scheduler_max_queue)
+
+        if batched is None and isinstance(model, WhisperModel):
+            batched = BatchedInferencePipeline(model=model)
+        self._batched = batched
+        if batch_window_ms is None:
+            batch_window_ms = settings.asr_batch_window_ms
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = settings.asr_max_batch if max_batch is None else max_batch
+        self._pending: list[tuple[np.ndarray, asyncio.Future]] = []
+        self._batcher: asyncio.Task | None = None
 
     def transcribe(self, audio: np.ndarray) -> str:
         """Transcribe audio to Norwegian text.
 
         Args:
-            audio: float32 numpy array, mono, 16kHz
+            audio: float32 numpy array, mono, 16kHz; already speech-gated, so
+                Whisper's own VAD filter is off, as in transcribe_batch.
 
         Returns:
             Transcribed text string.
         """
+        t0 = time.monotonic()
         segments, info = self.model.transcribe(
             audio,
             language=settings.asr_language,
             beam_size=settings.asr_beam_size,
-            vad_filter=True,
+            vad_filter=False,
         )
         text = " ".join(seg.text.strip() for seg in segments)
+        metrics.ASR.observe(time.monotonic() - t0, "transcribe")
         log.debug("ASR result (lang=%s, prob=%.2f): %s", info.language, info.language_probability, text)
         return text
+
+    def transcribe_batch(self, audios: list[np.ndarray]) -> list[str]:
+        """Transcribe several utterances in one batched Whisper call.
+
+        The utterances are laid end to end and each is given to the batched
+        pipeline as its own clip (split at 30 s), so every clip becomes one
+        batch element. Segments are mapped back to their utterance by start time.
+        """
+        if len(audios) == 1:
+            return [self.transcribe(audios[0])]
+
+        clips, owners = [], []
+        offset = 0
+        sr = self.sample_rate
+        step = _MAX_CLIP_S * sr
+        for i, audio in enumerate(audios):
+            for start in range(0, len(audio), step):
+                end = min(len(audio), start + step)
+                clips.append({"start": (offset + start) / sr, "end": (offset + end) / sr})
+                owners.append(i)
+            offset += len(audio)
+        if not clips:
+            return [""] * len(audios)
+
+        t0 = time.monotonic()
+        segments, _ = self._batched.transcribe(
+            np.concatenate(audios),
+            language=settings.asr_language,
+            beam_size=settings.asr_beam_size,
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=len(clips),
+        )
+        starts = [c["start"] for c in clips]
+        texts: list[list[str]] = [[] for _ in audios]
+        for seg in segments:
+            clip = max(0, bisect.bisect_right(starts, seg.start + 1e-3) - 1)
+            texts[owners[clip]].append(seg.text.strip())
+        metrics.ASR.observe(time.monotonic() - t0, "batch")
+        log.debug("ASR batch of %d utterances (%d clips)", len(audios), len(clips))
+        return [" ".join(t) for t in texts]
+
+    def transcribe_words(self, audio: np.ndarray, prompt: str = "") -> list[tuple[float, float, str]]:
+        """Transcribe audio to (start, end, word) tuples, times in seconds.
+
+        Args:
+            audio: float32 numpy array, mono, 16kHz; already speech-gated, so
+                Whisper's own VAD filter is off.
+            prompt: preceding text of the utterance, given to Whisper as context.
+        """
+        if len(audio) < self.sample_rate // 10:
+            return []
+        t0 = time.monotonic()
+        segments, _ = self.model.transcribe(
+            audio,
+            language=settings.asr_language,
+            beam_size=settings.asr_beam_size,
+            initial_prompt=prompt or None,
+            condition_on_previous_text=False,
+            word_timestamps=True,
+        )
+        words = [(w.start, w.end, w.word.strip()) for seg in segments for w in seg.words if w.word.strip()]
+        metrics.ASR.observe(time.monotonic() - t0, "words")
+        return words
+
+    async def atranscribe_words(
+        self, audio: np.ndarray, prompt: str = "", session: Hashable = None, priority: bool = False
+    ) -> list[tuple[float, float, str]]:
+        """transcribe_words on the ASR model thread once the scheduler grants a slot."""
+        return await self.scheduler.run(
+            self.transcribe_words, audio, prompt, session=session, priority=priority
+        )
+
+    def incremental(self, session: Hashable = None) -> IncrementalTranscript:
+        """Start streaming transcription of a new utterance."""
+        return IncrementalTranscript(self, session)
+
+    async def atranscribe(self, audio: np.ndarray, session: Hashable = None) -> str:
+        """Transcribe on the ASR model thread once the scheduler grants a slot.
+
+        With batching on, the utterance joins the next batch: the batch waits
+        batch_window_ms for company, then for the model as a priority job,
+        and takes every utterance pending once it gets the model.
+
+        Raises:
+            ModelBusyError: if too many transcriptions are already queued.
+        """
+        if self._batched is None or self.max_batch <= 1:
+            return await self.scheduler.run(self.transcribe, audio, session=session)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append((audio, waiter))
+        if self._batcher is None or self._batcher.done():
+            self._batcher = asyncio.create_task(self._run_batches())
+        return await waiter
+
+    async def _run_batches(self):
+        while self._pending:
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.batch_window_ms / 1000)
+            items, texts = [], []
+            try:
+                async with self.scheduler.slot(priority=True):
+                    items = self._take_batch()
+                    if items:
+                        audios = [audio for audio, _ in items]
+                        texts = await self.scheduler.execute(self.transcribe_batch, audios)
+            except Exception as e:
+                # Refused as busy before a batch was taken: fail the next one instead.
+                for _, waiter in items or self._take_batch():
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            for (_, waiter), text in zip(items, texts):
+                if not waiter.done():
+                    waiter.set_result(text)
+
+    def _take_batch(self) -> list[tuple[np.ndarray, asyncio.Future]]:
+        batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch :]
+        return [(audio, waiter) for audio, waiter in batch if not waiter.done()]
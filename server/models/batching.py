@@ -0,0 +1,543 @@
+"""Continuous batching for llama.cpp — many conversations in one context.
+
+Each active generation owns a sequence id in a shared llama.cpp context. The
+engine thread repeatedly builds one llama_batch holding, for every active
+sequence, either its next chunk of prompt tokens (prefill) or the token it
+sampled on the previous step (decode). It runs a single llama_decode over the
+batch and samples each sequence's next token from its own logits row. New
+requests join at the next step and finished ones free their KV cells at once,
+so aggregate tokens/s grows with the number of concurrent conversations
+instead of serving them one after another.
+
+KV state outlives a generation. Every sequence starts from a shared,
+precomputed copy of the system prompt, and a finished sequence stays resident
+under its session's key. The next turn only prefills the tokens past the
+longest common prefix with what the cache already holds. When a sequence id
+is needed, the least recently used idle session's state is moved to host RAM
+and restored from there if that session speaks again.
+"""
+
+import asyncio
+import codecs
+import ctypes
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Hashable
+
+import llama_cpp
+import numpy as np
+from llama_cpp import Llama
+
+from server.metrics import QUEUE_WAIT
+from server.models.scheduler import ModelBusyError
+
+log = logging.getLogger(__name__)
+
+
+def _new_context(llama: Llama, n_ctx: int, n_batch: int, n_seq: int):
+    params = llama_cpp.llama_context_default_params()
+    params.n_ctx = n_ctx
+    params.n_batch = n_batch
+    params.n_ubatch = n_batch
+    params.n_seq_max = n_seq
+    params.n_threads = llama.context_params.n_threads
+    params.n_threads_batch = llama.context_params.n_threads_batch
+    if hasattr(params, "kv_unified"):
+        params.kv_unified = True
+    init = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+    ctx = init(llama.model, params)
+    if not ctx:
+        raise RuntimeError("Failed to create batched llama.cpp context")
+    return ctx
+
+
+def _kv(ctx, op: str, *args):
+    """Call a KV-cache op (seq_rm, seq_cp, ...) across llama.cpp API renames."""
+    fn = getattr(llama_cpp, f"llama_memory_{op}", None)
+    if fn is not None:
+        return fn(llama_cpp.llama_get_memory(ctx), *args)
+    fn = getattr(llama_cpp, f"llama_kv_self_{op}", None) or getattr(llama_cpp, f"llama_kv_cache_{op}")
+    return fn(ctx, *args)
+
+
+def _common_prefix(a: list[int], b: list[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class _SessionCache:
+    """KV state a session's last generation left behind, reused by its next one.
+
+    While resident the state lives in the context under seq_id; when evicted
+    it is held in host RAM as a llama_state_seq blob.
+    """
+
+    def __init__(self):
+        self.tokens: list[int] = []  # tokens whose KV the state holds
+        self.seq_id: int | None = None
+        self.state: bytes | None = None
+        self.active = False
+
+
+class _Sequence:
+    """One generation request and its progress through the engine."""
+
+    def __init__(
+        self, prompt: list[int], max_tokens: int, session: Hashable, loop: asyncio.AbstractEventLoop
+    ):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.session = session
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.enqueued = time.monotonic()
+
+        self.seq_id: int | None = None
+        self.cache: _SessionCache | None = None
+        self.kv_tokens: list[int] = []  # tokens of this sequence in the KV cache
+        self.prefilled = 0  # prompt tokens in the KV cache (reused or submitted)
+        self.last_token: int | None = None
+        self.generated: list[int] = []
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        # Single-writer counters: produced by the engine, consumed by the loop.
+        self.produced = 0
+        self.consumed = 0
+        self.cancelled = False
+
+    def push(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            self.cancelled = True  # event loop is gone
+
+
+class ContinuousBatchScheduler:
+    """Interleaves token steps of all active conversations on one llama.cpp context.
+
+    Args:
+        llama: loaded model; its weights and tokenizer are shared, but
+            generation runs in a separate context sized for n_seq sequences.
+        n_seq: maximum number of sequences in the context, active or idle.
+        n_ctx_per_seq: KV cache budget (prompt + reply) of each sequence.
+        n_batch: maximum tokens per llama_decode call; long prompts are
+            prefilled in chunks so they don't stall other sequences' decoding.
+        max_queue: requests allowed to wait for a free sequence before new
+            ones are refused with ModelBusyError.
+        max_unread: tokens a sequence may run ahead of its consumer before it
+            is paused.
+        prefix: text every prompt is expected to start with (the system
+            turn); its KV is computed once and shared by all sequences.
+        host_cache_bytes: budget for evicted session states kept in host RAM.
+    """
+
+    def __init__(
+        self,
+        llama: Llama,
+        n_seq: int,
+        n_ctx_per_seq: int,
+        n_batch: int = 512,
+        max_queue: int = 16,
+        max_unread: int = 32,
+        temperature: float = 0.3,
+        top_p: float = 0.9,
+        top_k: int = 40,
+        min_p: float = 0.05,
+        repeat_penalty: float = 1.0,
+        stop_tokens: list[str] = (),
+        prefix: str = "",
+        host_cache_bytes: int = 2 << 30,
+    ):
+        self._llama = llama
+        self.n_seq = n_seq
+        self.n_ctx_per_seq = n_ctx_per_seq
+        self.n_batch = n_batch
+        self.max_queue = max_queue
+        self.max_unread = max_unread
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.min_p = min_p
+        self.repeat_penalty = repeat_penalty
+        self._penalty_last_n = llama.last_n_tokens_size
+        self.host_cache_bytes = host_cache_bytes
+
+        # One extra sequence id holds the shared prefix.
+        self._prefix_seq = n_seq
+        self._prefix_tokens = llama.tokenize(prefix.encode(), add_bos=True, special=True) if prefix else []
+        n_ctx = n_ctx_per_seq * n_seq + len(self._prefix_tokens)
+        self._ctx = _new_context(llama, n_ctx, n_batch, n_seq + 1)
+        self._batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+        self._n_vocab = llama.n_vocab()
+        self._eos = llama.token_eos()
+        self._stop_ids = set()
+        for text in stop_tokens:
+            ids = llama.tokenize(text.encode(), add_bos=False, special=True)
+            if len(ids) == 1:
+                self._stop_ids.add(ids[0])
+        self._rng = np.random.default_rng()
+
+        self._cond = threading.Condition()
+        self._waiting: deque[_Sequence] = deque()
+        self._active: list[_Sequence] = []
+        self._free_ids = list(range(n_seq))
+        # Per-session KV caches, least recently used first. Engine thread only.
+        self._sessions: OrderedDict[Hashable, _SessionCache] = OrderedDict()
+        self._host_bytes = 0
+        self._forget: list[Hashable] = []
+
+        self._completed = 0
+        self._rejected = 0
+        self._tokens = 0
+        self._steps = 0
+        self._batched_seqs = 0
+        self._prompt_tokens = 0
+        self._reused_tokens = 0
+        self._evicted = 0
+        self._waits: deque[float] = deque(maxlen=1000)
+
+        self._prefill_prefix()
+
+        self._thread = threading.Thread(target=self._run, name="llm-batch", daemon=True)
+        self._thread.start()
+        log.info(
+            "LLM continuous batching: %d sequences x %d ctx, %d-token shared prefix",
+            n_seq,
+            n_ctx_per_seq,
+            len(self._prefix_tokens),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    async def stream(self, prompt: str, max_tokens: int, session: Hashable = None) -> AsyncIterator[str]:
+        """Generate a completion of prompt, yielding text pieces as they are sampled.
+
+        With a session key, the KV state this generation leaves behind is kept
+        for that session's next prompt; call forget() when the session ends.
+
+        Raises:
+            ModelBusyError: if max_queue requests are already waiting.
+            ValueError: if the prompt does not fit the per-sequence context.
+        """
+        tokens = self._llama.tokenize(prompt.encode(), add_bos=True, special=True)
+        if len(tokens) >= self.n_ctx_per_seq:
+            raise ValueError(
+                f"Prompt of {len(tokens)} tokens exceeds context window of {self.n_ctx_per_seq}"
+            )
+        max_tokens = min(max_tokens, self.n_ctx_per_seq - len(tokens))
+
+        seq = _Sequence(tokens, max_tokens, session, asyncio.get_running_loop())
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self._rejected += 1
+                raise ModelBusyError(f"llm is busy ({len(self._waiting)} requests queued)")
+            self._waiting.append(seq)
+            self._cond.notify()
+
+        try:
+            while True:
+                item = await seq.queue.get()
+                seq.consumed += 1
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            seq.cancelled = True
+            with self._cond:
+                self._cond.notify()
+
+    def forget(self, session: Hashable):
+        """Drop the KV state kept for session."""
+        with self._cond:
+            self._forget.append(session)
+            self._cond.notify()
+
+    # --- engine thread ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active and not self._waiting and not self._forget:
+                    self._cond.wait()
+                for session in self._forget:
+                    self._drop(session)
+                self._forget.clear()
+                self._admit()
+            if not self._step():
+                # Nothing runnable: every active sequence is paused on a slow
+                # consumer, or the queue waits for a sequence id.
+                with self._cond:
+                    self._cond.wait(timeout=0.005)
+
+    def _prefill_prefix(self):
+        tokens = self._prefix_tokens
+        for start in range(0, len(tokens), self.n_batch):
+            chunk = tokens[start : start + self.n_batch]
+            for k, token in enumerate(chunk):
+                self._add(k, token, start + k, self._prefix_seq, k == len(chunk) - 1)
+            self._batch.n_tokens = len(chunk)
+            if llama_cpp.llama_decode(self._ctx, self._batch) != 0:
+                raise RuntimeError("Failed to prefill the shared prompt prefix")
+
+    def _admit(self):
+        while self._waiting:
+            seq = self._waiting[0]
+            if seq.cancelled:
+                self._waiting.popleft()
+                continue
+            cache = self._sessions.get(seq.session) if seq.session is not None else None
+            if cache is not None and cache.active:
+                cache = None  # the session's previous reply is still generating
+            needs_id = cache is None or cache.seq_id is None
+            if needs_id and not self._free_ids and not self._evict_idle():
+                return
+            self._waiting.popleft()
+            wait = time.monotonic() - seq.enqueued
+            self._waits.append(wait)
+            QUEUE_WAIT.observe(wait, "llm")
+            self._place(seq, cache)
+            self._active.append(seq)
+
+    def _place(self, seq: _Sequence, cache: _SessionCache | None):
+        """Give seq a sequence id and as much reusable KV state as possible."""
+        if seq.session is not None and seq.session not in self._sessions:
+            cache = self._sessions[seq.session] = _SessionCache()
+
+        if cache is not None and cache.seq_id is None and cache.state is not None:
+            cache.seq_id = self._free_ids.pop()
+            if not self._restore(cache):
+                cache.tokens = []
+        elif cache is not None and cache.seq_id is None:
+            cache.seq_id = self._free_ids.pop()
+
+        if cache is not None:
+            self._sessions.move_to_end(seq.session)
+            cache.active = True
+            seq.cache = cache
+            seq.seq_id = cache.seq_id
+        else:
+            seq.seq_id = self._free_ids.pop()
+
+        # Keep at least one prompt token to decode so there are logits to sample.
+        limit = len(seq.prompt) - 1
+        reuse = _common_prefix(cache.tokens, seq.prompt[:limit]) if cache is not None else 0
+        shared = _common_prefix(self._prefix_tokens, seq.prompt[:limit])
+        if shared > reuse:
+            _kv(self._ctx, "seq_rm", seq.seq_id, -1, -1)
+            _kv(self._ctx, "seq_cp", self._prefix_seq, seq.seq_id, 0, shared)
+            reuse = shared
+        else:
+            _kv(self._ctx, "seq_rm", seq.seq_id, reuse, -1)
+
+        seq.kv_tokens = seq.prompt[:reuse]
+        seq.prefilled = reuse
+        self._prompt_tokens += len(seq.prompt)
+        self._reused_tokens += reuse
+        log.debug("LLM prompt of %d tokens, %d reused from cache", len(seq.prompt), reuse)
+
+    def _evict_idle(self) -> bool:
+        """Move the least recently used idle session's KV state to host RAM."""
+        for cache in self._sessions.values():
+            if cache.seq_id is not None and not cache.active:
+                break
+        else:
+            return False
+
+        size = llama_cpp.llama_state_seq_get_size(self._ctx, cache.seq_id)
+        buf = (ctypes.c_uint8 * size)()
+        written = llama_cpp.llama_state_seq_get_data(self._ctx, buf, size, cache.seq_id)
+        cache.state = bytes(buf[:written]) if written else None
+        self._host_bytes += len(cache.state or b"")
+        _kv(self._ctx, "seq_rm", cache.seq_id, -1, -1)
+        self._free_ids.append(cache.seq_id)
+        cache.seq_id = None
+        self._evicted += 1
+
+        # Over the host budget: forget the oldest offloaded sessions entirely.
+        for session in list(self._sessions):
+            if self._host_bytes <= self.host_cache_bytes:
+                break
+            old = self._sessions[session]
+            if old.state is not None:
+                self._drop(session)
+        return True
+
+    def _restore(self, cache: _SessionCache) -> bool:
+        state = cache.state
+        self._host_bytes -= len(state)
+        cache.state = None
+        buf = (ctypes.c_uint8 * len(state)).from_buffer_copy(state)
+        if llama_cpp.llama_state_seq_set_data(self._ctx, buf, len(state), cache.seq_id) == 0:
+            log.warning("Failed to restore an offloaded LLM session state")
+            _kv(self._ctx, "seq_rm", cache.seq_id, -1, -1)
+            return False
+        return True
+
+    def _drop(self, session: Hashable):
+        cache = self._sessions.get(session)
+        if cache is None:
+            return
+        if cache.active:
+            # Still generating: _finish releases the sequence id.
+            cache.tokens = []
+            del self._sessions[session]
+            return
+        del self._sessions[session]
+        if cache.seq_id is not None:
+            _kv(self._ctx, "seq_rm", cache.seq_id, -1, -1)
+            self._free_ids.append(cache.seq_id)
+        if cache.state is not None:
+            self._host_bytes -= len(cache.state)
+
+    def _add(self, n: int, token: int, pos: int, seq_id: int, logits: bool):
+        batch = self._batch
+        batch.token[n] = token
+        batch.pos[n] = pos
+        batch.n_seq_id[n] = 1
+        batch.seq_id[n][0] = seq_id
+        batch.logits[n] = logits
+
+    def _step(self) -> bool:
+        """Run one batched decode over all runnable sequences. False if none ran."""
+        n = 0
+        rows: list[tuple[_Sequence, int]] = []  # sequences to sample, and their logits row
+
+        for seq in list(self._active):
+            if seq.cancelled:
+                self._finish(seq)
+                continue
+            if seq.produced - seq.consumed >= self.max_unread:
+                continue
+            if n >= self.n_batch:
+                break
+
+            pos = len(seq.kv_tokens)
+            if seq.prefilled < len(seq.prompt):
+                take = min(len(seq.prompt) - seq.prefilled, self.n_batch - n)
+                chunk = seq.prompt[seq.prefilled : seq.prefilled + take]
+                last = seq.prefilled + take == len(seq.prompt)
+                for k, token in enumerate(chunk):
+                    self._add(n, token, pos + k, seq.seq_id, last and k == take - 1)
+                    n += 1
+                seq.prefilled += take
+                seq.kv_tokens.extend(chunk)
+                if last:
+                    rows.append((seq, n - 1))
+            else:
+                self._add(n, seq.last_token, pos, seq.seq_id, True)
+                n += 1
+                seq.kv_tokens.append(seq.last_token)
+                rows.append((seq, n - 1))
+
+        if n == 0:
+            return False
+
+        self._batch.n_tokens = n
+        rc = llama_cpp.llama_decode(self._ctx, self._batch)
+        self._steps += 1
+        self._batched_seqs += len(rows)
+        if rc != 0:
+            error = RuntimeError(f"llama_decode failed ({rc})")
+            for seq in list(self._active):
+                self._finish(seq, error)
+            return True
+
+        for seq, row in rows:
+            self._emit(seq, self._sample(seq, row))
+        return True
+
+    def _sample(self, seq: _Sequence, row: int) -> int:
+        """Sample as Llama.create_completion does: repeat penalty over the last
+        tokens generated, then top_k, top_p and min_p on the untempered
+        distribution, then temperature."""
+        ptr = llama_cpp.llama_get_logits_ith(self._ctx, row)
+        logits = np.ctypeslib.as_array(ptr, shape=(self._n_vocab,)).copy()
+
+        recent = seq.generated[-self._penalty_last_n :] if self._penalty_last_n else []
+        if self.repeat_penalty != 1.0 and recent:
+            prev = np.unique(recent)
+            vals = logits[prev]
+            logits[prev] = np.where(vals > 0, vals / self.repeat_penalty, vals * self.repeat_penalty)
+
+        if self.temperature <= 0:
+            return int(logits.argmax())
+
+        if 0 < self.top_k < len(logits):
+            top = np.argpartition(logits, -self.top_k)[-self.top_k :]
+        else:
+            top = np.arange(len(logits))
+        top = top[np.argsort(logits[top])[::-1]]
+        vals = logits[top]
+        keep = len(top)
+        if self.top_p < 1.0:
+            probs = np.exp(vals - vals[0])
+            probs /= probs.sum()
+            keep = min(keep, int(np.searchsorted(np.cumsum(probs), self.top_p)) + 1)
+        if self.min_p > 0:
+            keep = min(keep, max(1, int(np.count_nonzero(vals >= vals[0] + np.log(self.min_p)))))
+        scaled = vals[:keep] / self.temperature
+        probs = np.exp(scaled - scaled[0])
+        probs /= probs.sum()
+        return int(top[self._rng.choice(keep, p=probs)])
+
+    def _emit(self, seq: _Sequence, token: int):
+        if token == self._eos or token in self._stop_ids:
+            self._finish(seq)
+            return
+
+        seq.generated.append(token)
+        seq.last_token = token
+        self._tokens += 1
+        text = seq.decoder.decode(self._llama.detokenize([token]))
+        if text:
+            seq.produced += 1
+            seq.push(text)
+
+        if len(seq.generated) >= seq.max_tokens:
+            self._finish(seq)
+
+    def _finish(self, seq: _Sequence, error: Exception | None = None):
+        self._active.remove(seq)
+        cache = seq.cache
+        if cache is not None and error is None and self._sessions.get(seq.session) is cache:
+            # Keep the KV state resident for the session's next turn.
+            cache.tokens = seq.kv_tokens
+            cache.active = False
+        else:
+            _kv(self._ctx, "seq_rm", seq.seq_id, -1, -1)
+            self._free_ids.append(seq.seq_id)
+            if cache is not None and self._sessions.get(seq.session) is cache:
+                del self._sessions[seq.session]
+        self._completed += 1
+        seq.produced += 1
+        seq.push(error)
+
+    def stats(self) -> dict:
+        """Active and queued sequences, throughput, prefix reuse and admission waits."""
+        waits_ms = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+        return {
+            "queued": len(self._waiting),
+            "running": len(self._active),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "tokens": self._tokens,
+            "mean_batch": round(self._batched_seqs / self._steps, 2) if self._steps else 0.0,
+            "prompt_tokens": self._prompt_tokens,
+            "prompt_tokens_reused": self._reused_tokens,
+            "sessions_cached": len(self._sessions),
+            "sessions_evicted": self._evicted,
+            "host_cache_mb": round(self._host_bytes / 2**20, 1),
+            "wait_p50_ms": round(float(np.percentile(waits_ms, 50)), 1),
+            "wait_p95_ms": round(float(np.percentile(waits_ms, 95)), 1),
+            "wait_max_ms": round(float(waits_ms.max()), 1),
+        }
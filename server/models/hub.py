@@ -0,0 +1,96 @@
+"""Model file resolution shared by the model wrappers.
+
+Downloads go through huggingface_hub with model_cache_dir as the cache and,
+in offline mode, never touch the network: everything must already be in
+the cache, and a missing file fails fast instead of hanging on a fresh pod.
+
+Whisper checkpoints that are not in CTranslate2 format are converted once
+into artifact_cache_dir and loaded from there on every later boot.
+"""
+
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+from huggingface_hub import hf_hub_download, snapshot_download
+
+from server.config import settings
+
+log = logging.getLogger(__name__)
+
+
+def _hub_kwargs() -> dict:
+    return {
+        "cache_dir": settings.model_cache_dir or None,
+        "local_files_only": settings.offline,
+        "token": settings.hf_token or None,
+    }
+
+
+def fetch_file(repo_id: str, filename: str) -> str:
+    """Local path of one file of a HuggingFace repo, downloading it if needed."""
+    return hf_hub_download(repo_id=repo_id, filename=filename, **_hub_kwargs())
+
+
+def fetch_files(repo_id: str, filenames: list[str]) -> Path:
+    """Local directory holding the given files of a repo, downloaded in parallel."""
+    path = snapshot_download(
+        repo_id=repo_id, allow_patterns=filenames, max_workers=len(filenames), **_hub_kwargs()
+    )
+    return Path(path)
+
+
+def whisper_model_path(name: str, compute_type: str) -> str:
+    """Local directory of a CTranslate2 Whisper model for faster-whisper.
+
+    Args:
+        name: a faster-whisper model size ("large-v3-turbo"), a local
+            directory, or a HuggingFace repo in CTranslate2 or Transformers
+            format. Transformers checkpoints are converted (and quantized to
+            compute_type) into artifact_cache_dir.
+
+    Raises:
+        ValueError: for a Transformers checkpoint without artifact_cache_dir.
+    """
+    from faster_whisper.utils import available_models, download_model
+
+    if Path(name).is_dir():
+        return name
+    kwargs = _hub_kwargs()
+    if name in available_models():
+        return download_model(
+            name, cache_dir=kwargs["cache_dir"], local_files_only=kwargs["local_files_only"]
+        )
+
+    if settings.artifact_cache_dir:
+        converted = f"{name.replace('/', '--')}-{compute_type}"
+        target = Path(settings.artifact_cache_dir) / "ct2" / converted
+        if (target / "model.bin").exists():
+            log.info("Using converted Whisper model: %s", target)
+            return str(target)
+
+    source = Path(snapshot_download(repo_id=name, **kwargs))
+    if (source / "model.bin").exists():
+        return str(source)
+    if not settings.artifact_cache_dir:
+        raise ValueError(
+            f"{name} is not in CTranslate2 format; set artifact_cache_dir to convert it"
+        )
+    return _convert_whisper(source, target, compute_type)
+
+
+def _convert_whisper(source: Path, target: Path, compute_type: str) -> str:
+    from ctranslate2.converters import TransformersConverter
+
+    t0 = time.monotonic()
+    log.info("Converting %s to CTranslate2 (%s)...", source, compute_type)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    copy = [f for f in ("tokenizer.json", "preprocessor_config.json") if (source / f).exists()]
+    TransformersConverter(str(source), copy_files=copy).convert(str(tmp), quantization=compute_type)
+    os.replace(tmp, target)
+    log.info("Converted Whisper model in %.1fs: %s", time.monotonic() - t0, target)
+    return str(target)
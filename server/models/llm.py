@@ -2,32 +2,101 @@
 
 Loads norallm/normistral-7b-warm-instruct Q4_K_M GGUF for Norwegian
 conversation with streaming token generation. Uses ChatML format.
+
+With llm_parallel_sequences > 1, concurrent conversations are decoded together
+by a ContinuousBatchScheduler; otherwise generations take turns on the model.
+Either way, KV state is reused across turns so that only the new part of the
+history is prefilled: per session in the batcher, and through llama-cpp's
+prefix-keyed RAM state cache in the one-at-a-time path.
 """
 
 import logging
-from collections.abc import Iterator
+import time
+from collections.abc import AsyncIterator, Hashable, Iterator
+from contextlib import aclosing
 
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaRAMCache
 
+from server import metrics
 from server.config import settings
+from server.models.batching import ContinuousBatchScheduler
+from server.models.hub import fetch_file
+from server.models.scheduler import InferenceScheduler
 
 log = logging.getLogger(__name__)
 
 # ChatML stop token
 STOP_TOKENS = ["<|im_end|>"]
 
+# Context size of the Llama itself when batching: the batcher decodes in a
+# context of its own, so this one only has to exist.
+_BATCHED_MODEL_CTX = 512
+
+
+def format_chatml(messages: list[dict[str, str]], add_generation_prompt: bool = True) -> str:
+    """Render a conversation as a ChatML prompt, by default ending in an open assistant turn."""
+    prompt = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+    return prompt + "<|im_start|>assistant\n" if add_generation_prompt else prompt
+
+
+def load_tokenizer() -> Llama:
+    """The LLM's vocabulary without its weights, for counting prompt tokens."""
+    return Llama(
+        model_path=fetch_file(settings.llm_model, settings.llm_gguf_file),
+        vocab_only=True,
+        verbose=False,
+    )
+
 
 class LLM:
-    def __init__(self):
-        log.info("Loading LLM: %s (%s)", settings.llm_model, settings.llm_gguf_file)
-        self.model = Llama.from_pretrained(
-            repo_id=settings.llm_model,
-            filename=settings.llm_gguf_file,
-            n_gpu_layers=settings.llm_gpu_layers,
-            n_ctx=settings.llm_context_length,
-            verbose=False,
-        )
-        log.info("LLM loaded (%d GPU layers).", settings.llm_gpu_layers)
+    def __init__(self, model: Llama | None = None, parallel_sequences: int | None = None):
+        """
+        Args:
+            model: an already-constructed Llama (or compatible stand-in);
+                downloaded and loaded from settings when omitted.
+            parallel_sequences: conversations decoded together; defaults to
+                settings.llm_parallel_sequences. Batching needs a real Llama.
+        """
+        if parallel_sequences is None:
+            parallel_sequences = settings.llm_parallel_sequences
+        self._batched = parallel_sequences > 1
+
+        if model is None:
+            log.info("Loading LLM: %s (%s)", settings.llm_model, settings.llm_gguf_file)
+            model = Llama(
+                model_path=fetch_file(settings.llm_model, settings.llm_gguf_file),
+                n_gpu_layers=settings.llm_gpu_layers,
+                # Batched, the scheduler's context holds every sequence's KV cache.
+                n_ctx=_BATCHED_MODEL_CTX if self._batched else settings.llm_context_length,
+                verbose=False,
+            )
+            log.info("LLM loaded (%d GPU layers).", settings.llm_gpu_layers)
+        self.model = model
+
+        if self._batched:
+            self.scheduler = ContinuousBatchScheduler(
+                model,
+                n_seq=parallel_sequences,
+                n_ctx_per_seq=settings.llm_context_length,
+                n_batch=settings.llm_batch_tokens,
+                max_queue=settings.scheduler_max_queue,
+                max_unread=settings.llm_token_queue_size,
+                temperature=settings.llm_temperature,
+                top_p=settings.llm_top_p,
+                top_k=settings.llm_top_k,
+                min_p=settings.llm_min_p,
+                repeat_penalty=settings.llm_repeat_penalty,
+                stop_tokens=STOP_TOKENS,
+                prefix=format_chatml(
+                    [{"role": "system", "content": settings.system_prompt}], add_generation_prompt=False
+                ),
+                host_cache_bytes=settings.llm_kv_host_cache_mb << 20,
+            )
+        else:
+            # llama.cpp contexts are not thread-safe: one generation at a time.
+            self.scheduler = InferenceScheduler("llm", max_queue=settings.scheduler_max_queue)
+            if isinstance(model, Llama):
+                model.set_cache(LlamaRAMCache(capacity_bytes=settings.llm_kv_host_cache_mb << 20))
 
     def generate_stream(self, messages: list[dict[str, str]]) -> Iterator[str]:
         """Stream tokens from NorMistral given a conversation history.
@@ -44,6 +113,8 @@ class LLM:
             max_tokens=settings.llm_max_tokens,
             temperature=settings.llm_temperature,
             top_p=settings.llm_top_p,
+            top_k=settings.llm_top_k,
+            min_p=settings.llm_min_p,
             repeat_penalty=settings.llm_repeat_penalty,
             stop=STOP_TOKENS,
         )
@@ -54,6 +125,63 @@ class LLM:
             if token:
                 yield token
 
+    def agenerate_stream(
+        self, messages: list[dict[str, str]], session: Hashable = None
+    ) -> AsyncIterator[str]:
+        """Async version of generate_stream that keeps the event loop free.
+
+        Generation waits its turn on the LLM scheduler (or for a free batch
+        sequence), then decodes on the model thread. Tokens come back through
+        a bounded queue, so a slow consumer pauses generation instead of
+        buffering. Close the iterator (e.g. with contextlib.aclosing) to stop
+        generation at the next token.
+
+        Raises:
+            ModelBusyError: if too many generations are already queued.
+        """
+        if self._batched:
+            stream = self.scheduler.stream(
+                format_chatml(messages), settings.llm_max_tokens, session=session
+            )
+        else:
+            stream = self.scheduler.stream(
+                self.generate_stream,
+                messages,
+                session=session,
+                maxsize=settings.llm_token_queue_size,
+            )
+        return self._timed(stream)
+
+    async def _timed(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass tokens through, recording time to first token and the decode rate."""
+        t0 = time.monotonic()
+        first = None
+        tokens = 0
+        async with aclosing(stream) as pieces:
+            async for token in pieces:
+                if first is None:
+                    first = time.monotonic()
+                    metrics.LLM_FIRST_TOKEN.observe(first - t0)
+                tokens += 1
+                yield token
+        if tokens > 1 and (elapsed := time.monotonic() - first) > 0:
+            metrics.LLM_RATE.observe((tokens - 1) / elapsed)
+
+    def count_tokens(self, message: dict[str, str]) -> int:
+        """Prompt tokens one message takes, ChatML framing included."""
+        text = format_chatml([message], add_generation_prompt=False)
+        return len(self.model.tokenize(text.encode(), add_bos=False, special=True))
+
+    def prompt_budget(self) -> int:
+        """Prompt tokens that leave room for a full reply in the context window."""
+        overhead = len(self.model.tokenize(b"<|im_start|>assistant\n", add_bos=True, special=True))
+        return settings.llm_context_length - settings.llm_max_tokens - overhead
+
+    def forget(self, session: Hashable):
+        """Release the KV state kept for a finished session."""
+        if self._batched:
+            self.scheduler.forget(session)
+
     def generate(self, messages: list[dict[str, str]]) -> str:
         """Generate a complete response (non-streaming)."""
         return "".join(self.generate_stream(messages))
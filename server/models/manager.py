@@ -1,44 +1,197 @@
-"""Model manager — loads all models at startup for deterministic VRAM usage."""
+"""Model manager — loads all models at startup for deterministic VRAM usage.
 
+Independent models load concurrently on worker threads (downloads and CUDA
+uploads release the GIL), and each one reports its own readiness. The
+server starts answering /health while they load. A warm-up pass then runs
+dummy inputs through every model (see server.models.warmup); sessions are
+served once it is done.
+
+In a WebSocket worker of a multi-worker deployment, connect() takes the
+place of load_all: VAD is loaded locally and the other models are proxies
+to the model server (see server.models.remote).
+"""
+
+import asyncio
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
+from server.config import settings
 from server.models.asr import ASR
-from server.models.llm import LLM
+from server.models.llm import LLM, load_tokenizer
+from server.models.remote import ModelClient, RemoteASR, RemoteLLM, RemoteTTS
 from server.models.tts import TTS
 from server.models.vad import VAD
+from server.models.warmup import warm_up
 
 log = logging.getLogger(__name__)
 
+MODEL_NAMES = ("vad", "asr", "llm", "tts")
+
+
+def _load_vad() -> VAD:
+    return VAD(
+        threshold=settings.vad_threshold,
+        min_speech_ms=settings.vad_min_speech_ms,
+        min_silence_ms=settings.vad_min_silence_ms,
+        batch_tick_ms=settings.vad_batch_tick_ms,
+        pause_ms=settings.vad_pause_ms if settings.speculative_turns else 0,
+    )
+
 
 class ModelManager:
     def __init__(self):
         self.vad: VAD | None = None
-        self.asr: ASR | None = None
-        self.llm: LLM | None = None
-        self.tts: TTS | None = None
-
-    def load_all(self):
-        """Load all models eagerly. Call at server startup."""
-        t0 = time.time()
+        self.asr: ASR | RemoteASR | None = None
+        self.llm: LLM | RemoteLLM | None = None
+        self.tts: TTS | RemoteTTS | None = None
+        self._remote: ModelClient | None = None
+        # The models this process serves; see load_all.
+        self.names: tuple[str, ...] = MODEL_NAMES
+        # Startup phases: name -> (start, end) in seconds since load_all began.
+        self.timeline: dict[str, tuple[float, float | None]] = {}
+        self._errors: dict[str, str] = {}
+        self._t0 = time.monotonic()
+        # Per-model warm-up latencies; warmed once the pass is done (or skipped).
+        self.warmup: dict[str, dict] = {}
+        self.warmed = False
+
+    @property
+    def ready(self) -> bool:
+        if self._remote is not None and not self._remote.connected:
+            return False
+        return all(getattr(self, name) is not None for name in self.names)
+
+    def model_status(self) -> dict[str, dict]:
+        """Per-model readiness ("pending", "loading", "ready" or "failed") and load time."""
+        status = {}
+        for name in self.names:
+            start, end = self.timeline.get(name, (None, None))
+            if getattr(self, name) is not None:
+                state = "ready"
+            elif name in self._errors:
+                state = "failed"
+            else:
+                state = "loading" if start is not None else "pending"
+            entry = {"status": state}
+            if end is not None:
+                entry["load_s"] = round(end - start, 2)
+            if name in self._errors:
+                entry["error"] = self._errors[name]
+            status[name] = entry
+        return status
+
+    def load_all(self, names: tuple[str, ...] = MODEL_NAMES):
+        """Load all models eagerly. Call at server startup (from a worker thread).
+
+        Args:
+            names: the models to load; the others are left out of ready and
+                model_status().
+
+        Raises:
+            RuntimeError: if any model failed to load; the others stay loaded.
+        """
+        t0 = self._t0 = time.monotonic()
         log.info("Loading all models...")
 
-        self.vad = VAD()
-        log.info("VAD loaded.")
-
-        self.asr = ASR()
-        log.info("ASR loaded.")
-
-        self.llm = LLM()
-        log.info("LLM loaded.")
-
-        self.tts = TTS()
-        log.info("TTS loaded.")
-
-        elapsed = time.time() - t0
+        self.names = names
+        loaders = {
+            "vad": _load_vad,
+            "asr": ASR,
+            "llm": LLM,
+            "tts": TTS,
+        }
+        loaders = {name: loader for name, loader in loaders.items() if name in names}
+        workers = len(loaders) if settings.parallel_model_loading else 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as pool:
+            for name, loader in loaders.items():
+                pool.submit(self._load, name, loader, t0)
+
+        if self.tts is not None and settings.tts_cache_prewarm:
+            with self._phase("tts prewarm", t0):
+                with open(settings.tts_cache_prewarm, encoding="utf-8") as f:
+                    self.tts.prewarm(f.read().splitlines())
+
+        elapsed = time.monotonic() - t0
+        phases = [f"{name} {start:.1f}-{end:.1f}" for name, (start, end) in self.timeline.items()]
+        log.info("Startup timeline (s): %s", ", ".join(phases))
+        self._log_gpu_usage()
+        if self._errors:
+            raise RuntimeError(f"Models failed to load: {', '.join(self._errors)}")
         log.info("All models loaded in %.1fs.", elapsed)
 
-        self._log_gpu_usage()
+    async def connect(self, path: str, tokenizer=None):
+        """Use the models of the model server listening on path; VAD is loaded here.
+
+        Waits for the model server, which only listens once its models are
+        warmed up.
+
+        Args:
+            tokenizer: a vocab-only Llama (or compatible stand-in) for prompt
+                budgets; loaded from settings when omitted. A VAD already
+                installed is kept.
+        """
+        t0 = self._t0 = time.monotonic()
+        log.info("Connecting to the model server on %s...", path)
+        if self.vad is None:
+            with self._phase("vad", t0):
+                self.vad = await asyncio.to_thread(_load_vad)
+        if tokenizer is None:
+            with self._phase("tokenizer", t0):
+                tokenizer = await asyncio.to_thread(load_tokenizer)
+        with self._phase("model server", t0):
+            client = await ModelClient.connect(path)
+        self._remote = client
+        self.asr = RemoteASR(client)
+        self.llm = RemoteLLM(client, tokenizer)
+        self.tts = RemoteTTS(client)
+        self.warmup = client.hello["warmup"]
+        self.warmed = True
+        log.info("Using the model server's models (%.1fs).", time.monotonic() - t0)
+
+    async def close(self):
+        """Disconnect from the model server, if the models are remote."""
+        if self._remote is not None:
+            await self._remote.close()
+
+    def remote_metrics(self) -> str:
+        """The model server's /metrics text, if the models are remote."""
+        return self._remote.stats.get("metrics", "") if self._remote is not None else ""
+
+    async def warm_up(self):
+        """Run the warm-up pass over the loaded models; call after load_all."""
+        if settings.warmup:
+            t0 = time.monotonic()
+            with self._phase("warm-up", self._t0):
+                self.warmup = await warm_up(self)
+            log.info("Warm-up done in %.1fs.", time.monotonic() - t0)
+        self.warmed = True
+
+    def _load(self, name: str, loader, t0: float):
+        try:
+            with self._phase(name, t0):
+                model = loader()
+        except Exception as e:
+            log.exception("%s failed to load", name.upper())
+            self._errors[name] = str(e)
+            return
+        setattr(self, name, model)
+        log.info("%s loaded.", name.upper())
+
+    @contextmanager
+    def _phase(self, name: str, t0: float):
+        start = time.monotonic() - t0
+        self.timeline[name] = (start, None)
+        try:
+            yield
+        finally:
+            self.timeline[name] = (start, time.monotonic() - t0)
+
+    def scheduler_stats(self) -> dict:
+        """Queue depth and wait times of each loaded model's inference scheduler."""
+        loaded = {"asr": self.asr, "llm": self.llm, "tts": self.tts}
+        return {name: m.scheduler.stats() for name, m in loaded.items() if m is not None}
 
     def _log_gpu_usage(self):
         try:
@@ -0,0 +1,264 @@
+"""Models served by another process over a Unix socket.
+
+With several WebSocket workers (settings.workers > 1), ASR, the LLM and TTS
+are loaded once, in the model server (server.model_server). Every worker
+reaches them through the proxies here. RemoteASR, RemoteLLM and RemoteTTS
+offer the methods the pipeline calls on the local wrappers, so sessions
+run unchanged. VAD stays in the workers. So does LLM tokenization for
+prompt budgets, done with a vocab-only copy of the GGUF.
+
+A frame is a JSON header and a raw payload, each preceded by a u32 length.
+Audio travels as float32 bytes, never inside JSON, and is read back with
+np.frombuffer without another copy. One connection per worker carries the
+requests of all its sessions, tagged with ids. Streams (LLM tokens, TTS
+chunks) answer with one frame per item, and a cancel frame stops one early.
+The server also pushes its monitoring stats every second.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+from collections.abc import AsyncIterator, Hashable
+from contextlib import aclosing
+from pathlib import Path
+
+import numpy as np
+
+from server.config import settings
+from server.models.asr import IncrementalTranscript
+from server.models.llm import LLM
+from server.models.scheduler import ModelBusyError
+from server.models.tts import TTS
+
+log = logging.getLogger(__name__)
+
+_LENGTHS = struct.Struct("<II")
+
+# How often a worker retries while the model server is still starting.
+CONNECT_RETRY_S = 0.5
+
+
+def write_frame(writer: asyncio.StreamWriter, header: dict, payload=b""):
+    """Queue one frame; a single write, so frames from concurrent tasks never interleave."""
+    head = json.dumps(header).encode()
+    writer.writelines([_LENGTHS.pack(len(head), len(payload)), head, payload])
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    head_len, payload_len = _LENGTHS.unpack(await reader.readexactly(_LENGTHS.size))
+    header = json.loads(await reader.readexactly(head_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+def error_header(e: Exception) -> dict:
+    """Error frame fields; the client raises the same kind of exception."""
+    kind = "busy" if isinstance(e, ModelBusyError) else "value" if isinstance(e, ValueError) else ""
+    return {"error": str(e), "kind": kind}
+
+
+def _raise(header: dict):
+    raise {"busy": ModelBusyError, "value": ValueError}.get(header["kind"], RuntimeError)(
+        header["error"]
+    )
+
+
+def pcm_bytes(audio: np.ndarray) -> memoryview:
+    return memoryview(np.ascontiguousarray(audio, dtype=np.float32)).cast("B")
+
+
+def _key(session: Hashable) -> str | None:
+    """A session's scheduler key, unique across workers."""
+    return None if session is None else f"{os.getpid()}:{id(session)}"
+
+
+class ModelClient:
+    """One worker's connection to the model server."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, hello: dict):
+        self._reader = reader
+        self._writer = writer
+        self.hello = hello
+        self.stats: dict = hello["stats"]
+        self.connected = True
+        self._closing = False
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Queue] = {}
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, path: str) -> "ModelClient":
+        """Connect, waiting for as long as the model server takes to start listening."""
+        waited = 0.0
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if waited % 30 < CONNECT_RETRY_S:
+                    log.info("Waiting for the model server on %s...", path)
+                await asyncio.sleep(CONNECT_RETRY_S)
+                waited += CONNECT_RETRY_S
+        hello, _ = await read_frame(reader)
+        return cls(reader, writer, hello)
+
+    async def _receive(self):
+        try:
+            while True:
+                header, payload = await read_frame(self._reader)
+                if header.get("op") == "stats":
+                    self.stats = header["stats"]
+                elif (queue := self._pending.get(header["id"])) is not None:
+                    queue.put_nowait((header, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if not self._closing:
+                log.error("Lost the connection to the model server")
+        finally:
+            self.connected = False
+            for queue in self._pending.values():
+                queue.put_nowait(({"error": "Model server disconnected", "kind": ""}, b""))
+
+    async def close(self):
+        """Disconnect from the model server, failing any request still waiting."""
+        self._closing = True
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._receiver
+
+    def post(self, op: str, **args):
+        """Send a request that gets no answer."""
+        if self.connected:
+            write_frame(self._writer, {"op": op, "args": args})
+
+    async def stream(self, op: str, payload=b"", **args) -> AsyncIterator[tuple[dict, bytes]]:
+        """Send a request and yield its answer frames.
+
+        Raises:
+            ModelBusyError, ValueError or RuntimeError: as raised on the server.
+        """
+        if not self.connected:
+            raise RuntimeError("Model server disconnected")
+        rid = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[rid] = queue
+        ended = False
+        try:
+            write_frame(self._writer, {"id": rid, "op": op, "args": args}, payload)
+            await self._writer.drain()
+            while True:
+                header, data = await queue.get()
+                if "error" in header:
+                    ended = True
+                    _raise(header)
+                if header.get("end"):
+                    ended = True
+                    if "result" in header:
+                        yield header, data
+                    return
+                yield header, data
+        finally:
+            del self._pending[rid]
+            if not ended:
+                self.post("cancel", id=rid)
+
+    async def call(self, op: str, payload=b"", **args) -> tuple[dict, bytes]:
+        """Send a request and wait for its single answer."""
+        async with aclosing(self.stream(op, payload, **args)) as answers:
+            async for answer in answers:
+                return answer
+        raise RuntimeError(f"No answer to {op}")
+
+
+class _Stats:
+    """stats() of a remote object, from the figures the model server pushes."""
+
+    def __init__(self, client: ModelClient, *keys: str):
+        self._client = client
+        self._keys = keys
+
+    def stats(self) -> dict:
+        stats = self._client.stats
+        for key in self._keys:
+            stats = stats.get(key) or {}
+        return stats
+
+
+class RemoteASR:
+    def __init__(self, client: ModelClient):
+        self._client = client
+        self.sample_rate = settings.sample_rate
+        self.scheduler = _Stats(client, "schedulers", "asr")
+
+    async def atranscribe(self, audio: np.ndarray, session: Hashable = None) -> str:
+        header, _ = await self._client.call(
+            "asr.transcribe", pcm_bytes(audio), session=_key(session)
+        )
+        return header["result"]
+
+    async def atranscribe_words(
+        self, audio: np.ndarray, prompt: str = "", session: Hashable = None, priority: bool = False
+    ) -> list[tuple[float, float, str]]:
+        header, _ = await self._client.call(
+            "asr.words", pcm_bytes(audio), prompt=prompt, session=_key(session), priority=priority
+        )
+        return [tuple(word) for word in header["result"]]
+
+    def incremental(self, session: Hashable = None) -> IncrementalTranscript:
+        return IncrementalTranscript(self, session)
+
+
+class RemoteLLM:
+    # Token counting runs locally on the vocab-only model.
+    count_tokens = LLM.count_tokens
+    prompt_budget = LLM.prompt_budget
+
+    def __init__(self, client: ModelClient, tokenizer):
+        self._client = client
+        self.model = tokenizer
+        self.scheduler = _Stats(client, "schedulers", "llm")
+
+    async def agenerate_stream(
+        self, messages: list[dict[str, str]], session: Hashable = None
+    ) -> AsyncIterator[str]:
+        stream = self._client.stream("llm.generate", messages=messages, session=_key(session))
+        async with aclosing(stream) as tokens:
+            async for header, _ in tokens:
+                yield header["token"]
+
+    def forget(self, session: Hashable):
+        self._client.post("llm.forget", session=_key(session))
+
+
+class RemoteTTS:
+    # Voices are WAV files the workers can see too.
+    voice_path = TTS.voice_path
+
+    def __init__(self, client: ModelClient):
+        self._client = client
+        self.sr = client.hello["tts_sr"]
+        self.voices_dir = Path(settings.tts_voices_dir)
+        self.scheduler = _Stats(client, "schedulers", "tts")
+        self.cache = _Stats(client, "tts_cache")
+
+    async def aprepare_voice(self, voice: str, session: Hashable = None):
+        await self._client.call("tts.prepare_voice", voice=voice, session=_key(session))
+
+    async def asynthesize_stream(
+        self,
+        text: str,
+        session: Hashable = None,
+        priority: bool = False,
+        voice: str | None = None,
+    ) -> AsyncIterator[np.ndarray]:
+        stream = self._client.stream(
+            "tts.synthesize", text=text, session=_key(session), priority=priority, voice=voice
+        )
+        async with aclosing(stream) as chunks:
+            async for _, data in chunks:
+                yield np.frombuffer(data, dtype=np.float32)
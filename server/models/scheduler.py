@@ -0,0 +1,145 @@
+"""Inference scheduler — fair, bounded access to one shared model.
+
+Each GPU model (ASR, LLM, TTS) owns an InferenceScheduler. Work from all
+sessions waits in per-session queues and is granted the model one job at a
+time: priority jobs (those that shorten time-to-first-audio) first, then
+round-robin across sessions, so one chatty session cannot starve the rest.
+When too many jobs are waiting, new work is refused with ModelBusyError
+instead of queueing without bound.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Callable, Hashable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+
+import numpy as np
+
+from server.metrics import QUEUE_WAIT
+from server.models.streaming import stream_in_thread
+
+
+class ModelBusyError(RuntimeError):
+    """Raised when a model's queue is over its admission limit."""
+
+
+class InferenceScheduler:
+    def __init__(self, name: str, max_queue: int = 16):
+        self.name = name
+        self.max_queue = max_queue
+        # The model runs on one dedicated thread; the scheduler decides who is next.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._busy = False
+        self._priority: deque[asyncio.Future] = deque()
+        self._sessions: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+        self._queued = 0
+
+        self._completed = 0
+        self._rejected = 0
+        self._waits: deque[float] = deque(maxlen=1000)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    async def run(self, fn: Callable, *args, session: Hashable = None, priority: bool = False):
+        """Run fn(*args) on the model thread once this job is scheduled."""
+        async with self.slot(session, priority):
+            return await self.execute(fn, *args)
+
+    async def execute(self, fn: Callable, *args):
+        """Run fn(*args) on the model thread; the caller must hold a slot()."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def stream(
+        self,
+        fn: Callable[..., Iterator],
+        *args,
+        session: Hashable = None,
+        priority: bool = False,
+        maxsize: int = 0,
+    ) -> AsyncIterator:
+        """Iterate fn(*args) on the model thread, holding the model until it ends."""
+        async with self.slot(session, priority):
+            async with aclosing(stream_in_thread(self._executor, fn, *args, maxsize=maxsize)) as items:
+                async for item in items:
+                    yield item
+
+    @asynccontextmanager
+    async def slot(self, session: Hashable = None, priority: bool = False):
+        """Wait for exclusive use of the model.
+
+        Raises:
+            ModelBusyError: if max_queue jobs are already waiting.
+        """
+        if self._queued >= self.max_queue:
+            self._rejected += 1
+            raise ModelBusyError(f"{self.name} is busy ({self._queued} jobs queued)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._priority if priority else self._sessions.setdefault(session, deque())
+        queue.append(waiter)
+        self._queued += 1
+        enqueued = time.monotonic()
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled: hand the model on.
+                self._release()
+            else:
+                self._remove(waiter, queue, session)
+            raise
+
+        wait = time.monotonic() - enqueued
+        self._waits.append(wait)
+        QUEUE_WAIT.observe(wait, self.name)
+        try:
+            yield
+        finally:
+            self._completed += 1
+            self._release()
+
+    def _remove(self, waiter: asyncio.Future, queue: deque, session: Hashable):
+        queue.remove(waiter)
+        self._queued -= 1
+        if queue is not self._priority and not queue:
+            del self._sessions[session]
+
+    def _release(self):
+        self._busy = False
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._busy or not self._queued:
+            return
+        if self._priority:
+            waiter = self._priority.popleft()
+        else:
+            # Round-robin: serve the longest-waiting session, then move it to the back.
+            session, queue = next(iter(self._sessions.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._sessions.move_to_end(session)
+            else:
+                del self._sessions[session]
+        self._queued -= 1
+        self._busy = True
+        waiter.set_result(None)
+
+    def stats(self) -> dict:
+        """Queue depth, throughput and recent wait times for monitoring."""
+        waits_ms = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+        return {
+            "queued": self._queued,
+            "running": int(self._busy),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "wait_p50_ms": round(float(np.percentile(waits_ms, 50)), 1),
+            "wait_p95_ms": round(float(np.percentile(waits_ms, 95)), 1),
+            "wait_max_ms": round(float(waits_ms.max()), 1),
+        }
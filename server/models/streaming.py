@@ -0,0 +1,65 @@
+"""Bridge blocking model generators onto the asyncio event loop."""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import Executor
+
+# Marks the end of a worker-thread stream.
+_DONE = object()
+
+
+async def stream_in_thread(
+    executor: Executor,
+    fn: Callable[..., Iterator],
+    *args,
+    maxsize: int = 0,
+) -> AsyncIterator:
+    """Iterate fn(*args) on an executor thread and yield its items asynchronously.
+
+    Items come back through an asyncio.Queue of maxsize, so a slow consumer
+    pauses the producer instead of buffering. Close the iterator (e.g. with
+    contextlib.aclosing) to stop the producer at its next item; an
+    abandoned, unclosed iterator holds the executor thread until it is
+    garbage collected.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # Blocks the worker while the queue is full.
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        it = fn(*args)
+        try:
+            for item in it:
+                if stop.is_set():
+                    return
+                put(item)
+        except Exception as e:
+            if not stop.is_set():
+                put(e)
+            return
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+        if not stop.is_set():
+            put(_DONE)
+
+    worker = loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Free a slot in case the worker is blocked on a full queue.
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.shield(worker)
@@ -1,84 +1,218 @@
 """Chatterbox TTS wrapper for Norwegian speech synthesis.
 
 Loads the Norwegian fine-tuned Chatterbox model (akhbar/chatterbox-tts-norwegian)
-via from_local() after downloading weights from HuggingFace.
-The Norwegian model doesn't handle long text well, so we split at sentence boundaries.
+via from_local() after downloading its weight files from HuggingFace in parallel.
+The Norwegian model doesn't handle long text well, so replies reach it in
+sentence-sized chunks (server.segmenter).
+
+Voice conditioning (speaker embedding and S3Gen reference) is computed once
+per voice and reused: the default voice at load, and voices picked by
+sessions (voice id = WAV name in tts_voices_dir) into a small LRU cache.
+
+Complete sentences are kept in an AudioCache; a repeated sentence is streamed
+straight from it without touching the model.
 """
 
 import logging
+import re
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Hashable
+from contextlib import aclosing
 from pathlib import Path
 
 import numpy as np
 import torch
-from huggingface_hub import hf_hub_download
 
+from server import metrics
 from server.config import settings
+from server.models.hub import fetch_files
+from server.models.scheduler import InferenceScheduler
+from server.models.tts_cache import AudioCache
 
 log = logging.getLogger(__name__)
 
 # Files required for the Norwegian fine-tuned model
 MODEL_FILES = ["ve.safetensors", "t3_cfg.safetensors", "s3gen.safetensors", "tokenizer.json", "conds.pt"]
 
+VOICE_ID = re.compile(r"^[\w-]+$")
+
+# Cached sentences are sent in chunks of this length, like streamed synthesis.
+CACHE_CHUNK_S = 0.5
 
-class TTS:
-    def __init__(self):
-        log.info("Loading Norwegian TTS model: %s", settings.tts_model)
-        from chatterbox.tts import ChatterboxTTS
-
-        # Download model files from HuggingFace
-        local_path = None
-        for fname in MODEL_FILES:
-            local_path = hf_hub_download(
-                repo_id=settings.tts_model,
-                filename=fname,
-                token=settings.hf_token or None,
-            )
 
-        # Load from the directory containing the downloaded files
-        model_dir = Path(local_path).parent
-        log.info("Loading TTS from local dir: %s", model_dir)
-        self.model = ChatterboxTTS.from_local(model_dir, device="cuda")
+class TTS:
+    def __init__(self, model=None):
+        """
+        Args:
+            model: an already-constructed ChatterboxTTS (or compatible
+                stand-in); downloaded and loaded from settings when omitted.
+        """
+        if model is None:
+            log.info("Loading Norwegian TTS model: %s", settings.tts_model)
+            from chatterbox.tts import ChatterboxTTS
+
+            model_dir = fetch_files(settings.tts_model, MODEL_FILES)
+            log.info("Loading TTS from local dir: %s", model_dir)
+            model = ChatterboxTTS.from_local(model_dir, device="cuda")
+        self.model = model
         self.sr = self.model.sr  # 24000 Hz
         log.info("TTS model loaded (sr=%d).", self.sr)
+        # One synthesis at a time on the shared model.
+        self.scheduler = InferenceScheduler("tts", max_queue=settings.scheduler_max_queue)
 
-    def synthesize(self, text: str) -> np.ndarray:
+        if settings.tts_speaker_wav:
+            self.model.prepare_conditionals(
+                settings.tts_speaker_wav, exaggeration=settings.tts_exaggeration
+            )
+        self._default_conds = self.model.conds
+        # Conditioning per voice id, least recently used first. Model thread only.
+        self._voices: OrderedDict[str, object] = OrderedDict()
+        self.voices_dir = Path(settings.tts_voices_dir)
+        self.voice_cache_size = settings.tts_voice_cache_size
+
+        self.cache = AudioCache(
+            memory_bytes=settings.tts_cache_mb << 20,
+            disk_dir=settings.tts_cache_dir or None,
+            disk_bytes=settings.tts_cache_disk_mb << 20,
+        )
+
+    def cache_key(self, text: str, voice: str | None = None) -> str:
+        """Key of a sentence's audio: text, voice and the settings that shape it."""
+        speaker = voice if voice is not None else f"default:{settings.tts_speaker_wav}"
+        return AudioCache.key(
+            text, settings.tts_model, speaker, settings.tts_exaggeration, settings.tts_cfg_weight
+        )
+
+    def prewarm(self, phrases: list[str], voice: str | None = None):
+        """Synthesize phrases that are not cached yet. Blocking; call at startup."""
+        todo = [p for p in phrases if p.strip() and self.cache_key(p, voice) not in self.cache]
+        for phrase in todo:
+            self.cache.put(self.cache_key(phrase, voice), self.synthesize(phrase, voice))
+        log.info("TTS cache pre-warmed: %d of %d phrases synthesized", len(todo), len(phrases))
+
+    def voice_path(self, voice: str) -> Path:
+        """Reference WAV of a voice id.
+
+        Raises:
+            ValueError: if there is no such voice.
+        """
+        path = self.voices_dir / f"{voice}.wav"
+        if not VOICE_ID.match(voice) or not path.is_file():
+            raise ValueError(f"Unknown voice: {voice}")
+        return path
+
+    def _select_voice(self, voice: str | None):
+        """Point the model at a voice's conditioning, computing it on a cache miss."""
+        if voice is None:
+            self.model.conds = self._default_conds
+            return
+        conds = self._voices.get(voice)
+        if conds is None:
+            log.info("Computing conditioning for voice %s", voice)
+            path = str(self.voice_path(voice))
+            self.model.prepare_conditionals(path, exaggeration=settings.tts_exaggeration)
+            conds = self._voices[voice] = self.model.conds
+            if len(self._voices) > self.voice_cache_size:
+                self._voices.popitem(last=False)
+        else:
+            self._voices.move_to_end(voice)
+        self.model.conds = conds
+
+    async def aprepare_voice(self, voice: str, session: Hashable = None):
+        """Compute a voice's conditioning ahead of its first sentence."""
+        await self.scheduler.run(self._select_voice, voice, session=session)
+
+    def synthesize(self, text: str, voice: str | None = None) -> np.ndarray:
         """Synthesize Norwegian text to audio.
 
         Args:
             text: Norwegian text to synthesize.
+            voice: voice id, or None for the default voice.
 
         Returns:
             float32 numpy array at 24kHz.
         """
-        kwargs = {
-            "exaggeration": settings.tts_exaggeration,
-            "cfg_weight": settings.tts_cfg_weight,
-        }
-        if settings.tts_speaker_wav:
-            kwargs["audio_prompt_path"] = settings.tts_speaker_wav
-
-        wav = self.model.generate(text, **kwargs)
+        self._select_voice(voice)
+        wav = self.model.generate(
+            text,
+            exaggeration=settings.tts_exaggeration,
+            cfg_weight=settings.tts_cfg_weight,
+        )
 
         # wav is a torch tensor [1, T]
         audio = wav.squeeze(0).cpu().numpy()
         return audio
 
-    def synthesize_stream(self, text: str):
+    def synthesize_stream(self, text: str, voice: str | None = None):
         """Stream audio chunks for the given text.
 
         Uses generate_stream if available (chatterbox-streaming fork),
-        otherwise falls back to batch synthesis.
+        otherwise falls back to batch synthesis. Model time to the first
+        chunk and per second of audio go to the TTS metrics.
         """
-        kwargs = {
-            "exaggeration": settings.tts_exaggeration,
-            "cfg_weight": settings.tts_cfg_weight,
-        }
-        if settings.tts_speaker_wav:
-            kwargs["audio_prompt_path"] = settings.tts_speaker_wav
-
+        t0 = time.monotonic()
+        samples = 0
+        for chunk in self._generate_chunks(text, voice):
+            if not samples:
+                metrics.TTS_FIRST_CHUNK.observe(time.monotonic() - t0)
+            samples += len(chunk)
+            yield chunk
+        if samples:
+            metrics.TTS_RTF.observe((time.monotonic() - t0) / (samples / self.sr))
+
+    def _generate_chunks(self, text: str, voice: str | None):
         if hasattr(self.model, "generate_stream"):
-            for audio_chunk, metrics in self.model.generate_stream(text, **kwargs):
+            self._select_voice(voice)
+            stream = self.model.generate_stream(
+                text,
+                exaggeration=settings.tts_exaggeration,
+                cfg_weight=settings.tts_cfg_weight,
+            )
+            for audio_chunk, _ in stream:
                 yield audio_chunk.squeeze(0).cpu().numpy()
         else:
             # Fallback: return the whole audio as a single chunk
-            yield self.synthesize(text)
+            yield self.synthesize(text, voice)
+
+    def asynthesize_stream(
+        self,
+        text: str,
+        session: Hashable = None,
+        priority: bool = False,
+        voice: str | None = None,
+    ) -> AsyncIterator[np.ndarray]:
+        """Async version of synthesize_stream, scheduled on the TTS model.
+
+        Each chunk is yielded as soon as the model produces it. Pass
+        priority=True for the first sentence of a reply so it jumps the
+        queue ahead of other sessions' later sentences. Cached sentences
+        are streamed from the cache without waiting for the model; others
+        are cached once synthesized in full.
+
+        Raises:
+            ModelBusyError: if too many syntheses are already queued.
+        """
+        key = self.cache_key(text, voice)
+        audio = self.cache.get(key)
+        if audio is not None:
+            return self._stream_cached(audio)
+        stream = self.scheduler.stream(
+            self.synthesize_stream, text, voice, session=session, priority=priority
+        )
+        return self._cache_stream(stream, key)
+
+    async def _stream_cached(self, audio: np.ndarray) -> AsyncIterator[np.ndarray]:
+        step = int(self.sr * CACHE_CHUNK_S)
+        for i in range(0, len(audio), step):
+            yield audio[i : i + step]
+
+    async def _cache_stream(self, stream: AsyncIterator[np.ndarray], key: str):
+        chunks = []
+        async with aclosing(stream) as chunks_in:
+            async for chunk in chunks_in:
+                chunks.append(chunk)
+                yield chunk
+        # Only complete sentences: an interrupted stream never gets here.
+        if chunks:
+            self.cache.put_later(key, np.concatenate(chunks))
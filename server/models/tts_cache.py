@@ -0,0 +1,190 @@
+"""Content-addressed cache of synthesized sentences.
+
+Wybe says the same short things often ("Hei!", "Det vet jeg ikke."). A sentence
+is keyed by its normalized text, the voice and the TTS settings that shape the
+audio. Its float32 PCM is kept in an in-memory LRU bounded in bytes, and
+optionally in a directory of raw .f32 files that survive restarts and are
+read back through np.memmap, so a disk hit costs no decode and no copy.
+Disk hits stay out of the memory tier: their pages belong to the OS page
+cache, not to the memory budget. On the event loop, files are written by a
+writer thread (put_later()), so a cache miss never stalls other sessions.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """Canonical form of a sentence for cache lookup (case and punctuation kept)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class AudioCache:
+    """Sentence audio keyed by text and synthesis parameters.
+
+    Args:
+        memory_bytes: budget for the in-memory tier.
+        disk_dir: directory of the on-disk tier; None or "" disables it.
+        disk_bytes: budget for the on-disk tier; oldest files are removed first.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: str | None = None, disk_bytes: int = 1 << 30):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_used = 0
+
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        # On-disk entries, oldest first, with their sizes.
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_used = 0
+        self._writing: set[str] = set()  # keys whose file the writer thread is writing
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-cache")
+        if self._disk_dir is not None:
+            self._disk_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(self._disk_dir.glob("*.f32"), key=lambda p: p.stat().st_mtime)
+            for path in files:
+                self._disk[path.stem] = path.stat().st_size
+                self._disk_used += self._disk[path.stem]
+            log.info("TTS cache: %d sentences on disk in %s", len(self._disk), self._disk_dir)
+
+        self._hits = 0
+        self._misses = 0
+        self._bytes_served = 0
+
+    @staticmethod
+    def key(text: str, *params) -> str:
+        """Cache key of a sentence synthesized with the given parameters."""
+        parts = [normalize(text), *(repr(p) for p in params)]
+        return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Cached audio for key, or None. Counts towards the hit rate."""
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+        elif key in self._disk:
+            try:
+                audio = np.memmap(self._path(key), dtype=np.float32, mode="r")
+            except (OSError, ValueError) as e:
+                log.warning("TTS cache file unreadable, dropping it: %s", e)
+                self._drop_disk(key)
+            else:
+                self._disk.move_to_end(key)
+
+        if audio is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._bytes_served += audio.nbytes
+        return audio
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or key in self._disk
+
+    def put(self, key: str, audio: np.ndarray):
+        """Store a sentence's complete audio in both tiers. Blocks on the disk write."""
+        audio = self._store(key, audio)
+        if audio is not None:
+            _unlink(self._written(key, self._write(key, audio)))
+
+    def put_later(self, key: str, audio: np.ndarray):
+        """put() for the event loop: the memory tier at once, the file on the writer thread."""
+        audio = self._store(key, audio)
+        if audio is None:
+            return
+        self._writing.add(key)
+        future = asyncio.get_running_loop().run_in_executor(self._writer, self._write, key, audio)
+        future.add_done_callback(lambda f: self._evict_later(self._written(key, f.result())))
+
+    def _store(self, key: str, audio: np.ndarray) -> np.ndarray | None:
+        """Remember audio in memory; returns it if it still has to go to disk."""
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        if audio.size == 0:
+            return None
+        self._remember(key, audio)
+        if self._disk_dir is None or key in self._disk or key in self._writing:
+            return None
+        return audio
+
+    def _write(self, key: str, audio: np.ndarray) -> int:
+        """Write the file for key; its size, or 0 if it could not be written."""
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        try:
+            audio.tofile(tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("Could not write TTS cache file: %s", e)
+            return 0
+        return audio.nbytes
+
+    def _written(self, key: str, size: int) -> list[Path]:
+        """Record a written file; returns the files evicted to stay within disk_bytes."""
+        self._writing.discard(key)
+        if not size:
+            return []
+        self._disk[key] = size
+        self._disk_used += size
+        evicted = []
+        while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+            old, old_size = self._disk.popitem(last=False)
+            self._disk_used -= old_size
+            evicted.append(self._path(old))
+        return evicted
+
+    async def drain(self):
+        """Wait until the files put_later() queued are written."""
+        await asyncio.get_running_loop().run_in_executor(self._writer, lambda: None)
+
+    def _evict_later(self, paths: list[Path]):
+        if paths:
+            self._writer.submit(_unlink, paths)
+
+    def _remember(self, key: str, audio: np.ndarray):
+        if audio.nbytes > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old.nbytes
+        self._memory[key] = audio
+        self._memory_used += audio.nbytes
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.nbytes
+
+    def _path(self, key: str) -> Path:
+        return self._disk_dir / f"{key}.f32"
+
+    def _drop_disk(self, key: str):
+        self._disk_used -= self._disk.pop(key)
+        _unlink([self._path(key)])
+
+    def stats(self) -> dict:
+        """Hit rate, bytes served from cache and tier sizes for monitoring."""
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "bytes_served": self._bytes_served,
+            "memory_entries": len(self._memory),
+            "memory_mb": round(self._memory_used / 2**20, 1),
+            "disk_entries": len(self._disk),
+            "disk_mb": round(self._disk_used / 2**20, 1),
+        }
+
+
+def _unlink(paths: list[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
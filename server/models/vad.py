@@ -1,79 +1,301 @@
-"""Silero VAD wrapper — detects speech boundaries in audio stream."""
+"""Silero VAD wrapper — detects speech boundaries in audio stream.
+
+One VAD engine (owned by ModelManager) holds the Silero network. Every
+conversation gets its own VADStream with private segmentation and recurrent
+state. The engine's scheduler collects the streams that have whole 512-sample
+windows pending and scores all of them in one executor call: step by step,
+each step a single batched forward pass over the streams with a window left,
+with the per-stream states stacked along the batch axis.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
 
+log = logging.getLogger(__name__)
 
-class VAD:
-    def __init__(self, threshold: float = 0.5, min_speech_ms: int = 250, min_silence_ms: int = 700):
-        self.threshold = threshold
-        self.min_speech_ms = min_speech_ms
-        self.min_silence_ms = min_silence_ms
-        self.sample_rate = 16000
+# Silero VAD at 16 kHz: 512-sample windows, prefixed by the last 64 samples
+# of the previous window, with a [2, batch, 128] recurrent state.
+WINDOW_SAMPLES = 512
+CONTEXT_SAMPLES = 64
+STATE_SHAPE = (2, 1, 128)
 
-        self.model, self.utils = torch.hub.load(
-            "snakers4/silero-vad", "silero_vad", trust_repo=True
-        )
-        self.model.eval()
+# Initial per-stream audio buffer; it doubles while a long utterance needs it.
+_BUFFER_SAMPLES = 4 * 16000
 
-        self._is_speaking = False
-        self._speech_buffer: list[np.ndarray] = []
-        self._silence_samples = 0
-        self._speech_samples = 0
+
+class VADStream:
+    """Per-session speech segmentation state fed by the shared VAD engine.
+
+    Incoming audio is copied once into a preallocated buffer. Windows are
+    scored straight from it, with the preceding samples as the model's
+    context, and samples short of a whole window wait for the next chunk.
+    The utterance in progress is a contiguous stretch of the buffer, so it
+    is handed out as a view. Samples in a view are never overwritten: the
+    buffer is reused in place only when no view into it is outstanding.
+    """
+
+    def __init__(self, engine: "VAD"):
+        self._engine = engine
+        self._done: asyncio.Future | None = None
+        self._result: dict | None = None
+        self._resumed = False  # a speech_resume was seen in the chunk being scored
+        self.reset()
 
     def reset(self):
-        self.model.reset_states()
-        self._is_speaking = False
-        self._speech_buffer = []
+        self._state = torch.zeros(STATE_SHAPE)
+        # Layout: [scored audio | unscored audio | free]; the window context
+        # is the CONTEXT_SAMPLES before _scored (silence at the start).
+        self._audio = np.zeros(_BUFFER_SAMPLES, dtype=np.float32)
+        self._scored = CONTEXT_SAMPLES  # start of the next window to score
+        self._end = CONTEXT_SAMPLES  # end of the audio received
+        self._utterance: int | None = None  # start of the speech in progress
+        self._shared = False  # views into _audio have been handed out
         self._silence_samples = 0
         self._speech_samples = 0
 
-    def process_chunk(self, audio: np.ndarray) -> dict | None:
+    def close(self):
+        """Drop unscored audio and leave the engine's schedule."""
+        self._end = self._scored
+        self._engine._active.pop(self, None)
+        if self._done is not None and not self._done.done():
+            self._done.cancel()
+
+    @property
+    def is_speaking(self) -> bool:
+        return self._utterance is not None
+
+    def speech_audio(self) -> np.ndarray:
+        """Audio of the utterance in progress (empty when not speaking), as a view."""
+        if self._utterance is None:
+            return np.zeros(0, dtype=np.float32)
+        return self._view(self._utterance, self._scored)
+
+    def _view(self, start: int, end: int) -> np.ndarray:
+        self._shared = True
+        return self._audio[start:end]
+
+    @property
+    def _windows(self) -> int:
+        return (self._end - self._scored) // WINDOW_SAMPLES
+
+    async def process_chunk(self, audio: np.ndarray) -> dict | None:
         """Process an audio chunk (float32, 16kHz, mono).
 
         Returns:
             None if no event,
             {"event": "speech_start"} when speech begins,
+            {"event": "speech_pause", "audio": np.ndarray} after pause_ms of silence,
+                a tentative end of speech (includes the utterance so far),
+            {"event": "speech_resume"} when speech continues after a pause,
             {"event": "speech_end", "audio": np.ndarray} when speech ends (includes full utterance).
+            If one chunk holds several events, boundaries win over pauses and
+            later pauses over earlier ones. A pause or end that follows a
+            speech_resume in the same chunk carries "resumed": True, so the
+            resume is not lost.
+            Audio is a read-only-by-convention view into the stream's buffer.
         """
-        tensor = torch.from_numpy(audio).float()
-        # Silero VAD expects chunks of 512 samples at 16kHz
-        chunk_size = 512
-        result = None
-
-        for i in range(0, len(tensor), chunk_size):
-            chunk = tensor[i : i + chunk_size]
-            if len(chunk) < chunk_size:
-                chunk = torch.nn.functional.pad(chunk, (0, chunk_size - len(chunk)))
-
-            prob = self.model(chunk, self.sample_rate).item()
-
-            if prob >= self.threshold:
-                self._silence_samples = 0
-                self._speech_samples += len(chunk)
-
-                if not self._is_speaking:
-                    min_samples = int(self.min_speech_ms * self.sample_rate / 1000)
-                    if self._speech_samples >= min_samples:
-                        self._is_speaking = True
-                        result = {"event": "speech_start"}
-
-                if self._is_speaking:
-                    self._speech_buffer.append(audio[i : i + chunk_size])
-            else:
-                if self._is_speaking:
-                    self._silence_samples += len(chunk)
-                    self._speech_buffer.append(audio[i : i + chunk_size])
-
-                    min_silence = int(self.min_silence_ms * self.sample_rate / 1000)
-                    if self._silence_samples >= min_silence:
-                        full_audio = np.concatenate(self._speech_buffer)
-                        result = {"event": "speech_end", "audio": full_audio}
-                        self._is_speaking = False
-                        self._speech_buffer = []
-                        self._silence_samples = 0
-                        self._speech_samples = 0
-                else:
+        self._write(audio)
+        if not self._windows:
+            return None
+
+        self._result = None
+        self._resumed = False
+        self._done = asyncio.get_running_loop().create_future()
+        self._engine._submit(self)
+        await self._done
+        if self._resumed and self._result["event"] != "speech_resume":
+            self._result["resumed"] = True
+        return self._result
+
+    def _write(self, audio: np.ndarray):
+        n = len(audio)
+        if self._end + n > len(self._audio):
+            self._make_room(n)
+        self._audio[self._end : self._end + n] = audio
+        self._end += n
+
+    def _make_room(self, n: int):
+        """Drop audio no longer needed, moving the rest to a buffer with room for n more."""
+        keep = self._utterance if self._utterance is not None else self._scored - CONTEXT_SAMPLES
+        used = self._end - keep
+        size = len(self._audio)
+        while used + n > size:
+            size *= 2
+        if size == len(self._audio) and not self._shared:
+            self._audio[:used] = self._audio[keep : self._end]
+        else:
+            audio = np.empty(size, dtype=np.float32)
+            audio[:used] = self._audio[keep : self._end]
+            self._audio = audio
+            self._shared = False
+        self._scored -= keep
+        self._end -= keep
+        if self._utterance is not None:
+            self._utterance -= keep
+
+    def _on_window(self, prob: float):
+        """Advance the segmentation state machine by one scored window."""
+        engine = self._engine
+        start = self._scored
+        self._scored += WINDOW_SAMPLES
+        pause = int(engine.pause_ms * engine.sample_rate / 1000)
+        if prob >= engine.threshold:
+            if self._utterance is not None and pause and self._silence_samples >= pause:
+                self._resumed = True
+                self._tentative({"event": "speech_resume"})
+            self._silence_samples = 0
+            self._speech_samples += WINDOW_SAMPLES
+
+            if self._utterance is None:
+                min_samples = int(engine.min_speech_ms * engine.sample_rate / 1000)
+                if self._speech_samples >= min_samples:
+                    self._utterance = start
+                    self._result = {"event": "speech_start"}
+        else:
+            if self._utterance is not None:
+                self._silence_samples += WINDOW_SAMPLES
+                if pause and pause <= self._silence_samples < pause + WINDOW_SAMPLES:
+                    audio = self._view(self._utterance, self._scored)
+                    self._tentative({"event": "speech_pause", "audio": audio})
+
+                min_silence = int(engine.min_silence_ms * engine.sample_rate / 1000)
+                if self._silence_samples >= min_silence:
+                    audio = self._view(self._utterance, self._scored)
+                    self._result = {"event": "speech_end", "audio": audio}
+                    self._utterance = None
+                    self._silence_samples = 0
                     self._speech_samples = 0
+            else:
+                self._speech_samples = 0
+
+    def _tentative(self, result: dict):
+        # A pause or resume must not hide a speech_start or speech_end in the same chunk.
+        if self._result is None or self._result["event"] in ("speech_pause", "speech_resume"):
+            self._result = result
+
+
+class VAD:
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        min_speech_ms: int = 250,
+        min_silence_ms: int = 700,
+        batch_tick_ms: int = 5,
+        pause_ms: int = 0,
+        model=None,
+    ):
+        """
+        Args:
+            pause_ms: silence after which a stream reports a tentative
+                speech_pause ahead of speech_end; 0 disables it.
+            model: an already-loaded Silero VAD (or compatible stand-in);
+                loaded from the silero-vad package when omitted.
+        """
+        self.threshold = threshold
+        self.min_speech_ms = min_speech_ms
+        self.min_silence_ms = min_silence_ms
+        self.batch_tick_ms = batch_tick_ms
+        self.pause_ms = pause_ms
+        self.sample_rate = 16000
+
+        if model is None:
+            # The pip package bundles the weights: no torch.hub fetch from GitHub.
+            from silero_vad import load_silero_vad
+
+            model = load_silero_vad()
+        self.model = model
+        self.model.eval()
+        # The wrapper keeps one global state; call the inner network directly
+        # so each stream can carry its own.
+        self._net = self.model._model
+
+        # Streams with windows waiting, in arrival order (dict as ordered set).
+        self._active: dict[VADStream, None] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._scheduler: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad")
+        # Model input rows, reused across batches (only the executor thread writes them).
+        self._x = np.empty((0, CONTEXT_SAMPLES + WINDOW_SAMPLES), dtype=np.float32)
+
+    def create_stream(self) -> VADStream:
+        """Create segmentation state for one conversation."""
+        return VADStream(self)
+
+    def _submit(self, stream: VADStream):
+        self._active[stream] = None
+        if self._scheduler is None or self._scheduler.done():
+            self._wakeup = asyncio.Event()
+            self._scheduler = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _forward(self, x: torch.Tensor, state: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        with torch.inference_mode():
+            probs, state = self._net(x, state)
+        return probs.squeeze(1), state
+
+    def _score(
+        self, jobs: list[tuple[np.ndarray, int, int, torch.Tensor]]
+    ) -> tuple[list[list[float]], list[torch.Tensor]]:
+        """Score every pending window of several streams in one executor call.
+
+        Each job is (audio, first window offset, window count, state). The
+        model is recurrent, so a stream's windows run one step after another;
+        each step is one forward pass over all streams with a window left.
+        Inputs are copied into a reused array rather than allocated.
+        """
+        probs: list[list[float]] = [[] for _ in jobs]
+        states = [state for _, _, _, state in jobs]
+        steps = max(n for _, _, n, _ in jobs)
+        if len(self._x) < len(jobs):
+            self._x = np.empty((len(jobs), CONTEXT_SAMPLES + WINDOW_SAMPLES), dtype=np.float32)
+        for step in range(steps):
+            live = [i for i, (_, _, n, _) in enumerate(jobs) if n > step]
+            for row, i in enumerate(live):
+                audio, first, _, _ = jobs[i]
+                start = first + step * WINDOW_SAMPLES
+                self._x[row] = audio[start - CONTEXT_SAMPLES : start + WINDOW_SAMPLES]
+            x = torch.from_numpy(self._x[: len(live)])
+            state = states[live[0]] if len(live) == 1 else torch.cat([states[i] for i in live], dim=1)
+            step_probs, state = self._forward(x, state)
+            for row, (i, prob) in enumerate(zip(live, step_probs.tolist())):
+                probs[i].append(prob)
+                states[i] = state[:, row : row + 1]
+        return probs, states
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.batch_tick_ms:
+                # Let other sessions' chunks land so they share the forward pass.
+                await asyncio.sleep(self.batch_tick_ms / 1000)
+
+            while self._active:
+                streams = list(self._active)
+                jobs = [(s._audio, s._scored, s._windows, s._state) for s in streams]
+
+                try:
+                    probs, states = await loop.run_in_executor(self._executor, self._score, jobs)
+                except Exception as e:
+                    log.exception("VAD batch of %d failed", len(streams))
+                    for s, (_, _, n, _) in zip(streams, jobs):
+                        s._scored += n * WINDOW_SAMPLES  # skip the audio, keep the stream going
+                        self._active.pop(s, None)
+                        if s._done is not None and not s._done.done():
+                            s._done.set_exception(e)
+                    continue
 
-        return result
+                for s, stream_probs, state in zip(streams, probs, states):
+                    if s not in self._active:
+                        continue  # closed while the batch was running
+                    del self._active[s]
+                    s._state = state
+                    for prob in stream_probs:
+                        s._on_window(prob)
+                    if not s._done.done():
+                        s._done.set_result(None)
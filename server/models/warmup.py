@@ -0,0 +1,133 @@
+"""Warm-up pass run once the models are loaded, before the server reports ready.
+
+The first call into each model pays one-off costs: CUDA kernels compile and
+cuDNN autotunes for each new input shape, llama.cpp allocates its KV cache,
+faster-whisper loads its VAD filter, and Chatterbox traces its first
+generate. Warm-up pays them up front by running dummy inputs through the same
+scheduled paths conversations use, each case twice. The first run shows the
+one-off cost and the second the steady state; both are kept per model so a
+regression in either shows up in /health and the startup log.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+
+import numpy as np
+
+from server.config import settings
+
+log = logging.getLogger(__name__)
+
+# Scheduler session of the warm-up requests.
+SESSION = "warmup"
+
+VAD_STREAMS = (1, 8)
+ASR_SECONDS = (1.0, 5.0, 15.0)
+ASR_BATCH = 4
+LLM_TOKENS = 16
+TTS_SENTENCES = {
+    "short": "Hei!",
+    "long": (
+        "Takk for at du ringte, jeg skal gjerne hjelpe deg med det, men først trenger jeg "
+        "å vite litt mer om hva du lurer på."
+    ),
+}
+
+
+def _noise(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (0.01 * rng.standard_normal(int(seconds * settings.sample_rate))).astype(np.float32)
+
+
+async def _vad(vad, streams: int):
+    active = [vad.create_stream() for _ in range(streams)]
+    audio = _noise(1.0)
+    try:
+        await asyncio.gather(*(s.process_chunk(audio) for s in active))
+    finally:
+        for s in active:
+            s.close()
+
+
+async def _llm(llm):
+    messages = [
+        {"role": "system", "content": settings.system_prompt},
+        {"role": "user", "content": "Hei, hvordan går det?"},
+    ]
+    tokens = 0
+    async with aclosing(llm.agenerate_stream(messages, session=SESSION)) as stream:
+        async for _ in stream:
+            tokens += 1
+            if tokens >= LLM_TOKENS:
+                break
+    llm.forget(SESSION)
+
+
+async def _tts(tts, text: str):
+    # Straight to the model: dummy sentences must not land in the audio cache.
+    stream = tts.scheduler.stream(tts.synthesize_stream, text, None, session=SESSION)
+    async with aclosing(stream) as chunks:
+        async for _ in chunks:
+            pass
+
+
+def cases(models) -> dict[str, dict]:
+    """Warm-up coroutine factories per model: name -> {case: () -> awaitable}."""
+    vad, asr, llm, tts = models.vad, models.asr, models.llm, models.tts
+    result = {}
+    if vad is not None:
+        result["vad"] = {f"batch of {n}": lambda n=n: _vad(vad, n) for n in VAD_STREAMS}
+    if asr is not None:
+        # Partial transcripts (no VAD filter, so the decoder always runs) at
+        # several lengths, then the end-of-utterance path.
+        asr_cases = {
+            f"{s:g}s": lambda s=s: asr.atranscribe_words(_noise(s), session=SESSION)
+            for s in ASR_SECONDS
+        }
+        asr_cases["final"] = lambda: asr.atranscribe(_noise(ASR_SECONDS[1]), session=SESSION)
+        batch = min(ASR_BATCH, asr.max_batch)
+        if batch > 1:
+            asr_cases[f"{batch} concurrent"] = lambda: asyncio.gather(
+                *(asr.atranscribe(_noise(s), session=SESSION) for s in ASR_SECONDS[:1] * batch)
+            )
+        result["asr"] = asr_cases
+    if llm is not None:
+        result["llm"] = {f"{LLM_TOKENS} tokens": lambda: _llm(llm)}
+    if tts is not None:
+        result["tts"] = {name: lambda t=text: _tts(tts, t) for name, text in TTS_SENTENCES.items()}
+    return result
+
+
+async def warm_up(models) -> dict[str, dict]:
+    """Run every warm-up case twice, one model at a time.
+
+    Returns:
+        Per model: {"first_ms", "steady_ms"} summed over its cases, and the
+        same per case under "cases"; or {"error": ...} if a case failed.
+    """
+    report = {}
+    for name, model_cases in cases(models).items():
+        timings = {}
+        try:
+            for case, run in model_cases.items():
+                runs = []
+                for _ in range(2):
+                    t0 = time.perf_counter()
+                    await run()
+                    runs.append((time.perf_counter() - t0) * 1000)
+                timings[case] = {"first_ms": round(runs[0], 1), "steady_ms": round(runs[1], 1)}
+        except Exception as e:
+            log.exception("%s warm-up failed", name.upper())
+            report[name] = {"error": str(e)}
+            continue
+        first = sum(t["first_ms"] for t in timings.values())
+        steady = sum(t["steady_ms"] for t in timings.values())
+        report[name] = {
+            "first_ms": round(first, 1), "steady_ms": round(steady, 1), "cases": timings
+        }
+        log.info(
+            "%s warmed up: first call %.0f ms, steady state %.0f ms", name.upper(), first, steady
+        )
+    return report
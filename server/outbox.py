@@ -0,0 +1,343 @@
+"""Outgoing message layer of a conversation session.
+
+LLM text deltas wait for up to text_coalesce_ms (or until
+text_coalesce_bytes have built up) and sent as one TEXT_LLM message, so a
+reply costs a handful of WebSocket frames instead of one per token. Any
+other message flushes the waiting text first, so messages keep their order.
+Messages are encoded in the format the client negotiated in the handshake.
+
+One writer task per session does the sending, from two queues. Control
+messages (statuses, events, text) go first. Audio frames are paced to
+playback: a frame goes out once the client has less than audio_lead_ms of
+earlier audio left to play, so the rest waits here, where a barge-in can
+drop it (drop_audio()), rather than in socket buffers or the client's
+playback queue. TTS waits for room() before each sentence, which keeps a
+session's queue near max_bytes.
+
+A client is given up on when one send stalls for send_timeout_ms (dead),
+or when its playback has run dry for that long in total while audio was
+waiting to be sent (too slow for real time). The outbox then drops what it
+holds and calls on_stall, which closes the connection.
+
+While a speculative turn runs, hold() keeps its output back until the turn
+is confirmed (release()) or abandoned (drop_held()). Messages about the
+user's own speech (VAD events, partial transcripts) are never held.
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from collections.abc import Callable
+
+from server import metrics
+from server.protocol import (
+    asr_msg,
+    debug_msg,
+    error_msg,
+    interrupt_msg,
+    llm_msg,
+    status_msg,
+    vad_msg,
+)
+
+log = logging.getLogger(__name__)
+
+_live: "weakref.WeakSet[Outbox]" = weakref.WeakSet()
+_dropped_clients = 0
+
+
+def outbox_stats() -> dict:
+    """Output queued across live sessions, and clients dropped as too slow."""
+    queued = [out.queued_bytes for out in list(_live)]
+    return {
+        "sessions": len(queued),
+        "queued_bytes": sum(queued),
+        "max_queued_bytes": max(queued, default=0),
+        "dropped_clients": _dropped_clients,
+    }
+
+
+class Outbox:
+    def __init__(
+        self,
+        send_fn,
+        coalesce_ms: float = 0,
+        coalesce_bytes: int = 0,
+        audio_lead_ms: float = 0,
+        max_bytes: int = 0,
+        send_timeout_ms: float = 0,
+        on_stall=None,
+    ):
+        """
+        Args:
+            send_fn: async callable that sends bytes over WebSocket.
+            coalesce_ms: longest a text delta waits for more; 0 sends each at once.
+            coalesce_bytes: waiting text is sent once it reaches about this many bytes.
+            audio_lead_ms: audio sent ahead of the client's playback; 0 = no pacing.
+            max_bytes: room() waits while more than this is queued; 0 = no limit.
+            send_timeout_ms: longest one send may take before the client is
+                given up on; 0 = no limit.
+            on_stall: async callable run once the client is given up on.
+        """
+        self._send = send_fn
+        self.coalesce_s = coalesce_ms / 1000
+        self.coalesce_bytes = coalesce_bytes
+        self.lead_s = audio_lead_ms / 1000
+        self.max_bytes = max_bytes
+        self.send_timeout_s = send_timeout_ms / 1000
+        self._on_stall = on_stall
+        self.binary = False
+        self.frames = 0
+        self.closed = False
+        self._text: list[str] = []
+        self._text_bytes = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._held: list[bytes] | None = None
+        self._control: deque[bytes] = deque()
+        self._audio: deque[tuple[bytes, float, Callable | None, float]] = deque()
+        self.queued_bytes = 0
+        self._peak_bytes = 0
+        self._dropped_bytes = 0
+        self._send_max_s = 0.0
+        self._play_end = 0.0  # when the client finishes playing the audio sent so far
+        self._starved_s = 0.0  # playback run dry with audio queued, since the queue last emptied
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._writer: asyncio.Task | None = None
+        self._stall: asyncio.Task | None = None
+        _live.add(self)
+
+    async def send(self, msg: bytes, hold: bool = True):
+        """Queue an encoded control message, after any coalesced text.
+
+        Args:
+            hold: keep the message back too while output is held.
+        """
+        if self._text:
+            await self.flush()
+        self._deliver(msg, hold)
+
+    def _deliver(self, msg: bytes, hold: bool = True):
+        if hold and self._held is not None:
+            self._held.append(msg)
+            return
+        self._control.append(msg)
+        self._queued(len(msg))
+
+    def audio(self, frame: bytes, seconds: float, on_sent: Callable | None = None):
+        """Queue an audio frame of the given playback length.
+
+        Args:
+            on_sent: called once the frame has gone out, if it does.
+        """
+        self._audio.append((frame, seconds, on_sent, time.monotonic()))
+        self._queued(len(frame))
+
+    def _queued(self, size: int):
+        if self.closed:
+            self._control.clear()
+            self._audio.clear()
+            return
+        self.queued_bytes += size
+        self._peak_bytes = max(self._peak_bytes, self.queued_bytes)
+        if self.max_bytes and self.queued_bytes > self.max_bytes:
+            self._room.clear()
+        self._idle.clear()
+        self._wake.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+
+    def _dequeued(self, size: int):
+        self.queued_bytes -= size
+        if not self.max_bytes or self.queued_bytes <= self.max_bytes:
+            self._room.set()
+        if not self._control and not self._audio:
+            self._idle.set()
+
+    async def room(self):
+        """Wait until the queue is within max_bytes (or the client is gone)."""
+        await self._room.wait()
+
+    async def drain(self):
+        """Wait until everything queued has been sent (or dropped)."""
+        await self._idle.wait()
+
+    def drop_audio(self):
+        """Forget the audio not sent yet, e.g. after a barge-in."""
+        dropped = sum(len(item[0]) for item in self._audio)
+        self._audio.clear()
+        self._dropped_bytes += dropped
+        self._play_end = 0.0  # the client flushes its playback queue too
+        self._starved_s = 0.0
+        self._dequeued(dropped)
+
+    async def _write(self):
+        while True:
+            if self._control:
+                msg = self._control.popleft()
+                if not await self._transmit(msg, "control"):
+                    return
+                continue
+            timeout = None
+            if self._audio:
+                timeout = self._play_end - self.lead_s - time.monotonic()
+                if self.lead_s <= 0 or timeout <= 0:
+                    if not await self._send_audio():
+                        return
+                    continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send_audio(self) -> bool:
+        frame, seconds, on_sent, queued_at = self._audio.popleft()
+        if not await self._transmit(frame, "audio"):
+            return False
+        now = time.monotonic()
+        # Time the client had nothing to play although this frame was ready.
+        self._starved_s += max(0.0, now - max(self._play_end, queued_at))
+        self._play_end = max(now, self._play_end) + seconds
+        if on_sent is not None:
+            on_sent()
+        if not self._audio:
+            self._starved_s = 0.0
+        elif self.send_timeout_s > 0 and self._starved_s > self.send_timeout_s:
+            self._drop_client(f"playback starved for {self._starved_s:.1f}s with audio queued")
+            return False
+        return True
+
+    async def _transmit(self, msg: bytes, kind: str) -> bool:
+        """Send one message; False once the client is given up on."""
+        t0 = time.monotonic()
+        try:
+            if self.send_timeout_s > 0:
+                await asyncio.wait_for(self._send(msg), self.send_timeout_s)
+            else:
+                await self._send(msg)
+        except asyncio.TimeoutError:
+            self._drop_client(f"no send completed in {self.send_timeout_s:.1f}s")
+            return False
+        except Exception as e:
+            # The connection is gone; the receive loop ends the session.
+            log.debug("Send failed: %s", e)
+            self._give_up()
+            return False
+        elapsed = time.monotonic() - t0
+        metrics.SEND.observe(elapsed, kind)
+        self._send_max_s = max(self._send_max_s, elapsed)
+        self.frames += 1
+        self._dequeued(len(msg))
+        return True
+
+    def _drop_client(self, reason: str):
+        global _dropped_clients
+        _dropped_clients += 1
+        log.warning("Dropping client: %s, %d bytes queued", reason, self.queued_bytes)
+        self._give_up()
+        if self._on_stall is not None:
+            # Its own task: closing the socket ends the session, which cancels this one.
+            self._stall = asyncio.create_task(self._on_stall())
+
+    def _give_up(self):
+        self.closed = True
+        self._control.clear()
+        self._audio.clear()
+        self.queued_bytes = 0
+        self._room.set()
+        self._idle.set()
+
+    @property
+    def client_lead_s(self) -> float:
+        """Audio sent that the client has yet to play."""
+        return max(0.0, self._play_end - time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "queued_bytes": self.queued_bytes,
+            "peak_queued_bytes": self._peak_bytes,
+            "dropped_audio_bytes": self._dropped_bytes,
+            "send_max_ms": round(self._send_max_s * 1000, 1),
+        }
+
+    def hold(self):
+        """Keep outgoing messages back until release() or drop_held()."""
+        if self._held is None:
+            self._held = []
+
+    def release(self):
+        """Queue the messages held back, in order, and stop holding."""
+        held, self._held = self._held, None
+        for msg in held or ():
+            self._deliver(msg)
+
+    def drop_held(self):
+        """Forget the messages held back, and any coalesced text, and stop holding."""
+        self.discard()
+        self._held = None
+
+    async def text(self, delta: str, done: bool = False):
+        """Queue an LLM text delta; done ends the reply and sends at once."""
+        self._text.append(delta)
+        self._text_bytes += len(delta)
+        if done or self.coalesce_s <= 0 or self._text_bytes >= self.coalesce_bytes:
+            await self.flush(done)
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.coalesce_s, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        if self._text:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self, done: bool = False):
+        """Send coalesced text deltas as one TEXT_LLM message."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        text = "".join(self._text)
+        self._text.clear()
+        self._text_bytes = 0
+        if text or done:
+            self._deliver(llm_msg(text, done=done, binary=self.binary))
+
+    def discard(self):
+        """Drop coalesced text, e.g. when the session goes away."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._text.clear()
+        self._text_bytes = 0
+
+    def close(self):
+        """Stop sending and drop everything queued."""
+        self.discard()
+        if self._writer is not None:
+            self._writer.cancel()
+        metrics.OUTBOX_PEAK.observe(self._peak_bytes)
+        self._give_up()
+        _live.discard(self)
+
+    async def status(self, status: str):
+        await self.send(status_msg(status, binary=self.binary))
+
+    async def vad(self, event: str):
+        await self.send(vad_msg(event, binary=self.binary), hold=False)
+
+    async def asr(self, text: str, final: bool = True):
+        await self.send(asr_msg(text, final=final, binary=self.binary), hold=final)
+
+    async def interrupt(self, spoken: str):
+        await self.send(interrupt_msg(spoken, binary=self.binary))
+
+    async def error(self, message: str):
+        await self.send(error_msg(message))
+
+    async def debug(self, trace: dict):
+        await self.send(debug_msg(trace))
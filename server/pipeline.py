@@ -6,42 +6,212 @@ the full audio-in → text → audio-out loop.
 
 import asyncio
 import logging
-import re
+import time
 from collections.abc import AsyncIterator
+from contextlib import aclosing
 
 import numpy as np
 
-from server.audio import decode_webm_opus, pcm_f32_to_s16le
+from server import metrics
+from server.audio import (
+    OpusFrameDecoder,
+    OpusFrameEncoder,
+    StreamingOpusDecoder,
+    decode_raw_pcm,
+    pcm_f32_to_s16le,
+)
 from server.config import settings
+from server.history import ConversationHistory
+from server.metrics import TurnTrace
+from server.models.asr import IncrementalTranscript
 from server.models.manager import models
+from server.models.scheduler import ModelBusyError
+from server.outbox import Outbox
 from server.protocol import (
-    asr_msg,
+    INPUT_FORMATS,
+    MESSAGE_ENCODINGS,
+    OUTPUT_FORMATS,
     audio_out_msg,
-    error_msg,
-    llm_msg,
-    status_msg,
-    vad_msg,
+    audio_out_opus_msg,
 )
+from server.segmenter import SentenceSegmenter
 
 log = logging.getLogger(__name__)
 
-# Sentence boundary pattern for TTS flushing
-SENTENCE_END = re.compile(r"[.!?;:]\s*$")
+# Silence left after the speech when an utterance is trimmed for ASR: the VAD
+# scores the fading end of a word as silence.
+_ASR_TAIL_PAD_S = 0.2
+
+
+class PlaybackTimeline:
+    """Estimates how much of the current reply the client has actually played.
+
+    The client plays audio frames back to back as they arrive, so playback
+    of a frame starts when it is sent or when the previous frame ends,
+    whichever is later.
+    """
+
+    def __init__(self, reply_index: int):
+        self.reply_index = reply_index  # where the reply goes in history
+        self.sentences: list[str] = []
+        self._frames: list[tuple[int, float, float]] = []  # (sentence, start, end)
+        self._end = 0.0
+
+    def add_sentence(self, text: str) -> int:
+        self.sentences.append(text)
+        return len(self.sentences) - 1
+
+    def add_frame(self, sentence: int, seconds: float):
+        start = max(time.monotonic(), self._end)
+        self._end = start + seconds
+        self._frames.append((sentence, start, self._end))
+
+    @property
+    def playing(self) -> bool:
+        return time.monotonic() < self._end
+
+    @property
+    def unplayed_seconds(self) -> float:
+        return max(0.0, self._end - time.monotonic())
+
+    def spoken_text(self) -> str:
+        """Text heard so far; a partly played sentence is cut at a word boundary."""
+        now = time.monotonic()
+        total = [0.0] * len(self.sentences)
+        played = [0.0] * len(self.sentences)
+        for i, start, end in self._frames:
+            total[i] += end - start
+            played[i] += min(max(now - start, 0.0), end - start)
+
+        spoken = []
+        for text, t, p in zip(self.sentences, total, played):
+            if t and p >= t:
+                spoken.append(text)
+                continue
+            if t and p > 0:
+                cut = int(len(text) * p / t)
+                partial = text[:cut].rsplit(" ", 1)[0] if " " in text[:cut] else ""
+                if partial:
+                    spoken.append(partial + "…")
+            break
+        return " ".join(spoken)
 
 
 class ConversationSession:
     """Manages a single voice conversation over WebSocket."""
 
-    def __init__(self, send_fn):
+    def __init__(self, send_fn, close_fn=None):
         """
         Args:
             send_fn: async callable that sends bytes over WebSocket.
+            close_fn: async callable that drops the connection, for clients
+                that stop receiving.
         """
-        self.send = send_fn
-        self.history: list[dict[str, str]] = [
-            {"role": "system", "content": settings.system_prompt}
-        ]
-        self._audio_buffer: list[bytes] = []
+        self.out = Outbox(
+            send_fn,
+            settings.text_coalesce_ms,
+            settings.text_coalesce_bytes,
+            audio_lead_ms=settings.audio_lead_ms,
+            max_bytes=settings.outbox_max_kb * 1024,
+            send_timeout_ms=settings.send_timeout_ms,
+            on_stall=close_fn,
+        )
+        self.send = self.out.send
+        self.history = ConversationHistory(
+            settings.system_prompt,
+            count_tokens=models.llm.count_tokens,
+            budget=models.llm.prompt_budget(),
+            compact_ratio=settings.history_compact_ratio,
+            keep_recent=settings.history_keep_recent,
+            summary_prefix=settings.history_summary_prefix,
+        )
+        self.input_format = "webm"
+        self.voice: str | None = None
+        self.debug = False
+        self._voice_warmup: asyncio.Task | None = None
+        self._decoder = StreamingOpusDecoder(target_sr=settings.sample_rate)
+        self._opus_decoder: OpusFrameDecoder | None = None
+        self._opus_encoder: OpusFrameEncoder | None = None
+        self._vad = models.vad.create_stream()
+        self._turn: asyncio.Task | None = None
+        self._compaction: asyncio.Task | None = None
+        self._transcript: IncrementalTranscript | None = None
+        self._partial: asyncio.Task | None = None
+        self._last_partial = 0.0
+        self._timeline: PlaybackTimeline | None = None
+        self._trace: TurnTrace | None = None
+        # Set when the speculative turn in _turn is confirmed by speech_end.
+        self._speculation: asyncio.Event | None = None
+        self._speculation_history = 0
+
+    def configure(self, config: dict):
+        """Apply client options from the HANDSHAKE message.
+
+        Every option is checked before any is applied, so a rejected
+        handshake leaves the session as it was.
+
+        Raises:
+            ValueError: if the client asks for an unsupported option.
+        """
+        if not isinstance(config, dict):
+            raise ValueError("Handshake must be a JSON object")
+        input_format = config.get("input_format", "webm")
+        if input_format not in INPUT_FORMATS:
+            raise ValueError(f"Unsupported input_format: {input_format}")
+        output_format = config.get("output_format", "pcm_s16le")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output_format: {output_format}")
+        encoding = config.get("message_encoding", "json")
+        if encoding not in MESSAGE_ENCODINGS:
+            raise ValueError(f"Unsupported message_encoding: {encoding}")
+        voice = config.get("voice")
+        if voice is not None and not isinstance(voice, str):
+            raise ValueError(f"Unknown voice: {voice}")
+        if voice is not None and voice != self.voice:
+            models.tts.voice_path(voice)
+        opus_decoder = self._opus_decoder
+        if input_format == "opus" and opus_decoder is None:
+            opus_decoder = OpusFrameDecoder(target_sr=settings.sample_rate)
+        opus_encoder = None
+        if output_format == "opus":
+            opus_encoder = self._opus_encoder or OpusFrameEncoder(
+                models.tts.sr, settings.opus_out_bitrate
+            )
+
+        self._opus_decoder = opus_decoder
+        self.input_format = input_format
+        log.info("Session input format: %s", input_format)
+        self._opus_encoder = opus_encoder
+        log.info("Session output format: %s", output_format)
+        self.out.binary = encoding == "binary"
+        self.debug = bool(config.get("debug", False))
+        if voice is not None and voice != self.voice:
+            self.voice = voice
+            self._voice_warmup = asyncio.create_task(self._warm_voice(voice))
+            log.info("Session voice: %s", voice)
+
+    async def _warm_voice(self, voice: str):
+        """Have the voice's conditioning cached before the first reply needs it."""
+        try:
+            await models.tts.aprepare_voice(voice, session=self)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The first sentence computes it instead.
+            log.warning("Voice warm-up failed: %s", e)
+
+    async def close(self):
+        """Release per-session resources when the WebSocket goes away."""
+        if self._turn is not None:
+            self._turn.cancel()
+        self._cancel_compaction()
+        for task in (self._partial, self._voice_warmup):
+            if task is not None:
+                task.cancel()
+        self._vad.close()
+        self.out.close()
+        models.llm.forget(self)
+        await self._decoder.close()
 
     async def handle_audio(self, data: bytes):
         """Process incoming audio data from the browser.
@@ -49,87 +219,385 @@ class ConversationSession:
         Decodes WebM/Opus, runs VAD, and triggers the conversation
         pipeline when speech ends.
         """
+        t0 = time.monotonic()
+        try:
+            audio = await self._decoder.decode(data)
+        except RuntimeError as e:
+            log.warning("Audio decode failed: %s", e)
+            await self.out.error(f"Audio decode error: {e}")
+            return
+        metrics.DECODE.observe(time.monotonic() - t0, "webm")
+
+        await self._handle_pcm(audio)
+
+    async def handle_raw_audio(self, data: bytes):
+        """Process containerless audio in the negotiated input format.
+
+        PCM goes straight to VAD without a decoder hop; bare Opus packets
+        are decoded in-process.
+        """
+        t0 = time.monotonic()
         try:
-            audio = decode_webm_opus(data, target_sr=settings.sample_rate)
+            if self.input_format == "opus":
+                audio = self._opus_decoder.decode(data)
+            elif self.input_format == "webm":
+                raise RuntimeError("AUDIO_IN_RAW received before input_format was negotiated")
+            else:
+                audio = decode_raw_pcm(data, self.input_format)
         except RuntimeError as e:
             log.warning("Audio decode failed: %s", e)
-            await self.send(error_msg(f"Audio decode error: {e}"))
+            await self.out.error(f"Audio decode error: {e}")
             return
+        metrics.DECODE.observe(time.monotonic() - t0, self.input_format)
 
-        vad_result = models.vad.process_chunk(audio)
+        await self._handle_pcm(audio)
 
-        if vad_result is None:
+    async def _handle_pcm(self, audio: np.ndarray):
+        """Run VAD on decoded 16 kHz PCM and react to speech boundaries."""
+        if audio.size == 0:
             return
 
-        if vad_result["event"] == "speech_start":
-            await self.send(vad_msg("speech_start"))
-            await self.send(status_msg("listening"))
+        t0 = time.monotonic()
+        vad_result = await self._vad.process_chunk(audio)
+        metrics.VAD.observe(time.monotonic() - t0)
+
+        event = vad_result["event"] if vad_result is not None else None
+        if event == "speech_resume" or (vad_result is not None and vad_result.get("resumed")):
+            # Also when the same chunk paused or ended again: the speculative
+            # turn stopped at the earlier pause.
+            await self._abandon_speculation()
+        if event in (None, "speech_pause", "speech_resume"):
+            self._schedule_partial()
+        if event == "speech_pause":
+            self._speculate(vad_result["audio"])
 
-        elif vad_result["event"] == "speech_end":
-            await self.send(vad_msg("speech_end"))
+        elif event == "speech_start":
+            await self.out.vad("speech_start")
+            # A new turn is coming: free the LLM rather than finish a summary.
+            self._cancel_compaction()
+            if settings.barge_in and self._is_responding():
+                await self._interrupt()
+            await self.out.status("listening")
+            if settings.asr_streaming:
+                self._transcript = models.asr.incremental(session=self)
+                self._last_partial = time.monotonic()
+
+        elif event == "speech_end":
+            await self.out.vad("speech_end")
             speech_audio = vad_result["audio"]
-            # Process the complete utterance
-            await self._process_utterance(speech_audio)
+            transcript, self._transcript = self._transcript, None
+            partial, self._partial = self._partial, None
+            if self._speculation is not None:
+                # Silence held up: the speculative turn is the real one.
+                self._trace.restart()
+                self._speculation.set()
+                self._speculation = None
+                self.out.release()
+                return
+            if self._turn is not None and not self._turn.done():
+                await self._interrupt()
+            # Process the complete utterance in the background so incoming
+            # audio keeps flowing through VAD while Wybe answers.
+            self._trace = TurnTrace()
+            self._turn = asyncio.create_task(self._run_turn(speech_audio, transcript, partial))
 
-    async def _process_utterance(self, audio: np.ndarray):
-        """Run ASR → LLM → TTS on a complete speech segment."""
-        # Step 1: ASR
-        await self.send(status_msg("thinking"))
-        text = await asyncio.get_event_loop().run_in_executor(
-            None, models.asr.transcribe, audio
+    def _speculate(self, audio: np.ndarray):
+        """Start the turn at a tentative end of speech, with its output held back.
+
+        ASR and the LLM run during the rest of the end-of-speech silence; TTS
+        waits for speech_end. If the user goes on speaking, the turn is
+        abandoned and leaves no trace.
+        """
+        if self._turn is not None and not self._turn.done():
+            return
+        self._speculation = asyncio.Event()
+        self._speculation_history = len(self.history.messages)
+        self._trace = TurnTrace(speculative=True)
+        self.out.hold()
+        self._turn = asyncio.create_task(
+            self._run_turn(audio, self._transcript, self._partial, self._speculation)
+        )
+
+    async def _abandon_speculation(self):
+        """The user kept speaking: cancel the speculative turn and undo its effects."""
+        if self._speculation is None:
+            return
+        self._speculation = None
+        turn, self._turn = self._turn, None
+        if turn is not None and not turn.done():
+            turn.cancel()
+            await asyncio.wait([turn])
+        self.out.drop_held()
+        del self.history.messages[self._speculation_history :]
+        self._timeline = None
+        log.debug("Speculative turn abandoned: speech resumed")
+
+    def _schedule_partial(self):
+        """Start the next partial transcription if one is due and none is running.
+
+        None start while a speculative turn reads the transcript; they resume
+        once it is abandoned.
+        """
+        if self._transcript is None or self._speculation is not None:
+            return
+        if self._partial is not None and not self._partial.done():
+            return
+        now = time.monotonic()
+        if now - self._last_partial < settings.asr_partial_interval_ms / 1000:
+            return
+        self._last_partial = now
+        self._partial = asyncio.create_task(self._update_partial(self._transcript))
+
+    async def _update_partial(self, transcript: IncrementalTranscript):
+        try:
+            text = await transcript.update(self._vad.speech_audio())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Partials are best-effort; the final pass covers what they miss.
+            log.debug("Partial transcription skipped: %s", e)
+            return
+        if text and transcript is self._transcript:
+            await self.out.asr(text, final=False)
+
+    def _is_responding(self) -> bool:
+        """True while a reply is being produced or is still playing on the client."""
+        if self._turn is not None and not self._turn.done():
+            return True
+        return self._timeline is not None and self._timeline.playing
+
+    async def _interrupt(self):
+        """Barge-in: stop the current reply and keep only what the user heard.
+
+        Cancelling the turn closes the LLM token stream and drops sentences
+        still waiting for TTS. The client is told to flush its playback
+        queue, and history keeps only the spoken prefix of the reply.
+        """
+        turn, self._turn = self._turn, None
+        if turn is not None and not turn.done():
+            turn.cancel()
+            await asyncio.wait([turn])
+        # Audio still in the outbox is stale now.
+        self.out.drop_audio()
+
+        timeline, self._timeline = self._timeline, None
+        if timeline is None:
+            return
+
+        spoken = timeline.spoken_text()
+        await self.out.interrupt(spoken)
+
+        messages = self.history.messages
+        i = timeline.reply_index
+        if i < len(messages):
+            # The turn had finished; the full reply is already recorded.
+            if spoken:
+                messages[i]["content"] = spoken
+            else:
+                del messages[i]
+        elif spoken:
+            messages.append({"role": "assistant", "content": spoken})
+
+        log.info(
+            "Barge-in: kept %d chars of reply, %.1fs of queued audio dropped",
+            len(spoken),
+            timeline.unplayed_seconds,
         )
 
+    async def _run_turn(
+        self,
+        audio: np.ndarray,
+        transcript: IncrementalTranscript | None = None,
+        partial: asyncio.Task | None = None,
+        confirmed: asyncio.Event | None = None,
+    ):
+        try:
+            await self._process_utterance(audio, transcript, partial, confirmed)
+        except asyncio.CancelledError:
+            raise
+        except ModelBusyError as e:
+            log.warning("Turn refused: %s", e)
+            await self.out.status("busy")
+        except Exception as e:
+            log.exception("Turn failed: %s", e)
+            await self.out.error(str(e))
+            await self.out.status("ready")
+
+    async def _process_utterance(
+        self,
+        audio: np.ndarray,
+        transcript: IncrementalTranscript | None = None,
+        partial: asyncio.Task | None = None,
+        confirmed: asyncio.Event | None = None,
+    ):
+        """Run ASR → LLM → TTS on a complete speech segment.
+
+        With a streaming transcript, only the audio after its committed
+        words is decoded here. A speculative turn (confirmed given) starts
+        at a pause in speech; it leaves the transcript open and holds TTS
+        until confirmed is set.
+        """
+        # Step 1: ASR
+        trace = self._trace
+        self._timeline = None
+        await self.out.status("thinking")
+        silence_ms = settings.vad_min_silence_ms if confirmed is None else settings.vad_pause_ms
+        silence_s = silence_ms / 1000
+        if transcript is not None:
+            if partial is not None and not transcript.covers(audio, silence_s):
+                # Let the decode in flight land: it may cover the rest of the speech.
+                await asyncio.wait([partial])
+            if confirmed is None:
+                text = await transcript.finish(audio, silence_s)
+            else:
+                text = await transcript.peek(audio, silence_s)
+        else:
+            # Whisper makes up words in long trailing silence; batched or not,
+            # it gets the speech and a short pad.
+            trim = int(max(0.0, silence_s - _ASR_TAIL_PAD_S) * settings.sample_rate)
+            text = await models.asr.atranscribe(audio[: len(audio) - trim], session=self)
+        trace.mark("asr_done")
+
         if not text.strip():
-            await self.send(status_msg("ready"))
+            await self.out.status("ready")
             return
 
         log.info("User: %s", text)
-        await self.send(asr_msg(text))
+        await self.out.asr(text)
 
         # Add to conversation history
-        self.history.append({"role": "user", "content": text})
+        self.history.messages.append({"role": "user", "content": text})
+        self._timeline = PlaybackTimeline(reply_index=len(self.history.messages))
 
-        # Step 2: LLM streaming → Step 3: TTS at sentence boundaries
-        await self.send(status_msg("speaking"))
+        # Step 2: LLM streaming → Step 3: TTS per sentence → Step 4: socket.
+        # The stages run concurrently, so the LLM keeps decoding while earlier
+        # sentences are synthesized and their audio is sent.
+        await self.out.status("speaking")
 
-        full_response = ""
-        sentence_buffer = ""
+        sentences: asyncio.Queue[str | None] = asyncio.Queue()
+        stages = [
+            asyncio.create_task(self._generate_text(sentences)),
+            asyncio.create_task(self._synthesize(sentences, confirmed)),
+        ]
+        try:
+            full_response, _ = await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+
+        # Add assistant response to history
+        self.history.messages.append({"role": "assistant", "content": full_response})
+        log.info("Wybe: %s", full_response)
 
-        for token in models.llm.generate_stream(self.history):
-            full_response += token
-            sentence_buffer += token
-            await self.send(llm_msg(token))
+        await self.out.status("ready")
+        report = trace.finish()
+        if self.debug:
+            await self.out.debug({**report, "outbox": self.out.stats()})
 
-            # Flush to TTS at sentence boundaries
-            if SENTENCE_END.search(sentence_buffer):
-                await self._synthesize_and_send(sentence_buffer.strip())
-                sentence_buffer = ""
+        if self.history.needs_compaction() and self._compaction is None:
+            self._compaction = asyncio.create_task(self._compact_history())
 
-        # Flush remaining text
-        if sentence_buffer.strip():
-            await self._synthesize_and_send(sentence_buffer.strip())
+    async def _compact_history(self):
+        """Summarize older turns while the user listens, so no turn waits on it."""
+        try:
+            await self.history.compact(self._summarize)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The prompt still fits by leaving old turns out; try again next turn.
+            log.warning("History compaction failed: %s", e)
+        finally:
+            if self._compaction is asyncio.current_task():
+                self._compaction = None
 
-        await self.send(llm_msg("", done=True))
+    def _cancel_compaction(self):
+        if self._compaction is not None:
+            self._compaction.cancel()
+            self._compaction = None
 
-        # Add assistant response to history
-        self.history.append({"role": "assistant", "content": full_response})
-        log.info("Wybe: %s", full_response)
+    async def _summarize(self, summary: str, messages: list[dict[str, str]]) -> str:
+        speaker = {"user": "Bruker", "assistant": "Wybe"}
+        lines = [f"{speaker.get(m['role'], m['role'])}: {m['content']}" for m in messages]
+        if summary:
+            lines.insert(0, f"{settings.history_summary_prefix}{summary}\n")
+        prompt = [
+            {"role": "system", "content": settings.history_summary_prompt},
+            {"role": "user", "content": "\n".join(lines)},
+        ]
+        async with aclosing(models.llm.agenerate_stream(prompt)) as tokens:
+            return "".join([token async for token in tokens])
 
-        await self.send(status_msg("ready"))
+    async def _generate_text(self, sentences: asyncio.Queue) -> str:
+        """Stream LLM tokens to the client and queue TTS chunks as they complete."""
+        full_response = ""
+        segmenter = SentenceSegmenter(
+            settings.tts_first_chunk_min_chars, settings.tts_max_chunk_chars
+        )
 
-    async def _synthesize_and_send(self, text: str):
-        """Synthesize text to audio and send over WebSocket."""
-        if not text:
-            return
+        trace = self._trace
+        prompt = self.history.prompt()
+        log.debug("LLM prompt: %d tokens", self.history.last_prompt_tokens)
+        async with aclosing(models.llm.agenerate_stream(prompt, session=self)) as tokens:
+            async for token in tokens:
+                trace.mark("first_token")
+                trace.tokens += 1
+                full_response += token
+                await self.out.text(token)
+                for chunk in segmenter.feed(token):
+                    await sentences.put(chunk)
+
+        trace.mark("llm_done")
+        if rest := segmenter.flush():
+            await sentences.put(rest)
+        await sentences.put(None)
+
+        await self.out.text("", done=True)
+        return full_response
+
+    async def _synthesize(self, sentences: asyncio.Queue, confirmed: asyncio.Event | None = None):
+        """Synthesize queued sentences into the outbox, then wait until it has sent them.
+
+        The outbox paces audio to playback. TTS starts a sentence only once
+        the outbox has room, so a fast model never piles up a whole reply.
+        """
+        if confirmed is not None:
+            # Speculative turn: the LLM may run ahead, TTS only once it is confirmed.
+            await confirmed.wait()
+        timeline = self._timeline
+        trace = self._trace
+        encoder = self._opus_encoder
+        if encoder is not None:
+            # Samples left over from an interrupted reply must not leak into this one.
+            encoder.reset()
+        sentence = -1
+
+        def queue(seconds: float, frame: bytes, sentence: int):
+            def sent():
+                trace.mark("first_audio")
+                trace.audio_s += seconds
+                timeline.add_frame(sentence, seconds)
 
-        def _synth():
-            chunks = []
-            for chunk in models.tts.synthesize_stream(text):
-                chunks.append(chunk)
-            return chunks
+            self.out.audio(frame, seconds, sent)
 
-        audio_chunks = await asyncio.get_event_loop().run_in_executor(None, _synth)
+        while (text := await sentences.get()) is not None:
+            sentence = timeline.add_sentence(text)
+            await self.out.room()
+            # The first sentence decides time-to-first-audio: let it jump the queue.
+            stream = models.tts.asynthesize_stream(
+                text, session=self, priority=sentence == 0, voice=self.voice
+            )
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    if encoder is None:
+                        frame = audio_out_msg(pcm_f32_to_s16le(chunk))
+                        queue(len(chunk) / models.tts.sr, frame, sentence)
+                    elif packets := encoder.encode(chunk):
+                        queue(*self._opus_frame(packets), sentence)
+        if encoder is not None and (packets := encoder.flush()):
+            queue(*self._opus_frame(packets), sentence)
+        await self.out.drain()
+        trace.mark("last_audio")
 
-        for chunk in audio_chunks:
-            pcm_bytes = pcm_f32_to_s16le(chunk)
-            await self.send(audio_out_msg(pcm_bytes))
+    def _opus_frame(self, packets: list[bytes]) -> tuple[float, bytes]:
+        seconds = len(packets) * OpusFrameEncoder.FRAME_MS / 1000
+        return seconds, audio_out_opus_msg(packets)
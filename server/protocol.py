@@ -6,11 +6,37 @@ Types:
   0x01  HANDSHAKE     client→server  JSON config
   0x02  AUDIO_IN      client→server  raw audio bytes (WebM/Opus from browser)
   0x03  AUDIO_OUT     server→client  PCM s16le audio chunk
-  0x04  TEXT_ASR      server→client  JSON {"text": "transcribed text"}
+  0x04  TEXT_ASR      server→client  JSON {"text": "transcribed text", "final": true}
+                                     — "final": false for partials while the user speaks
   0x05  TEXT_LLM      server→client  JSON {"text": "token", "done": false}
   0x06  VAD_EVENT     server→client  JSON {"event": "speech_start"|"speech_end"}
   0x07  ERROR         server→client  JSON {"error": "message"}
-  0x08  STATUS        server→client  JSON {"status": "ready"|"listening"|"thinking"|"speaking"}
+  0x08  STATUS        server→client  JSON {"status": "ready"|"listening"|"thinking"|"speaking"|"busy"}
+  0x09  AUDIO_IN_RAW  client→server  containerless audio in the handshake's "input_format"
+  0x0A  INTERRUPT     server→client  JSON {"spoken": "text actually played"} — flush playback
+  0x0B  AUDIO_OUT_OPUS server→client 20 ms Opus packets, each prefixed with its u16le length
+  0x0C  DEBUG         server→client  JSON {"trace": {...}} — timings of the turn just finished
+
+HANDSHAKE fields:
+  "input_format"  "webm" (default) — AUDIO_IN carries MediaRecorder WebM/Opus chunks
+                  "pcm_s16le"      — AUDIO_IN_RAW carries 16 kHz mono s16le samples
+                  "pcm_f32le"      — AUDIO_IN_RAW carries 16 kHz mono float32 samples
+                  "opus"           — AUDIO_IN_RAW carries one bare Opus packet per message
+  "output_format" "pcm_s16le" (default) — AUDIO_OUT carries raw PCM at the TTS sample rate
+                  "opus"           — AUDIO_OUT_OPUS carries Opus at the TTS sample rate
+  "voice"         voice id (a WAV in the server's voices directory); default voice if omitted
+  "debug"         true to get a DEBUG message after every turn
+  "message_encoding"  "json" (default) — server→client text messages as above
+                      "binary"         — fixed layouts instead of JSON:
+      TEXT_ASR   flags byte (bit 0: final) + UTF-8 text
+      TEXT_LLM   flags byte (bit 0: done) + UTF-8 text
+      VAD_EVENT  one byte, index into VAD_EVENTS
+      STATUS     one byte, index into STATUSES
+      INTERRUPT  UTF-8 spoken text
+      ERROR and DEBUG stay JSON.
+
+TEXT_LLM "text" may hold several tokens: the server coalesces deltas over a
+few milliseconds before sending them.
 """
 
 import json
@@ -27,10 +53,23 @@ class MsgType(IntEnum):
     VAD_EVENT = 0x06
     ERROR = 0x07
     STATUS = 0x08
+    AUDIO_IN_RAW = 0x09
+    INTERRUPT = 0x0A
+    AUDIO_OUT_OPUS = 0x0B
+    DEBUG = 0x0C
+
+
+INPUT_FORMATS = ("webm", "pcm_s16le", "pcm_f32le", "opus")
+OUTPUT_FORMATS = ("pcm_s16le", "opus")
+MESSAGE_ENCODINGS = ("json", "binary")
+
+# Code tables of the binary message encoding; only ever append to them.
+STATUSES = ("ready", "listening", "thinking", "speaking", "busy")
+VAD_EVENTS = ("speech_start", "speech_end")
 
 
 def pack_binary(msg_type: MsgType, payload: bytes) -> bytes:
-    return struct.pack("B", msg_type) + payload
+    return bytes((msg_type,)) + payload
 
 
 def pack_json(msg_type: MsgType, data: dict) -> bytes:
@@ -43,25 +82,53 @@ def unpack(raw: bytes) -> tuple[MsgType, bytes]:
     return msg_type, payload
 
 
-def status_msg(status: str) -> bytes:
+def pack_text(msg_type: MsgType, flag: bool, text: str) -> bytes:
+    return bytes((msg_type, flag)) + text.encode()
+
+
+def status_msg(status: str, binary: bool = False) -> bytes:
+    if binary:
+        return bytes((MsgType.STATUS, STATUSES.index(status)))
     return pack_json(MsgType.STATUS, {"status": status})
 
 
-def asr_msg(text: str) -> bytes:
-    return pack_json(MsgType.TEXT_ASR, {"text": text})
+def asr_msg(text: str, final: bool = True, binary: bool = False) -> bytes:
+    if binary:
+        return pack_text(MsgType.TEXT_ASR, final, text)
+    return pack_json(MsgType.TEXT_ASR, {"text": text, "final": final})
 
 
-def llm_msg(text: str, done: bool = False) -> bytes:
+def llm_msg(text: str, done: bool = False, binary: bool = False) -> bytes:
+    if binary:
+        return pack_text(MsgType.TEXT_LLM, done, text)
     return pack_json(MsgType.TEXT_LLM, {"text": text, "done": done})
 
 
-def vad_msg(event: str) -> bytes:
+def vad_msg(event: str, binary: bool = False) -> bytes:
+    if binary:
+        return bytes((MsgType.VAD_EVENT, VAD_EVENTS.index(event)))
     return pack_json(MsgType.VAD_EVENT, {"event": event})
 
 
+def interrupt_msg(spoken: str, binary: bool = False) -> bytes:
+    if binary:
+        return pack_binary(MsgType.INTERRUPT, spoken.encode())
+    return pack_json(MsgType.INTERRUPT, {"spoken": spoken})
+
+
 def audio_out_msg(pcm_bytes: bytes) -> bytes:
     return pack_binary(MsgType.AUDIO_OUT, pcm_bytes)
 
 
+def audio_out_opus_msg(packets: list[bytes]) -> bytes:
+    return pack_binary(
+        MsgType.AUDIO_OUT_OPUS, b"".join(struct.pack("<H", len(p)) + p for p in packets)
+    )
+
+
 def error_msg(message: str) -> bytes:
     return pack_json(MsgType.ERROR, {"error": message})
+
+
+def debug_msg(trace: dict) -> bytes:
+    return pack_json(MsgType.DEBUG, {"trace": trace})
@@ -0,0 +1,150 @@
+"""Splitting a streamed LLM reply into chunks for TTS.
+
+The Norwegian Chatterbox model speaks single sentences best; long inputs
+come out slower and worse. SentenceSegmenter is fed the reply token by
+token and returns each chunk as soon as it is complete, looking only at
+the characters added since the last call.
+
+A full stop ends a sentence when whitespace follows it, except after a
+Norwegian abbreviation ("f.eks.", "kl.", "bl.a.") or a number ("17. mai").
+There, and after an ellipsis, the next word decides: a capital starts a
+new sentence, anything else continues this one. Decimals and times
+("14.30", "3,5") have no whitespace after the point and never split.
+
+Commas, semicolons, colons and dashes are clause boundaries. The first
+chunk of a reply ends at its first clause boundary past first_min_chars,
+so synthesis starts before the first sentence is complete. A chunk that
+reaches max_chars is cut at its last clause boundary, or at a word if it
+has none.
+"""
+
+# Abbreviations (lowercase, without the final point) that lead into what
+# follows, often a name ("f.eks. Bergen", "dr. Hansen"): never a sentence end.
+ABBREVIATIONS = frozenset({
+    "adm", "ang", "avd", "bl.a", "ca", "d.d", "d.v.s", "dr", "dvs", "evt", "f.eks", "f.o.m",
+    "fr", "frk", "hr", "ifm", "iflg", "ift", "inkl", "jf", "jfr", "kap", "kl", "m.a.o",
+    "m.h.t", "mht", "nr", "p.g.a", "pga", "prof", "sml", "st", "str", "t.o.m", "tlf",
+    "vedr", "vs", "jan", "feb", "apr", "aug", "sep", "sept", "okt", "nov", "des",
+})
+# Abbreviations that often end a sentence: the next word decides.
+FINAL_ABBREVIATIONS = frozenset({
+    "etc", "kr", "m.fl", "m.m", "mill", "mm", "mrd", "m.v", "mv", "o.l", "osb", "osv",
+})
+
+SENTENCE_PUNCT = ".!?…"
+CLAUSE_PUNCT = ",;:–—"
+# Closing quotes and brackets stay with the sentence they end.
+CLOSING = "\"'»”’)]"
+OPENING = "\"'«“‘(["
+
+
+class SentenceSegmenter:
+    def __init__(self, first_min_chars: int = 0, max_chars: int = 0):
+        """
+        Args:
+            first_min_chars: the first chunk ends at a clause boundary once it
+                is this long; 0 waits for the end of the first sentence.
+            max_chars: longest chunk before it is cut; 0 = no limit.
+        """
+        self.first_min_chars = first_min_chars
+        self.max_chars = max_chars
+        self.chunks = 0  # emitted so far
+        self._buf = ""  # text of the chunk being built
+        self._scanned = 0  # characters of _buf already looked at
+        self._end = -1  # where a sentence may end, pending the next word
+        self._clause = -1  # end of the last clause boundary in _buf
+        self._space = -1  # start of the last whitespace run in _buf
+
+    def feed(self, text: str) -> list[str]:
+        """Add streamed text; returns the chunks it completes."""
+        self._buf += text
+        chunks = []
+        while self._scanned < len(self._buf):
+            i = self._scanned
+            self._scanned += 1
+            if (cut := self._step(i)) > 0 and (chunk := self._cut(cut)):
+                chunks.append(chunk)
+        return chunks
+
+    def flush(self) -> str:
+        """The rest of the reply, once the LLM is done ("" if nothing is left)."""
+        chunk = self._buf.strip()
+        self._buf = ""
+        self._scanned = 0
+        self._end = self._clause = self._space = -1
+        if chunk:
+            self.chunks += 1
+        return chunk
+
+    def _step(self, i: int) -> int:
+        """Look at character i; returns where to cut the chunk, or 0."""
+        buf = self._buf
+        c = buf[i]
+        prev = buf[i - 1] if i else ""
+
+        if self._end >= 0:
+            if c.isspace():
+                return 0
+            # A pending sentence end, decided by the word after it.
+            end, self._end = self._end, -1
+            if c.isupper() or c in OPENING:
+                return end
+
+        if c.isspace():
+            if prev and not prev.isspace():
+                self._space = i
+                if cut := self._boundary(i):
+                    return cut
+        elif c in SENTENCE_PUNCT or c in CLAUSE_PUNCT or c in CLOSING:
+            return 0
+        if self.max_chars and i + 1 >= self.max_chars:
+            return self._clause if self._clause > 0 else self._space
+        return 0
+
+    def _boundary(self, i: int) -> int:
+        """Whitespace at i: what the punctuation before it means."""
+        buf = self._buf
+        j = i
+        while j and buf[j - 1] in CLOSING:
+            j -= 1
+        k = j
+        while k and buf[k - 1] in SENTENCE_PUNCT:
+            k -= 1
+        if k < j:
+            run = buf[k:j]
+            if "!" in run or "?" in run:
+                return i
+            start = k
+            while start and not buf[start - 1].isspace():
+                start -= 1
+            word = buf[start:k].lstrip(OPENING).lower()
+            if run == "." and word in ABBREVIATIONS:
+                return 0
+            if run != "." or word in FINAL_ABBREVIATIONS or _is_number(word):
+                self._end = i
+                return 0
+            return i if word else 0
+        if buf[j - 1] in CLAUSE_PUNCT or buf[j - 2 : j + 1] == " - ":
+            self._clause = i
+            if self.chunks == 0 and self.first_min_chars and i >= self.first_min_chars:
+                return i
+        return 0
+
+    def _cut(self, cut: int) -> str:
+        """Emit _buf up to cut; the rest starts the next chunk."""
+        chunk = self._buf[:cut].strip()
+        rest = self._buf[cut:]
+        self._buf = rest.lstrip()
+        skipped = len(rest) - len(self._buf)
+        self._scanned = max(0, self._scanned - cut - skipped)
+        shift = cut + skipped
+        self._end = self._end - shift if self._end >= cut else -1
+        self._clause = -1
+        self._space = -1
+        if chunk:
+            self.chunks += 1
+        return chunk
+
+
+def _is_number(word: str) -> bool:
+    return bool(word) and word[0].isdigit()
@@ -9,13 +9,72 @@ const MsgType = {
     VAD_EVENT: 0x06,
     ERROR:     0x07,
     STATUS:    0x08,
+    AUDIO_IN_RAW: 0x09,
+    INTERRUPT: 0x0A,
+    AUDIO_OUT_OPUS: 0x0B,
+    DEBUG:     0x0C,
 };
 
+// Send raw 16 kHz float32 PCM from an AudioWorklet when the browser supports
+// it — the server feeds it straight into VAD with no decoder hop. Otherwise
+// fall back to MediaRecorder WebM/Opus chunks.
+const INPUT_FORMAT = window.AudioWorkletNode ? "pcm_f32le" : "webm";
+const PCM_FRAME_SAMPLES = 1024;  // 64 ms at 16 kHz
+
+// Ask for Opus replies when WebCodecs can decode them: about a tenth of the
+// bytes of raw PCM on the wire.
+const OUTPUT_FORMAT = window.AudioDecoder ? "opus" : "pcm_s16le";
+const OUTPUT_SAMPLE_RATE = 24000;
+const OPUS_FRAME_US = 20000;
+
+// Compact binary status/event/text messages instead of JSON. Code tables match
+// STATUSES and VAD_EVENTS in server/protocol.py.
+const MESSAGE_ENCODING = "binary";
+const STATUSES = ["ready", "listening", "thinking", "speaking", "busy"];
+const VAD_EVENTS = ["speech_start", "speech_end"];
+const textDecoder = new TextDecoder();
+
+// Open the page with ?debug to log each turn's stage timings to the console.
+const DEBUG = new URLSearchParams(location.search).has("debug");
+
+const CAPTURE_WORKLET = `
+class PcmCapture extends AudioWorkletProcessor {
+    constructor() {
+        super();
+        this.buf = new Float32Array(${PCM_FRAME_SAMPLES});
+        this.len = 0;
+    }
+    process(inputs) {
+        const input = inputs[0][0];
+        if (!input) return true;
+        let i = 0;
+        while (i < input.length) {
+            const n = Math.min(input.length - i, this.buf.length - this.len);
+            this.buf.set(input.subarray(i, i + n), this.len);
+            this.len += n;
+            i += n;
+            if (this.len === this.buf.length) {
+                this.port.postMessage(this.buf.slice(0));
+                this.len = 0;
+            }
+        }
+        return true;
+    }
+}
+registerProcessor("pcm-capture", PcmCapture);
+`;
+
 let ws = null;
 let mediaRecorder = null;
+let captureCtx = null;
 let audioStream = null;
 let isRecording = false;
 let audioCtx = null;
+let playbackTime = 0;        // when the last scheduled chunk finishes
+let playingSources = [];
+let opusDecoder = null;
+let opusTimestamp = 0;
+let currentUserEl = null;
 let currentAssistantEl = null;
 let currentAssistantText = "";
 
@@ -36,7 +95,13 @@ function connect() {
         setStatus("ready");
         micBtn.disabled = false;
         // Send handshake
-        const handshake = JSON.stringify({ version: 1 });
+        const handshake = JSON.stringify({
+            version: 1,
+            input_format: INPUT_FORMAT,
+            output_format: OUTPUT_FORMAT,
+            message_encoding: MESSAGE_ENCODING,
+            debug: DEBUG,
+        });
         const buf = new Uint8Array(1 + handshake.length);
         buf[0] = MsgType.HANDSHAKE;
         new TextEncoder().encodeInto(handshake, buf.subarray(1));
@@ -52,20 +117,17 @@ function connect() {
             case MsgType.AUDIO_OUT:
                 playAudio(payload);
                 break;
-            case MsgType.TEXT_ASR:
-                handleASR(JSON.parse(new TextDecoder().decode(payload)));
-                break;
-            case MsgType.TEXT_LLM:
-                handleLLM(JSON.parse(new TextDecoder().decode(payload)));
+            case MsgType.AUDIO_OUT_OPUS:
+                playOpus(payload);
                 break;
-            case MsgType.VAD_EVENT:
-                handleVAD(JSON.parse(new TextDecoder().decode(payload)));
+            case MsgType.ERROR:
+                handleError(JSON.parse(textDecoder.decode(payload)));
                 break;
-            case MsgType.STATUS:
-                handleStatus(JSON.parse(new TextDecoder().decode(payload)));
+            case MsgType.DEBUG:
+                console.debug("Turn trace", JSON.parse(textDecoder.decode(payload)).trace);
                 break;
-            case MsgType.ERROR:
-                handleError(JSON.parse(new TextDecoder().decode(payload)));
+            default:
+                handleText(type, payload);
                 break;
         }
     };
@@ -98,6 +160,38 @@ async function startRecording() {
         return;
     }
 
+    if (INPUT_FORMAT === "pcm_f32le") {
+        await startPcmCapture();
+    } else {
+        startMediaRecorder();
+    }
+    isRecording = true;
+    micBtn.classList.add("active");
+    micLabel.textContent = "Lytter...";
+}
+
+async function startPcmCapture() {
+    // The AudioContext resamples the mic to 16 kHz for us.
+    captureCtx = new AudioContext({ sampleRate: 16000 });
+    const url = URL.createObjectURL(new Blob([CAPTURE_WORKLET], { type: "application/javascript" }));
+    await captureCtx.audioWorklet.addModule(url);
+    URL.revokeObjectURL(url);
+
+    const source = captureCtx.createMediaStreamSource(audioStream);
+    const node = new AudioWorkletNode(captureCtx, "pcm-capture");
+    node.port.onmessage = (e) => {
+        if (ws && ws.readyState === WebSocket.OPEN) {
+            const pcm = new Uint8Array(e.data.buffer);
+            const msg = new Uint8Array(1 + pcm.length);
+            msg[0] = MsgType.AUDIO_IN_RAW;
+            msg.set(pcm, 1);
+            ws.send(msg);
+        }
+    };
+    source.connect(node);
+}
+
+function startMediaRecorder() {
     mediaRecorder = new MediaRecorder(audioStream, {
         mimeType: "audio/webm;codecs=opus",
     });
@@ -116,15 +210,16 @@ async function startRecording() {
 
     // Send chunks every 200ms for responsive VAD
     mediaRecorder.start(200);
-    isRecording = true;
-    micBtn.classList.add("active");
-    micLabel.textContent = "Lytter...";
 }
 
 function stopRecording() {
     if (mediaRecorder && mediaRecorder.state !== "inactive") {
         mediaRecorder.stop();
     }
+    if (captureCtx) {
+        captureCtx.close();
+        captureCtx = null;
+    }
     if (audioStream) {
         audioStream.getTracks().forEach((t) => t.stop());
         audioStream = null;
@@ -137,29 +232,136 @@ function stopRecording() {
 // --- Audio Playback ---
 
 function playAudio(pcmData) {
-    if (!audioCtx) {
-        audioCtx = new AudioContext({ sampleRate: 24000 });
-    }
-
     // PCM s16le → float32
     const int16 = new Int16Array(pcmData.buffer, pcmData.byteOffset, pcmData.byteLength / 2);
     const float32 = new Float32Array(int16.length);
     for (let i = 0; i < int16.length; i++) {
         float32[i] = int16[i] / 32768;
     }
+    schedulePlayback(float32, OUTPUT_SAMPLE_RATE);
+}
 
-    const buffer = audioCtx.createBuffer(1, float32.length, 24000);
+function playOpus(payload) {
+    if (!opusDecoder) {
+        opusDecoder = new AudioDecoder({
+            output: (audioData) => {
+                const float32 = new Float32Array(audioData.numberOfFrames);
+                audioData.copyTo(float32, { planeIndex: 0, format: "f32-planar" });
+                schedulePlayback(float32, audioData.sampleRate);
+                audioData.close();
+            },
+            error: (e) => console.error("Opus decode error:", e),
+        });
+        opusDecoder.configure({
+            codec: "opus",
+            sampleRate: OUTPUT_SAMPLE_RATE,
+            numberOfChannels: 1,
+        });
+    }
+
+    // Packets, each prefixed with its u16le length
+    const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+    let offset = 0;
+    while (offset + 2 <= payload.byteLength) {
+        const length = view.getUint16(offset, true);
+        offset += 2;
+        opusDecoder.decode(new EncodedAudioChunk({
+            type: "key",
+            timestamp: opusTimestamp,
+            duration: OPUS_FRAME_US,
+            data: payload.subarray(offset, offset + length),
+        }));
+        opusTimestamp += OPUS_FRAME_US;
+        offset += length;
+    }
+}
+
+function schedulePlayback(float32, sampleRate) {
+    if (!audioCtx) {
+        audioCtx = new AudioContext({ sampleRate: OUTPUT_SAMPLE_RATE });
+    }
+
+    const buffer = audioCtx.createBuffer(1, float32.length, sampleRate);
     buffer.getChannelData(0).set(float32);
     const source = audioCtx.createBufferSource();
     source.buffer = buffer;
     source.connect(audioCtx.destination);
-    source.start();
+
+    // Queue chunks back to back rather than playing them over each other
+    playbackTime = Math.max(playbackTime, audioCtx.currentTime);
+    source.start(playbackTime);
+    playbackTime += buffer.duration;
+
+    playingSources.push(source);
+    source.onended = () => {
+        playingSources = playingSources.filter((s) => s !== source);
+    };
+}
+
+function flushPlayback() {
+    for (const source of playingSources) {
+        source.stop();
+    }
+    playingSources = [];
+    playbackTime = 0;
+    // Drop packets still being decoded; the next reply starts a fresh decoder.
+    if (opusDecoder) {
+        opusDecoder.close();
+        opusDecoder = null;
+    }
 }
 
 // --- Message Handlers ---
 
+function handleText(type, payload) {
+    // The first "ready" is sent before the handshake is applied, so JSON can
+    // arrive even with binary encoding negotiated; it always starts with "{".
+    const json = payload[0] === 0x7b && type !== MsgType.INTERRUPT;
+    if (MESSAGE_ENCODING !== "binary" || json) {
+        return dispatchText(type, JSON.parse(textDecoder.decode(payload)));
+    }
+    const flag = payload[0] === 1;
+    const text = textDecoder.decode(payload.subarray(1));
+    switch (type) {
+        case MsgType.TEXT_ASR:
+            return dispatchText(type, { text, final: flag });
+        case MsgType.TEXT_LLM:
+            return dispatchText(type, { text, done: flag });
+        case MsgType.VAD_EVENT:
+            return dispatchText(type, { event: VAD_EVENTS[payload[0]] });
+        case MsgType.STATUS:
+            return dispatchText(type, { status: STATUSES[payload[0]] });
+        case MsgType.INTERRUPT:
+            return dispatchText(type, { spoken: textDecoder.decode(payload) });
+    }
+}
+
+function dispatchText(type, data) {
+    switch (type) {
+        case MsgType.TEXT_ASR:
+            return handleASR(data);
+        case MsgType.TEXT_LLM:
+            return handleLLM(data);
+        case MsgType.VAD_EVENT:
+            return handleVAD(data);
+        case MsgType.STATUS:
+            return handleStatus(data);
+        case MsgType.INTERRUPT:
+            return handleInterrupt(data);
+    }
+}
+
 function handleASR(data) {
-    addMessage("user", data.text);
+    // Partials update one provisional bubble until the final transcript lands.
+    if (!currentUserEl) {
+        currentUserEl = addMessage("user", data.text);
+    } else {
+        currentUserEl.querySelector(".content").textContent = data.text;
+    }
+    currentUserEl.classList.toggle("partial", data.final === false);
+    if (data.final === false) return;
+
+    currentUserEl = null;
     // Prepare for assistant response
     currentAssistantText = "";
     currentAssistantEl = null;
@@ -190,10 +392,20 @@ function handleStatus(data) {
         listening: "Lytter...",
         thinking: "Tenker...",
         speaking: "Snakker...",
+        busy: "Opptatt — prøv igjen om litt",
     };
     setStatus(labels[data.status] || data.status, data.status);
 }
 
+function handleInterrupt(data) {
+    // The user talked over Wybe: drop queued audio, show only what was heard
+    flushPlayback();
+    if (currentAssistantEl) {
+        currentAssistantEl.querySelector(".content").textContent = data.spoken;
+    }
+    currentAssistantText = data.spoken;
+}
+
 function handleError(data) {
     setStatus("Feil: " + data.error, "error");
 }